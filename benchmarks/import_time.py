@@ -0,0 +1,64 @@
+"""Benchmarks the time taken to import xpersist and create a CacheStore.
+
+Each measurement runs in a fresh interpreter. Heavy libraries (xarray, pandas, prefect, ...)
+must only be imported once a serializer that needs them is resolved, so a short-lived
+worker using joblib artifacts does not pay for them.
+
+Usage::
+
+    python benchmarks/import_time.py [--repeat 5] [--max-seconds 0.5]
+
+Exits with a non-zero status if the median time exceeds ``--max-seconds``.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+HEAVY_MODULES = ['xarray', 'pandas', 'xcollection', 'zarr', 'prefect', 'pendulum', 'slugify']
+
+_SCRIPT = """
+import json, sys, tempfile, time
+start = time.perf_counter()
+import xpersist
+imported = time.perf_counter()
+store = xpersist.CacheStore(tempfile.mkdtemp())
+created = time.perf_counter()
+print(json.dumps({
+    'import': imported - start,
+    'cache_store': created - imported,
+    'heavy_modules': [name for name in %r if name in sys.modules],
+}))
+"""
+
+
+def measure() -> dict:
+    """Returns the import and CacheStore creation times of a fresh interpreter, in seconds."""
+    output = subprocess.run(
+        [sys.executable, '-c', _SCRIPT % HEAVY_MODULES],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=0.5)
+    args = parser.parse_args()
+
+    runs = [measure() for _ in range(args.repeat)]
+    import_time = statistics.median(run['import'] for run in runs)
+    total_time = statistics.median(run['import'] + run['cache_store'] for run in runs)
+    print(f'import xpersist            {import_time * 1e3:8.1f} ms')
+    print(f'import + CacheStore(...)   {total_time * 1e3:8.1f} ms')
+    print(f'heavy modules imported     {runs[0]["heavy_modules"] or "none"}')
+    if total_time > args.max_seconds or runs[0]['heavy_modules']:
+        sys.exit(f'Regression: expected less than {args.max_seconds}s and no heavy modules')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmarks the per-call overhead of the cache store on small values.
+
+For values small enough that (de)serializing them is nearly free, reports the time per
+call of resolving a serializer, picking one for a value, and putting and getting the value,
+so that regressions of the bookkeeping around serializers show up.
+
+Usage::
+
+    python benchmarks/overhead.py [--number 1000]
+"""
+import argparse
+import tempfile
+import timeit
+
+from xpersist.cache import CacheStore
+from xpersist.registry import registry
+from xpersist.serializers import get_serializer, pick_serializer
+
+
+def measure(number: int = 1000) -> dict:
+    """Returns the median time per call of each operation, in microseconds."""
+    value = {'foo': [1, 2, 3]}
+    store = CacheStore(tempfile.mkdtemp())
+    store.put('key', value)
+    counter = iter(range(10**9))
+    operations = {
+        'registry lookup': lambda: registry.serializers.get('joblib')(),
+        'get_serializer': lambda: get_serializer('joblib'),
+        'pick_serializer': lambda: pick_serializer(value),
+        'get_artifact': lambda: store.get_artifact('key'),
+        'get': lambda: store.get('key'),
+        'put': lambda: store.put(f'key-{next(counter)}', value),
+    }
+    results = {}
+    for name, operation in operations.items():
+        times = timeit.repeat(operation, number=number, repeat=5)
+        results[name] = sorted(times)[len(times) // 2] / number * 1e6
+    return results
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=1000, help='calls per measurement')
+    args = parser.parse_args(argv)
+    for name, microseconds in measure(args.number).items():
+        print(f'{name:<16} {microseconds:10.1f} µs/call')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Benchmarks the built-in serializers used by the 'auto' serializer policy.
+
+For DataFrames and Datasets of increasing size, reports the time to dump the value,
+the time to load it back (including reading all the data), the time to read a small
+slice of it (the first row or time step), and the size of the artifact.
+These numbers justify the defaults of :py:class:`xpersist.serializers.SerializerPolicy`.
+
+Usage::
+
+    python benchmarks/serializers.py
+"""
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from xpersist.registry import registry
+
+
+def _disk_usage(path: str) -> int:
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path)
+        for name in names
+    )
+
+
+def _materialize(value):
+    if isinstance(value, xr.Dataset):
+        return value.load()
+    return value
+
+
+def _first(value):
+    if isinstance(value, xr.Dataset):
+        return value.isel(time=0).load()
+    return value.iloc[0]
+
+
+def _run(serializer_name: str, value, directory: str, repeat: int = 3):
+    serializer = registry.serializers.get(serializer_name)()
+    dump_times, load_times, slice_times = [], [], []
+    for index in range(repeat):
+        path = os.path.join(directory, f'{serializer_name}-{index}')
+        start = time.perf_counter()
+        serializer.dump(value, path)
+        dump_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _materialize(serializer.load(path))
+        load_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        _first(serializer.load(path))
+        slice_times.append(time.perf_counter() - start)
+    return min(dump_times), min(load_times), min(slice_times), _disk_usage(path)
+
+
+def _dataframe(nrows: int) -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    return pd.DataFrame(
+        {
+            'float': rng.random(nrows),
+            'int': rng.integers(0, 1000, nrows),
+            'category': rng.choice(['foo', 'bar', 'baz'], nrows),
+            'time': pd.date_range('2000-01-01', periods=nrows, freq='s'),
+        }
+    )
+
+
+def _dataset(nbytes: int) -> xr.Dataset:
+    # A smooth float32 field with some noise, similar to gridded model output
+    ntime = max(1, nbytes // (4 * 180 * 360))
+    lat, lon = np.meshgrid(np.linspace(-90, 90, 180), np.linspace(0, 360, 360), indexing='ij')
+    field = 280 + 30 * np.cos(np.deg2rad(lat)) + 5 * np.sin(np.deg2rad(lon))
+    noise = np.random.default_rng(0).normal(scale=0.5, size=(ntime, 180, 360))
+    return xr.Dataset(
+        {'tas': (('time', 'lat', 'lon'), (field + noise).astype('float32'))},
+        coords={'time': pd.date_range('2000-01-01', periods=ntime)},
+    )
+
+
+def _report(title: str, value, serializer_names) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        for name in serializer_names:
+            dump, load, first, size = _run(name, value, directory)
+            print(
+                f'{title:>28} {name:>16}  dump {dump * 1e3:8.1f} ms  load {load * 1e3:8.1f} ms'
+                f'  slice {first * 1e3:8.1f} ms  size {size / 2**20:8.2f} MiB'
+            )
+
+
+def main() -> None:
+    for nrows in [1_000, 100_000, 1_000_000]:
+        _report(
+            f'DataFrame({nrows:,} rows)',
+            _dataframe(nrows),
+            ['pandas.csv', 'pandas.parquet', 'joblib'],
+        )
+    for nbytes in [2**20, 16 * 2**20, 64 * 2**20, 256 * 2**20]:
+        ds = _dataset(nbytes)
+        _report(f'Dataset({ds.nbytes / 2**20:.0f} MiB)', ds, ['xarray.netcdf', 'xarray.zarr'])
+        _report(
+            f'Dataset({ds.nbytes / 2**20:.0f} MiB, dask)',
+            ds.chunk({'time': max(1, ds.sizes['time'] // 8)}),
+            ['xarray.netcdf', 'xarray.zarr'],
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+import asyncio
+import collections
+import io
+
+import fsspec
+import pytest
+import xarray as xr
+from fsspec.asyn import AsyncFileSystem
+
+from xpersist import CacheStore
+from xpersist.aio import AsyncCacheStore
+
+
+class DictFileSystem(AsyncFileSystem):
+    """An asynchronous file-system keeping files in a dict, which counts its async calls."""
+
+    protocol = 'asyncdict'
+    root_marker = ''
+    store = {}
+    dirs = set()
+    calls = collections.Counter()
+
+    def _count(self, name):
+        # The blocking methods run the coroutines too, from another thread
+        if self.asynchronous:
+            self.calls[name] += 1
+
+    async def _info(self, path, **kwargs):
+        path = self._strip_protocol(path)
+        if path in self.store:
+            return {'name': path, 'size': len(self.store[path]), 'type': 'file'}
+        if path in self.dirs or any(name.startswith(f'{path}/') for name in self.store):
+            return {'name': path, 'size': 0, 'type': 'directory'}
+        raise FileNotFoundError(path)
+
+    async def _ls(self, path, detail=True, **kwargs):
+        path = self._strip_protocol(path)
+        names = {
+            f'{path}/{name[len(path) + 1 :].split("/")[0]}'
+            for name in list(self.store) + list(self.dirs)
+            if name.startswith(f'{path}/')
+        }
+        if not names and path not in self.dirs:
+            raise FileNotFoundError(path)
+        infos = [await self._info(name) for name in sorted(names)]
+        return infos if detail else [info['name'] for info in infos]
+
+    async def _find(self, path, **kwargs):
+        self._count('_find')
+        return await super()._find(path, **kwargs)
+
+    async def _cat_file(self, path, start=None, end=None, **kwargs):
+        self._count('_cat_file')
+        path = self._strip_protocol(path)
+        if path not in self.store:
+            raise FileNotFoundError(path)
+        return self.store[path][start:end]
+
+    async def _pipe_file(self, path, value, **kwargs):
+        self._count('_pipe_file')
+        self.store[self._strip_protocol(path)] = bytes(value)
+
+    async def _rm_file(self, path, **kwargs):
+        path = self._strip_protocol(path)
+        self.store.pop(path, None)
+        self.dirs.discard(path)
+
+    async def _cp_file(self, path1, path2, **kwargs):
+        self.store[self._strip_protocol(path2)] = self.store[self._strip_protocol(path1)]
+
+    async def _makedirs(self, path, exist_ok=False):
+        self.dirs.add(self._strip_protocol(path))
+
+    def _open(self, path, mode='rb', **kwargs):
+        path = self._strip_protocol(path)
+        if 'r' in mode:
+            if path not in self.store:
+                raise FileNotFoundError(path)
+            return io.BytesIO(self.store[path])
+        fs = self
+
+        class File(io.BytesIO):
+            def close(self):
+                fs.store[path] = self.getvalue()
+                super().close()
+
+        return File()
+
+
+@pytest.fixture
+def async_fs():
+    fsspec.register_implementation('asyncdict', DictFileSystem, clobber=True)
+    DictFileSystem.store.clear()
+    DictFileSystem.dirs.clear()
+    DictFileSystem.calls.clear()
+    return DictFileSystem
+
+
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_async_cache_store(tmp_path, metadata_store):
+    store = AsyncCacheStore(CacheStore(str(tmp_path), metadata_store=metadata_store))
+    data = xr.DataArray([1, 2]).to_dataset(name='sst')
+
+    async def main():
+        await asyncio.gather(
+            store.aput('foo', [1, 2, 3]),
+            store.aput('test.zarr', data, serializer='xarray.zarr'),
+        )
+        assert await store.acontains('foo')
+        assert not await store.acontains('bar')
+        assert sorted(await store.akeys()) == ['foo', 'test.zarr']
+        assert (await store.aget_artifact('foo')).serializer == 'joblib'
+        values = await store.aget_many(['foo', 'test.zarr'])
+        assert values['foo'] == [1, 2, 3]
+        xr.testing.assert_equal(values['test.zarr'], data)
+        await store.adelete('foo')
+        with pytest.raises(KeyError):
+            await store.aget('foo')
+
+    asyncio.run(main())
+
+
+def test_async_on_duplicate_key(tmp_path):
+    store = AsyncCacheStore(CacheStore(str(tmp_path), on_duplicate_key='raise_error'))
+
+    async def main():
+        await store.aput('foo', 'my_data')
+        with pytest.raises(ValueError):
+            await store.aput('foo', 'hello')
+        assert await store.aget('foo') == 'my_data'
+
+    asyncio.run(main())
+
+
+def test_async_stale_record(tmp_path):
+    first = CacheStore(str(tmp_path), metadata_store='log', on_duplicate_key='overwrite')
+    second = AsyncCacheStore(CacheStore(str(tmp_path), metadata_store='log'))
+    first.put('foo', [1])
+
+    async def main():
+        assert await second.aget('foo') == [1]
+        # The record cached by the second store no longer matches the data on disk
+        first.put('foo', {'a': 2}, serializer='msgpack')
+        assert await second.aget('foo') == {'a': 2}
+
+    asyncio.run(main())
+
+
+def test_async_put_with_locking(tmp_path):
+    store = AsyncCacheStore(CacheStore(str(tmp_path), locking='file'))
+
+    async def main():
+        with store.store.lock('foo'):
+            task = asyncio.ensure_future(store.aput('foo', [1, 2, 3]))
+            await asyncio.sleep(0.2)
+            # The put waits for the lock of the key
+            assert not task.done()
+            assert not await store.acontains('foo')
+        await task
+        assert await store.aget('foo') == [1, 2, 3]
+        await store.aput('foo', [4, 5, 6])
+        assert await store.aget('foo') == [1, 2, 3]
+
+    asyncio.run(main())
+
+
+def test_async_file_system(async_fs):
+    # Packed artifacts are written with `pipe_file`, as joblib only dumps to local paths
+    store = AsyncCacheStore(CacheStore('asyncdict://store', packed_max_bytes=2**10))
+
+    async def main():
+        await asyncio.gather(
+            store.aput('foo', [1, 2, 3], serializer='joblib'),
+            store.aput('bar', 'baz'),
+        )
+        # The records are read and written on the async file-system
+        assert async_fs.calls == {'_cat_file': 2, '_pipe_file': 2}
+        async_fs.calls.clear()
+        assert await store.acontains('foo')
+        assert not await store.acontains('qux')
+        assert async_fs.calls == {'_cat_file': 2}
+        assert sorted(await store.akeys()) == ['bar', 'foo']
+        assert async_fs.calls['_find'] == 1
+        assert await store.aget_many(['foo', 'bar']) == {'foo': [1, 2, 3], 'bar': 'baz'}
+        await store.adelete('foo')
+        assert await store.akeys() == ['bar']
+
+    asyncio.run(main())
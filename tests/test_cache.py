@@ -1,10 +1,22 @@
+import collections
+import concurrent.futures
+import datetime
+import functools
+import os
+import threading
+import time
+import typing
+
 import fsspec
+import numpy as np
 import pandas as pd
+import pydantic
 import pytest
 import xarray as xr
+from fsspec.implementations.memory import MemoryFileSystem
 
 from xpersist import CacheStore
-from xpersist.cache import Artifact
+from xpersist.cache import Artifact, _validate_arguments
 
 
 @pytest.mark.parametrize('readonly', [True, False])
@@ -42,10 +54,12 @@ def test_on_duplicate_key(tmp_path, on_duplicate_key):
         ('test.nc', xr.DataArray([1, 2]).to_dataset(name='sst'), 'xarray.netcdf'),
         ('my_dataset.zarr', xr.DataArray([1, 2]).to_dataset(name='sst'), 'xarray.zarr'),
         ('foo.parquet', pd.DataFrame({'foo': [1, 2]}), 'pandas.parquet'),
+        ('mmap', xr.DataArray([1, 2]).to_dataset(name='sst'), 'xarray.mmap'),
     ],
 )
-def test_put_and_get(tmp_path, key, data, serializer):
-    store = CacheStore(str(tmp_path))
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_put_and_get(tmp_path, key, data, serializer, metadata_store):
+    store = CacheStore(str(tmp_path), metadata_store=metadata_store)
     store.put(key=key, value=data, serializer=serializer)
     assert key in store.keys()
     assert isinstance(store.get_artifact(key), Artifact)
@@ -68,8 +82,9 @@ def test_put_and_get(tmp_path, key, data, serializer):
         ('foo.parquet', pd.DataFrame({'foo': [1, 2]}), 'pandas.parquet'),
     ],
 )
-def test_delete(tmp_path, key, data, serializer):
-    store = CacheStore(str(tmp_path))
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_delete(tmp_path, key, data, serializer, metadata_store):
+    store = CacheStore(str(tmp_path), metadata_store=metadata_store)
     store.put(key=key, value=data, serializer=serializer)
     assert key in store.keys()
     store.delete(key=key, dry_run=True)
@@ -81,3 +96,880 @@ def test_delete_error(tmp_path):
     store = CacheStore(str(tmp_path))
     with pytest.raises(KeyError):
         store.delete(key='foo', dry_run=False)
+
+
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_search(tmp_path, metadata_store):
+    store = CacheStore(str(tmp_path), metadata_store=metadata_store)
+    store.put('foo', [1, 2], additional_metadata={'task_name': 'foo', 'flow_run_id': 'abc'})
+    store.put('bar', [3, 4], additional_metadata={'task_name': 'bar', 'flow_run_id': 'abc'})
+    store.put('baz', pd.DataFrame({'foo': [1, 2]}), serializer='pandas.parquet')
+    assert sorted(store.search(flow_run_id='abc')) == ['bar', 'foo']
+    assert store.search(task_name='foo', flow_run_id='abc') == ['foo']
+    assert sorted(store.search(serializer='joblib')) == ['bar', 'foo']
+    assert store.search(serializer=['pandas.parquet']) == ['baz']
+    created_at = store.get_artifact('foo').created_at
+    assert 'foo' in store.search(created_after=created_at)
+    assert store.search(created_before=created_at.isoformat(), task_name='foo') == []
+
+
+def test_memory_cache(tmp_path):
+    store = CacheStore(str(tmp_path), memory_cache_bytes=10_000, on_duplicate_key='overwrite')
+    store.put('foo', [1, 2, 3])
+    first = store.get('foo')
+    assert store.get('foo') is first
+    assert 'foo' in store.memory_cache
+
+    store.put('foo', [4, 5, 6])
+    assert 'foo' not in store.memory_cache
+    assert store.get('foo') == [4, 5, 6]
+
+    del store['foo']
+    assert 'foo' not in store.memory_cache
+    with pytest.raises(KeyError):
+        store.get('foo')
+
+
+@pytest.mark.parametrize(
+    'key, data, serializer',
+    [
+        ('foo', [1, 2, 3], 'joblib'),
+        ('test.zarr', xr.DataArray([1, 2]).to_dataset(name='sst'), 'xarray.zarr'),
+    ],
+)
+def test_local_cache(tmp_path, key, data, serializer):
+    store = CacheStore(
+        str(tmp_path / 'remote'),
+        local_cache_dir=str(tmp_path / 'local'),
+        on_duplicate_key='overwrite',
+    )
+    store.put(key, data, serializer=serializer)
+    assert store._load_path(store.get_artifact(key)).startswith(str(tmp_path / 'local'))
+    if isinstance(data, xr.Dataset):
+        xr.testing.assert_equal(store.get(key), data)
+    else:
+        assert store.get(key) == data
+        store.put(key, [4, 5, 6])
+        assert store.get(key) == [4, 5, 6]
+
+    del store[key]
+    assert os.listdir(tmp_path / 'local') == []
+
+
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_batch_operations(tmp_path, metadata_store):
+    store = CacheStore(str(tmp_path), metadata_store=metadata_store, max_workers=4)
+    mapping = {f'key-{index}': list(range(index)) for index in range(10)}
+    store.put_many(mapping)
+    assert sorted(store.keys()) == sorted(mapping)
+    assert store.contains_many(['key-0', 'missing']) == {'key-0': True, 'missing': False}
+    assert store.get_many(['key-3', 'key-5']) == {'key-3': [0, 1, 2], 'key-5': [0, 1, 2, 3, 4]}
+    with pytest.raises(KeyError):
+        store.get_many(['key-3', 'missing'])
+
+    store.delete_many(['key-0', 'key-1'], dry_run=False)
+    assert sorted(store.keys()) == sorted(mapping)[2:]
+    with pytest.raises(KeyError):
+        store.delete_many(['key-0'], dry_run=False)
+
+
+@pytest.mark.parametrize('on_duplicate_key', ['raise_error', 'overwrite', 'skip'])
+def test_put_many_on_duplicate_key(tmp_path, on_duplicate_key):
+    store = CacheStore(str(tmp_path), on_duplicate_key=on_duplicate_key)
+    store.put('foo', 'my_data')
+    if on_duplicate_key == 'raise_error':
+        with pytest.raises(ValueError):
+            store.put_many({'foo': 'hello', 'bar': 'world'})
+        assert 'bar' not in store
+        return
+    store.put_many({'foo': 'hello', 'bar': 'world'})
+    assert store.get_many(['foo', 'bar']) == {
+        'foo': 'hello' if on_duplicate_key == 'overwrite' else 'my_data',
+        'bar': 'world',
+    }
+
+
+@pytest.mark.parametrize(
+    'value, serializer, compression',
+    [
+        (list(range(1000)), 'joblib', 'gzip:6'),
+        (pd.DataFrame({'foo': range(1000)}), 'pandas.csv', 'gzip'),
+        (pd.DataFrame({'foo': range(1000)}), 'pandas.parquet', 'zstd:3'),
+        (
+            xr.DataArray(np.tile(np.arange(10.0), 1000)).to_dataset(name='foo'),
+            'xarray.netcdf',
+            'gzip',
+        ),
+        (
+            xr.DataArray(np.tile(np.arange(10.0), 1000)).to_dataset(name='foo'),
+            'xarray.zarr',
+            'zstd:9',
+        ),
+    ],
+)
+def test_compression(tmp_path, value, serializer, compression):
+    store = CacheStore(str(tmp_path))
+    store.put('uncompressed', value, serializer=serializer)
+    store.put('compressed', value, serializer=serializer, compression=compression)
+    assert store.get_artifact('compressed').compression.codec == compression.split(':')[0]
+    assert store.get_artifact('uncompressed').compression is None
+    assert store.mapper.fs.du(store._construct_item_path('compressed')) < store.mapper.fs.du(
+        store._construct_item_path('uncompressed')
+    )
+    loaded = store.get('compressed')
+    if isinstance(value, xr.Dataset):
+        xr.testing.assert_identical(loaded, value)
+    elif isinstance(value, pd.DataFrame):
+        pd.testing.assert_series_equal(loaded['foo'], value['foo'])
+    else:
+        assert loaded == value
+
+
+def test_compression_default(tmp_path):
+    store = CacheStore(str(tmp_path), compression={'codec': 'zstd', 'level': 1})
+    store.put('df', pd.DataFrame({'foo': [1, 2]}))
+    store.put('list', [1, 2])
+    store.put('none', pd.DataFrame({'foo': [1, 2]}), compression='none')
+    assert store.get_artifact('df').compression.level == 1
+    # joblib does not support zstd: the default falls back to no compression
+    assert store.get_artifact('list').compression is None
+    assert store.get_artifact('none').compression is None
+    with pytest.raises(ValueError):
+        store.put('error', [1, 2], compression='zstd')
+
+
+@pytest.mark.parametrize('serializer', ['xarray.netcdf', 'xarray.zarr'])
+def test_dask_chunks(tmp_path, serializer):
+    ds = xr.DataArray(np.arange(100.0).reshape(10, 10), dims=('x', 'y')).to_dataset(name='foo')
+    chunked = ds.chunk({'x': 4, 'y': 5})
+    store = CacheStore(str(tmp_path))
+    store.put('chunked', chunked, serializer=serializer)
+    store.put('in-memory', ds, serializer=serializer)
+    assert store.get_artifact('chunked').chunks == {'x': (4, 4, 2), 'y': (5, 5)}
+    assert store.get_artifact('in-memory').chunks is None
+    loaded = store.get('chunked')
+    assert loaded.chunks == chunked.chunks
+    xr.testing.assert_identical(loaded.compute(), ds)
+    assert store.get('chunked', load_kwargs={'chunks': {'x': 10}}).chunks['x'] == (10,)
+
+
+@pytest.mark.parametrize('serializer', ['xarray.netcdf', 'xarray.zarr', 'xarray.mmap'])
+def test_get_dataset_subset(tmp_path, serializer):
+    ds = xr.Dataset(
+        {'foo': ('time', np.arange(10.0)), 'bar': ('time', np.arange(10))},
+        coords={'time': pd.date_range('2000-01-01', periods=10)},
+    )
+    store = CacheStore(str(tmp_path))
+    store.put('ds', ds, serializer=serializer)
+    subset = store.get('ds', variables=['foo'], sel={'time': slice('2000-01-03', '2000-01-05')})
+    xr.testing.assert_identical(
+        subset.load(), ds[['foo']].sel(time=slice('2000-01-03', '2000-01-05'))
+    )
+    with pytest.raises(ValueError, match='does not support selecting'):
+        store.get('ds', columns=['foo'])
+
+
+@pytest.mark.parametrize('serializer', ['pandas.parquet', 'pandas.csv'])
+def test_get_dataframe_subset(tmp_path, serializer):
+    df = pd.DataFrame({'foo': range(10), 'bar': range(10, 20), 'baz': list('abcdefghij')})
+    store = CacheStore(str(tmp_path))
+    store.put('df', df, serializer=serializer)
+    assert list(store.get('df', columns=['foo', 'baz']).columns) == ['foo', 'baz']
+    if serializer == 'pandas.parquet':
+        subset = store.get('df', columns=['foo'], filters=[('bar', '>=', 17)])
+        assert subset['foo'].tolist() == [7, 8, 9]
+    else:
+        with pytest.raises(ValueError, match='does not support selecting'):
+            store.get('df', filters=[('bar', '>=', 17)])
+
+
+def test_get_subset_unsupported(tmp_path):
+    store = CacheStore(str(tmp_path), memory_cache_bytes=2**20)
+    store.put('foo', {'foo': 1})
+    assert store.get('foo') == {'foo': 1}
+    with pytest.raises(ValueError, match='does not support partial reads'):
+        store.get('foo', variables=['foo'])
+
+
+@pytest.mark.parametrize('content_addressed', [False, True])
+def test_append_dataset(tmp_path, content_addressed):
+    ds = xr.Dataset(
+        {'foo': ('time', np.arange(10.0))}, coords={'time': pd.date_range('2000', periods=10)}
+    )
+    store = CacheStore(str(tmp_path), content_addressed=content_addressed)
+    store.append('ds', ds.isel(time=slice(0, 4)).chunk({'time': 2}), dim='time')
+    store.append('ds', ds.isel(time=slice(4, 8)), dim='time')
+    store.append('ds', ds.isel(time=slice(8, 10)).chunk({'time': 1}), dim='time')
+    artifact = store.get_artifact('ds')
+    assert artifact.serializer == 'xarray.zarr'
+    assert artifact.updated_at >= artifact.created_at
+    assert artifact.blob is None
+    assert artifact.chunks == {'time': (2, 2, 4, 1, 1)}
+    xr.testing.assert_identical(store.get('ds').compute(), ds)
+    if content_addressed:
+        assert not store.mapper.fs.ls(store._blob_store_path)
+    with pytest.raises(ValueError, match='dimension'):
+        store.append('ds', ds)
+
+
+def test_append_dataframe(tmp_path):
+    df = pd.DataFrame({'foo': range(6)}, index=pd.date_range('2000', periods=6))
+    store = CacheStore(str(tmp_path), compression='zstd')
+    store.put('df', df.iloc[:2])
+    store.append('df', df.iloc[2:4])
+    store.append('df', df.iloc[4:])
+    pd.testing.assert_frame_equal(store.get('df'), df, check_freq=False)
+    assert store.get('df', filters=[('foo', '>=', 3)])['foo'].tolist() == [3, 4, 5]
+
+    store.put('list', [1, 2])
+    with pytest.raises(ValueError, match='does not support appends'):
+        store.append('list', [3])
+
+
+def test_parquet_requires_pyarrow(tmp_path, monkeypatch):
+    import xpersist.backends.pandas
+
+    monkeypatch.setattr(xpersist.backends.pandas, 'has_pyarrow', lambda: False)
+    df = pd.DataFrame({'foo': range(6)})
+    store = CacheStore(str(tmp_path))
+    with pytest.raises(ImportError, match='Streaming writes .* require pyarrow'):
+        store.put_stream('stream', iter([df]))
+    with pytest.raises(ImportError, match='Compression levels .* require pyarrow'):
+        store.put('compressed', df, serializer='pandas.parquet', compression='zstd:3')
+    store.put('df', df, serializer='pandas.parquet')
+    with pytest.raises(ImportError, match='Row filters .* require pyarrow'):
+        store.get('df', filters=[('foo', '>=', 3)])
+    with pytest.raises(ImportError, match='Streaming reads .* require pyarrow'):
+        list(store.iter('df'))
+
+
+@pytest.mark.parametrize('content_addressed', [False, True])
+def test_stream_dataframes(tmp_path, content_addressed):
+    df = pd.DataFrame({'foo': range(100)}, index=pd.date_range('2000', periods=100))
+    store = CacheStore(str(tmp_path), content_addressed=content_addressed)
+    store.put_stream('df', (df.iloc[i : i + 30] for i in range(0, 100, 30)), compression='zstd')
+    artifact = store.get_artifact('df')
+    assert artifact.serializer == 'pandas.parquet'
+    # The size of the first batch is not the size of the stream
+    assert artifact.nbytes_in_memory is None
+    pd.testing.assert_frame_equal(store.get('df'), df, check_freq=False)
+    batches = list(store.iter('df', batch_size=20))
+    assert max(len(batch) for batch in batches) <= 20
+    pd.testing.assert_frame_equal(pd.concat(batches), df, check_freq=False)
+
+
+def test_stream_datasets(tmp_path):
+    ds = xr.Dataset(
+        {'foo': ('time', np.arange(10.0))}, coords={'time': pd.date_range('2000', periods=10)}
+    )
+    store = CacheStore(str(tmp_path))
+    store.put_stream('ds', (ds.isel(time=slice(i, i + 3)) for i in range(0, 10, 3)), dim='time')
+    xr.testing.assert_identical(store.get('ds').compute(), ds)
+    batches = list(store.iter('ds', dim='time', batch_size=4))
+    assert [batch.sizes['time'] for batch in batches] == [4, 4, 2]
+    xr.testing.assert_identical(xr.concat(batches, dim='time'), ds)
+    with pytest.raises(ValueError):
+        store.put_stream('error', iter([ds]))
+
+
+def test_stream_records(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put_stream('records', ({'index': i} for i in range(10)), batch_size=4)
+    assert store.get_artifact('records').serializer == 'joblib.frames'
+    assert store.get('records') == [{'index': i} for i in range(10)]
+    assert [len(batch) for batch in store.iter('records')] == [4, 4, 2]
+    assert [len(batch) for batch in store.iter('records', batch_size=3)] == [3, 3, 3, 1]
+    with pytest.raises(ValueError):
+        store.put_stream('empty', [])
+    store.put('list', [1, 2])
+    with pytest.raises(ValueError, match='does not support iteration'):
+        store.iter('list')
+
+
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_content_addressed(tmp_path, metadata_store):
+    store = CacheStore(
+        str(tmp_path),
+        metadata_store=metadata_store,
+        content_addressed=True,
+        on_duplicate_key='overwrite',
+    )
+    data = xr.DataArray([1, 2]).to_dataset(name='sst')
+    store.put('first.zarr', data, serializer='xarray.zarr')
+    store.put('second.zarr', data, serializer='xarray.zarr')
+    store.put_many({'foo': [1, 2, 3], 'bar': [1, 2, 3]})
+    blobs_dir = tmp_path / 'xpersist_blobs'
+    assert len(os.listdir(blobs_dir)) == 2
+    assert store.get_artifact('first.zarr').blob == store.get_artifact('second.zarr').blob
+    assert not (tmp_path / 'first.zarr').exists()
+    xr.testing.assert_equal(store.get('second.zarr'), data)
+    assert store.get('foo') == [1, 2, 3]
+
+    del store['first.zarr']
+    xr.testing.assert_equal(store.get('second.zarr'), data)
+    del store['second.zarr']
+    assert len(os.listdir(blobs_dir)) == 1
+
+    store.put('foo', [4, 5, 6])
+    assert len(os.listdir(blobs_dir)) == 2
+    store.put('bar', [4, 5, 6])
+    assert len(os.listdir(blobs_dir)) == 1
+    assert not list((tmp_path / 'xpersist_staging').iterdir())
+    assert store.get_many(['foo', 'bar']) == {'foo': [4, 5, 6], 'bar': [4, 5, 6]}
+
+
+def test_content_addressed_concurrent_delete(tmp_path, monkeypatch):
+    store = CacheStore(str(tmp_path), content_addressed=True)
+    store.put('foo', [1, 2, 3])
+    put = store.metadata.put
+
+    def delete_then_put(key, record):
+        # Another writer deletes the only other key referring to the reused blob
+        if key == 'bar':
+            store.delete('foo', dry_run=False)
+        put(key, record)
+
+    monkeypatch.setattr(store.metadata, 'put', delete_then_put)
+    store.put('bar', [1, 2, 3])
+    assert 'foo' not in store
+    assert store.get('bar') == [1, 2, 3]
+
+
+def test_content_addressed_reused_blob(tmp_path):
+    store = CacheStore(str(tmp_path), content_addressed=True)
+    store.put('foo', [1, 2, 3])
+    blob_path = tmp_path / 'xpersist_blobs' / store.get_artifact('foo').blob
+    # An interrupted delete leaves the blob behind
+    store.metadata.delete('foo')
+    os.utime(blob_path, (0, 0))
+    assert store.fsck()['blobs'] == [str(blob_path)]
+
+    # Reusing the blob makes it young again, so that `fsck` leaves it to the new key
+    store.put('bar', [1, 2, 3])
+    assert store.get_artifact('bar').blob == blob_path.name
+    assert blob_path.stat().st_mtime > 0
+    assert store.fsck()['blobs'] == []
+    assert store.get('bar') == [1, 2, 3]
+
+
+def test_memoize(tmp_path):
+    store = CacheStore(str(tmp_path))
+    calls = []
+
+    @store.memoize
+    def add(a, b=1):
+        calls.append((a, b))
+        return a + b
+
+    assert add(1) == 2
+    assert add(1, b=1) == 2
+    assert add(a=1) == 2
+    assert calls == [(1, 1)]
+    assert add(2) == 3
+    assert len(calls) == 2
+    assert add.key(1) in store.keys()
+
+
+def test_memoize_dataset(tmp_path):
+    store = CacheStore(str(tmp_path))
+    calls = []
+
+    @store.memoize(name='anomaly', serializer='xarray.zarr')
+    def anomaly(ds):
+        calls.append(ds)
+        return ds - ds.mean()
+
+    ds = xr.DataArray([1.0, 2.0, 3.0]).to_dataset(name='sst')
+    xr.testing.assert_equal(anomaly(ds), ds - ds.mean())
+    xr.testing.assert_equal(anomaly(ds.copy(deep=True)), ds - ds.mean())
+    assert len(calls) == 1
+    assert anomaly.key(ds).startswith('anomaly-')
+    assert store.get_artifact(anomaly.key(ds)).serializer == 'xarray.zarr'
+
+
+def test_failed_write_keeps_previous_artifact(tmp_path):
+    store = CacheStore(str(tmp_path), on_duplicate_key='overwrite')
+    store.put('foo.parquet', pd.DataFrame({'foo': [1, 2]}))
+
+    def batches():
+        yield pd.DataFrame({'foo': [3, 4]})
+        raise RuntimeError('writer crashed')
+
+    with pytest.raises(RuntimeError):
+        store.put_stream('foo.parquet', batches())
+    with pytest.raises(RuntimeError):
+        store.put_stream('bar.parquet', batches())
+    assert store.get('foo.parquet')['foo'].tolist() == [1, 2]
+    assert 'bar.parquet' not in store
+    assert not (tmp_path / 'bar.parquet').exists()
+    assert not list((tmp_path / 'xpersist_staging').iterdir())
+
+
+@pytest.mark.parametrize('metadata_store', ['sidecar', 'sqlite', 'log'])
+def test_fsck(tmp_path, metadata_store):
+    store = CacheStore(str(tmp_path), content_addressed=True, metadata_store=metadata_store)
+    store.put('foo', [1, 2, 3])
+    store.put('bar', [4, 5, 6])
+    # Leftovers of interrupted writes and deletes
+    (tmp_path / 'xpersist_staging' / f'{1:020d}-abc').mkdir(parents=True)
+    (tmp_path / 'xpersist_blobs' / 'orphan').write_text('orphan')
+    store.metadata.put('baz', {'key': 'baz', 'serializer': 'joblib'})
+    store.metadata.put('qux', {'key': 'qux', 'serializer': 'joblib', 'blob': 'missing'})
+
+    assert store.fsck(grace_period=datetime.timedelta(days=1)) == {
+        'staging': [str(tmp_path / 'xpersist_staging' / f'{1:020d}-abc')],
+        'blobs': [],
+        'records': ['baz', 'qux'],
+    }
+    orphans = store.fsck(dry_run=False, grace_period=datetime.timedelta(0))
+    assert [os.path.basename(path) for path in orphans['blobs']] == ['orphan']
+    assert sorted(store.keys()) == ['bar', 'foo']
+    assert store.get('foo') == [1, 2, 3]
+    assert not list((tmp_path / 'xpersist_staging').iterdir())
+    assert store.fsck(grace_period=datetime.timedelta(0)) == {
+        'staging': [],
+        'blobs': [],
+        'records': [],
+    }
+
+
+@pytest.mark.parametrize('locking', [None, 'file', 'ttl'])
+def test_get_or_compute(tmp_path, locking):
+    store = CacheStore(
+        str(tmp_path),
+        locking=locking,
+        locking_options={'poll_interval': 0.01, 'settle_time': 0.01} if locking == 'ttl' else {},
+    )
+    calls = []
+
+    def compute():
+        calls.append(1)
+        time.sleep(0.2)
+        return [1, 2, 3]
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(lambda _: store.get_or_compute('foo', compute), range(4)))
+    assert results == [[1, 2, 3]] * 4
+    assert len(calls) == 1
+    assert store.get_or_compute('foo', compute) == [1, 2, 3]
+    assert len(calls) == 1
+    # Released locks leave no lock files behind
+    assert not fsspec.filesystem('file').ls(store._lock_store_path)
+
+
+def test_get_or_compute_expired(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put('foo', list(range(1000)), serializer='joblib', ttl=-1)
+    assert (tmp_path / 'foo').exists()
+    # The expired artifact is replaced, and its file removed once the value is stored inline
+    assert store.get_or_compute('foo', lambda: 1, serializer='msgpack') == 1
+    assert store.get_artifact('foo').inline_data is not None
+    assert not (tmp_path / 'foo').exists()
+    assert store.get('foo') == 1
+
+
+def test_put_with_locking(tmp_path):
+    store = CacheStore(str(tmp_path), locking='auto', on_duplicate_key='raise_error')
+    store.put('foo', [1, 2, 3])
+    with pytest.raises(ValueError):
+        store.put('foo', [4, 5, 6])
+    with store.lock('bar'):
+        with pytest.raises(TimeoutError):
+            with store.lock('bar', timeout=0.05):
+                pass
+    store.append('baz', pd.DataFrame({'foo': [1]}))
+    store.append('baz', pd.DataFrame({'foo': [2]}))
+    assert store.get('baz')['foo'].tolist() == [1, 2]
+
+
+def test_ttl(tmp_path):
+    store = CacheStore(str(tmp_path), ttl=3600)
+    store.put('foo', [1, 2, 3], ttl=datetime.timedelta(seconds=-1))
+    store.put('bar', [4, 5, 6])
+    assert 'foo' not in store
+    with pytest.raises(KeyError):
+        store.get('foo')
+    assert store.get_artifact('bar').expires_at > datetime.datetime.utcnow()
+    assert store.keys() == ['bar']
+    assert store.search(serializer='joblib') == ['bar']
+    assert store.prune(dry_run=False) == ['foo']
+    assert store.keys() == ['bar']
+    # Expired keys are overwritten even with on_duplicate_key='skip'
+    store.put('qux', [7], ttl=-1)
+    store.put('qux', [8])
+    assert store.get('qux') == [8]
+
+
+@pytest.mark.parametrize(
+    'eviction_policy, evicted', [('lru', 'bar'), ('lfu', 'bar'), ('fifo', 'foo')]
+)
+def test_evict_max_items(tmp_path, eviction_policy, evicted):
+    store = CacheStore(str(tmp_path), max_items=2, eviction_policy=eviction_policy)
+    store.put('foo', [1])
+    store.put('bar', [2])
+    store.get('foo')
+    store.put('baz', [3])
+    assert sorted(store.keys()) == sorted({'foo', 'bar', 'baz'} - {evicted})
+    artifact = store.get_artifact('baz' if eviction_policy == 'fifo' else 'foo')
+    if eviction_policy == 'fifo':
+        assert artifact.access_count == 0
+    else:
+        assert artifact.access_count == 1
+        assert artifact.last_accessed is not None
+
+
+@pytest.mark.parametrize('content_addressed', [False, True])
+def test_evict_max_bytes(tmp_path, content_addressed):
+    store = CacheStore(str(tmp_path), content_addressed=content_addressed)
+    values = {key: np.full(1000, index) for index, key in enumerate(['foo', 'bar', 'baz'])}
+    store.put_many(values)
+    nbytes = store.get_artifact('foo').nbytes_on_disk
+    assert nbytes > 8000
+    assert store.evict(max_bytes=2 * nbytes + 100) == ['foo']
+    assert len(store.keys()) == 3
+    assert store.evict(max_bytes=2 * nbytes + 100, dry_run=False) == ['foo']
+    assert sorted(store.keys()) == ['bar', 'baz']
+    if content_addressed:
+        # A blob shared by several keys is counted once
+        store.put('qux', values['bar'])
+        assert store.evict(max_bytes=2 * nbytes + 100) == []
+
+    # The bound holds for the bytes actually on disk
+    store = CacheStore(
+        str(tmp_path / 'bounded'), content_addressed=content_addressed, max_bytes=3 * nbytes
+    )
+    for index in range(6):
+        store.put(f'foo-{index}', np.full(1000, index))
+    assert len(store.keys()) == 3
+    data_dir = tmp_path / 'bounded' / ('xpersist_blobs' if content_addressed else '')
+    on_disk = sum(path.stat().st_size for path in data_dir.iterdir() if path.is_file())
+    assert on_disk <= 3 * nbytes
+
+
+def test_evict_packed(tmp_path):
+    store = CacheStore(str(tmp_path), packed_max_bytes=2**10, max_items=2)
+    for index in range(4):
+        store.put(f'foo-{index}', index)
+    assert sorted(store.keys()) == ['foo-2', 'foo-3']
+    # The entries of the evicted artifacts stay in the segment until it is compacted
+    segment_bytes = sum(info['size'] for info in store.segments.segments().values())
+    assert store._usage == (segment_bytes, 2)
+    assert store.evict(max_bytes=1, max_items=2) == []
+
+
+@pytest.mark.parametrize('content_addressed', [False, True])
+def test_artifact_stats(tmp_path, content_addressed):
+    store = CacheStore(str(tmp_path), content_addressed=content_addressed)
+    df = pd.DataFrame({'foo': np.arange(1000)})
+    store.put('foo.parquet', df)
+    artifact = store.get_artifact('foo.parquet')
+    assert artifact.nbytes_in_memory == df.memory_usage(deep=True).sum()
+    assert artifact.nbytes_on_disk == os.path.getsize(store._item_path(artifact))
+    assert artifact.dump_seconds > 0
+    assert len(artifact.checksum) == 64
+    if content_addressed:
+        assert artifact.blob.startswith(artifact.checksum)
+    assert store.verify('foo.parquet')
+    with open(store._item_path(artifact), 'ab') as fobj:
+        fobj.write(b'corrupted')
+    assert not store.verify('foo.parquet')
+
+
+@pytest.mark.parametrize('checksum_max_bytes', [None, 1, 64 * 2**20])
+def test_checksum_max_bytes(tmp_path, checksum_max_bytes):
+    store = CacheStore(str(tmp_path), checksum_max_bytes=checksum_max_bytes)
+    store.put('foo', list(range(1000)), serializer='joblib')
+    store.put('bar.zarr', xr.DataArray([1, 2]).to_dataset(name='sst'), serializer='xarray.zarr')
+    # Directory artifacts and artifacts larger than the bound are not read back
+    checksummed = {
+        None: {'foo', 'bar.zarr'},
+        1: set(),
+        64 * 2**20: {'foo'},
+    }[checksum_max_bytes]
+    for key in ['foo', 'bar.zarr']:
+        if key in checksummed:
+            assert store.verify(key)
+        else:
+            assert store.get_artifact(key).checksum is None
+
+
+@pytest.mark.parametrize('track_access', [None, True])
+def test_track_access(tmp_path, track_access):
+    store = CacheStore(str(tmp_path), track_access=track_access)
+    store.put('foo', [1, 2, 3])
+    store.get('foo')
+    store.get_many(['foo'])
+    artifact = store.get_artifact('foo')
+    assert artifact.access_count == (2 if track_access else 0)
+    assert (artifact.last_accessed is not None) == bool(track_access)
+
+
+def test_track_access_concurrent_delete(tmp_path, monkeypatch):
+    store = CacheStore(str(tmp_path), track_access=True)
+    other = CacheStore(str(tmp_path), on_duplicate_key='overwrite')
+    store.put('foo', [1])
+    load = store._load
+
+    def load_and_delete(artifact, *args, **kwargs):
+        value = load(artifact, *args, **kwargs)
+        other.delete('foo', dry_run=False)
+        return value
+
+    monkeypatch.setattr(store, '_load', load_and_delete)
+    assert store.get('foo') == [1]
+    # The record of the deleted key is not restored
+    assert 'foo' not in store
+    monkeypatch.undo()
+
+    store.put('foo', [1])
+    monkeypatch.setattr(store, '_load', lambda *args, **kwargs: other.put('foo', [2]))
+    store.get('foo')
+    monkeypatch.undo()
+    assert store.get('foo') == [2]
+
+
+def test_validate_arguments():
+    calls = []
+
+    @_validate_arguments
+    def func(key: str, count: int = 1, kwargs: typing.Dict[typing.Any, typing.Any] = None):
+        calls.append((key, count, kwargs))
+
+    kwargs = {'foo': 'bar'}
+    func('foo', 2, kwargs=kwargs)
+    # Arguments of the annotated types are passed through as-is
+    assert calls[-1][2] is kwargs
+    func(1, count='3')
+    assert calls[-1] == ('1', 3, None)
+    with pytest.raises(pydantic.ValidationError):
+        func('foo', count='bar')
+    with pytest.raises(pydantic.ValidationError):
+        func('foo', kwargs='bar')
+
+
+def test_put_argument_coercion(tmp_path):
+    store = CacheStore(str(tmp_path))
+    store.put(1, 'foo', ttl=60, compression='gzip:3')
+    artifact = store.get_artifact('1')
+    assert artifact.compression.codec == 'gzip'
+    assert artifact.expires_at - artifact.created_at == datetime.timedelta(seconds=60)
+    assert store.get('1') == 'foo'
+
+
+class CountingFileSystem(MemoryFileSystem):
+    """In-memory file-system counting the requests a remote backend would receive.
+
+    Only the outermost calls are counted, not the calls they make internally.
+    """
+
+    protocol = 'counting'
+    store = {}
+    pseudo_dirs = ['']
+    requests = collections.Counter()
+    _depth = threading.local()
+
+
+def _counted(name):
+    method = getattr(MemoryFileSystem, name)
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        depth = getattr(self._depth, 'value', 0)
+        if depth == 0:
+            self.requests[name] += 1
+        self._depth.value = depth + 1
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self._depth.value = depth
+
+    return wrapper
+
+
+for _name in [
+    'info',
+    'exists',
+    'isfile',
+    'isdir',
+    'ls',
+    'find',
+    'du',
+    'cat_file',
+    'cat',
+    'pipe_file',
+    'pipe',
+    'open',
+    'makedirs',
+    'mkdir',
+    'mv',
+    'copy',
+    'rm',
+    'rm_file',
+]:
+    setattr(CountingFileSystem, _name, _counted(_name))
+
+
+@pytest.fixture
+def requests():
+    fsspec.register_implementation('counting', CountingFileSystem, clobber=True)
+    CountingFileSystem.store.clear()
+    CountingFileSystem.requests.clear()
+    yield CountingFileSystem.requests
+    CountingFileSystem.store.clear()
+
+
+def test_requests_per_operation(requests):
+    value = pd.DataFrame({'foo': [1, 2]})
+    store = CacheStore('counting://store')
+    assert requests == {'makedirs': 1}
+
+    requests.clear()
+    with pytest.raises(KeyError):
+        store.get('foo')
+    assert 'foo' not in store
+    # A miss is a single read of the missing sidecar
+    assert requests == {'cat_file': 2}
+
+    requests.clear()
+    store.put('foo', value, serializer='pandas.csv')
+    assert requests['cat_file'] == 1
+    assert not requests['exists'] and not requests['isfile'] and not requests['info']
+
+    requests.clear()
+    store.put('foo', value, serializer='pandas.csv')
+    assert requests == {'cat_file': 1}
+
+    requests.clear()
+    pd.testing.assert_frame_equal(store.get('foo', load_kwargs={'index_col': 0}), value)
+    assert requests == {'cat_file': 1, 'open': 1}
+
+
+def test_keys_requests(requests):
+    store = CacheStore('counting://store', serializer_policy={'small_object_max_bytes': 1024})
+    store.put_many({'foo': 1, 'bar': 2})
+    store.put('baz', 3, ttl=-1)
+    # Without a ttl on the cache store, listing keys does not read the sidecars
+    requests.clear()
+    assert sorted(store.keys()) == ['bar', 'baz', 'foo']
+    assert requests == {'find': 1}
+    assert 'baz' not in store
+
+    store = CacheStore('counting://store', ttl=3600)
+    assert sorted(store.keys()) == ['bar', 'foo']
+
+
+def test_inline_artifacts(requests):
+    store = CacheStore(
+        'counting://store',
+        on_duplicate_key='overwrite',
+        serializer_policy={'small_object_max_bytes': 1024},
+    )
+    store.put('foo', pd.DataFrame({'foo': [1, 2]}), serializer='pandas.csv')
+    assert store.mapper.fs.exists(store._construct_item_path('foo'))
+    store.put('foo', {'bar': [1, 2]})
+    artifact = store.get_artifact('foo')
+    assert artifact.serializer == 'msgpack'
+    assert artifact.inline_data is not None
+    assert store.verify('foo')
+    # The file of the replaced artifact is removed
+    assert not store.mapper.fs.exists(store._construct_item_path('foo'))
+
+    requests.clear()
+    assert store.get('foo') == {'bar': [1, 2]}
+    assert requests == {'cat_file': 1}
+
+    store.put_many({'bar': 1, 'baz': 'qux'})
+    assert store.get_many(['bar', 'baz']) == {'bar': 1, 'baz': 'qux'}
+    assert store.fsck()['records'] == []
+    store.delete('foo', dry_run=False)
+    assert 'foo' not in store
+
+
+def test_packed_artifacts(tmp_path):
+    store = CacheStore(str(tmp_path), on_duplicate_key='overwrite', packed_max_bytes=2**10)
+    for index in range(5):
+        store.put(f'foo-{index}', list(range(index)))
+    store.put('bar', list(range(2**10)))
+    segments = store.segments.segments()
+    assert len(segments) == 1
+    assert (tmp_path / 'bar').exists() and not (tmp_path / 'foo-0').exists()
+    artifact = store.get_artifact('foo-3')
+    assert artifact.segment in segments
+    assert store.get('foo-3') == [0, 1, 2]
+    assert store.verify('foo-3')
+
+    # Replacing an artifact stored in its own file removes the file
+    store.put('bar', 'baz')
+    assert not (tmp_path / 'bar').exists()
+    for index in range(4):
+        store.delete(f'foo-{index}', dry_run=False)
+    assert store.fsck()['records'] == []
+
+    grace_period = datetime.timedelta(0)
+    # The segment being filled is left alone
+    assert store.compact_segments(grace_period=grace_period, dry_run=False) == []
+    other = CacheStore(str(tmp_path), packed_max_bytes=2**10)
+    assert other.compact_segments(grace_period=grace_period) == [
+        store.segments.segment_path(artifact.segment)
+    ]
+    other.compact_segments(grace_period=grace_period, dry_run=False)
+    assert artifact.segment not in other.segments.segments()
+    assert other.get('foo-4') == [0, 1, 2, 3]
+    assert other.get('bar') == 'baz'
+
+
+def test_packed_compression(tmp_path):
+    store = CacheStore(str(tmp_path), packed_max_bytes=2**16)
+    value = [0] * 2**10
+    store.put('plain', value)
+    store.put('compressed', value, compression='gzip:3')
+    artifact = store.get_artifact('compressed')
+    assert artifact.segment is not None and artifact.compression.codec == 'gzip'
+    assert artifact.nbytes_on_disk < store.get_artifact('plain').nbytes_on_disk
+    assert store.get('compressed') == value
+
+
+def test_packed_artifacts_requests(requests):
+    store = CacheStore('counting://store', packed_max_bytes=2**10)
+    requests.clear()
+    store.put_many({f'foo-{index}': index for index in range(10)})
+    # A single segment object holds the data of the batch
+    assert requests['pipe_file'] == 1
+    assert len(store.segments.segments()) == 1
+
+    requests.clear()
+    assert store.get('foo-3') == 3
+    assert requests == {'cat_file': 2}
+
+
+def test_compact_small_segments(requests):
+    store = CacheStore('counting://store', packed_max_bytes=2**10)
+    for index in range(20):
+        store.put(f'foo-{index}', index)
+    # Object stores cannot be appended to: each put writes its own segment
+    assert len(store.segments.segments()) == 20
+
+    grace_period = datetime.timedelta(0)
+    assert len(store.compact_segments(grace_period=grace_period, dry_run=False)) == 20
+    segments = store.segments.segments()
+    assert len(segments) == 1
+    assert {store.get_artifact(f'foo-{index}').segment for index in range(20)} == set(segments)
+    assert [store.get(f'foo-{index}') for index in range(20)] == list(range(20))
+    # A single small segment is not rewritten
+    assert store.compact_segments(grace_period=grace_period) == []
+
+
+def test_log_metadata_store_stale_hit(tmp_path):
+    first = CacheStore(str(tmp_path), metadata_store='log', on_duplicate_key='overwrite')
+    second = CacheStore(str(tmp_path), metadata_store='log')
+    first.put('foo', [1])
+    assert second.get('foo') == [1]
+    first.delete('foo', dry_run=False)
+    # The record cached by the second store points to deleted data
+    with pytest.raises(KeyError):
+        second.get('foo')
+    first.put('foo', [2])
+    second.metadata.max_staleness = 0
+    assert 'foo' in second
+    second.put('foo', [3])
+    assert second.get('foo') == [2]
@@ -0,0 +1,44 @@
+import os
+
+import fsspec
+import pytest
+
+from xpersist.disk import LocalDiskCache
+
+
+@pytest.fixture
+def remote(tmp_path):
+    fs = fsspec.filesystem('file')
+    (tmp_path / 'remote' / 'dir.zarr' / 'sub').mkdir(parents=True)
+    (tmp_path / 'remote' / 'file.nc').write_bytes(b'x' * 100)
+    (tmp_path / 'remote' / 'dir.zarr' / 'sub' / 'chunk').write_bytes(b'y' * 100)
+    return fs, str(tmp_path / 'remote')
+
+
+@pytest.mark.parametrize('key', ['file.nc', 'dir.zarr'])
+def test_fetch(tmp_path, remote, key):
+    fs, root = remote
+    cache = LocalDiskCache(str(tmp_path / 'local'))
+    path = cache.fetch(fs, f'{root}/{key}', key, token='1')
+    assert path.startswith(cache.directory)
+    assert os.path.basename(path) == key
+    assert os.path.exists(path)
+
+    os.utime(path, (0, 0))
+    assert cache.fetch(fs, f'{root}/{key}', key, token='1') == path
+    assert os.path.getmtime(path) == 0
+
+    cache.fetch(fs, f'{root}/{key}', key, token='2')
+    assert os.path.getmtime(path) != 0
+
+    cache.invalidate(key)
+    assert not os.path.exists(path)
+
+
+def test_evict(tmp_path, remote):
+    fs, root = remote
+    cache = LocalDiskCache(str(tmp_path / 'local'), max_bytes=150)
+    first = cache.fetch(fs, f'{root}/file.nc', 'file.nc', token='1')
+    second = cache.fetch(fs, f'{root}/dir.zarr', 'dir.zarr', token='1')
+    assert os.path.exists(second)
+    assert not os.path.exists(first)
@@ -0,0 +1,78 @@
+import os
+import subprocess
+import sys
+import types
+
+import pytest
+
+from xpersist import _lazy
+
+
+def test_singledispatch_register_lazy(monkeypatch):
+    @_lazy.singledispatch
+    def describe(obj):
+        return 'default'
+
+    registered = []
+
+    @describe.register_lazy('xpersist_fake_module')
+    def _register():
+        registered.append(True)
+        describe.register(module.Thing, lambda obj: 'thing')
+
+    module = types.ModuleType('xpersist_fake_module')
+    module.Thing = type('Thing', (), {})
+    assert describe(1) == 'default'
+    assert not registered
+
+    monkeypatch.setitem(sys.modules, 'xpersist_fake_module', module)
+    assert describe(module.Thing()) == 'thing'
+    assert describe(1) == 'default'
+    assert registered == [True]
+
+
+def test_isinstance_of(monkeypatch):
+    module = types.ModuleType('xpersist_fake_module')
+    module.Thing = type('Thing', (), {})
+    assert not _lazy.isinstance_of(module.Thing(), 'xpersist_fake_module', 'Thing')
+    monkeypatch.setitem(sys.modules, 'xpersist_fake_module', module)
+    assert _lazy.isinstance_of(module.Thing(), 'xpersist_fake_module', 'Thing')
+    assert not _lazy.isinstance_of(1, 'xpersist_fake_module', 'Thing')
+
+
+def test_module_getattr():
+    import xpersist.serializers
+
+    assert xpersist.serializers.load_numpy_mmap.__module__ == 'xpersist.backends.mmap'
+    with pytest.raises(AttributeError):
+        xpersist.serializers.does_not_exist
+
+
+def _run(script: str, **kwargs) -> str:
+    return subprocess.run(
+        [sys.executable, '-c', script], check=True, capture_output=True, text=True, **kwargs
+    ).stdout
+
+
+def test_import_is_lazy(tmp_path):
+    script = f"""
+import os
+import sys
+import xpersist
+from xpersist.tokenize import tokenize
+store = xpersist.CacheStore({str(tmp_path)!r})
+store.put('foo', {{'bar': [1, 2, 3]}})
+assert store.get('foo') == {{'bar': [1, 2, 3]}}
+tokenize({{'bar': [1, 2, 3]}})
+heavy = ['xarray', 'pandas', 'xcollection', 'zarr', 'prefect', 'pendulum']
+print([name for name in heavy if name in sys.modules])
+print('PREFECT__FLOWS__CHECKPOINTING' in os.environ)
+"""
+    env = {key: value for key, value in os.environ.items() if not key.startswith('PREFECT_')}
+    assert _run(script, env=env).split() == ['[]', 'False']
+
+
+def test_import_time():
+    script = 'import time; start = time.perf_counter(); import xpersist; print(time.perf_counter() - start)'
+    # Generous bound (eager imports took over a second), see benchmarks/import_time.py
+    assert min(float(_run(script)) for _ in range(3)) < 0.5
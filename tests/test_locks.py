@@ -0,0 +1,65 @@
+import json
+import os
+import time
+
+import fsspec
+import pytest
+
+from xpersist.locks import FileLock, TTLLock
+from xpersist.registry import registry
+
+
+@pytest.mark.parametrize('name', ['file', 'ttl'])
+def test_lock_is_exclusive(tmp_path, name):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'locks' / 'foo.lock')
+    first = registry.locks.get(name)(fs=fs, path=path, poll_interval=0.01)
+    second = registry.locks.get(name)(fs=fs, path=path, poll_interval=0.01, timeout=0.05)
+    with first:
+        assert not second.acquire()
+        with pytest.raises(TimeoutError):
+            with second:
+                pass
+    assert second.acquire()
+    second.release()
+    assert not fs.exists(path)
+
+
+def test_file_lock_removed_file(tmp_path, monkeypatch):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'foo.lock')
+    first = FileLock(fs, path)
+    second = FileLock(fs, path, poll_interval=0.01)
+    first.acquire()
+    os_open = os.open
+
+    def open_then_release(*args, **kwargs):
+        # The holder releases and removes the lock file after the waiter opened it
+        fd = os_open(*args, **kwargs)
+        monkeypatch.setattr(os, 'open', os_open)
+        first.release()
+        return fd
+
+    monkeypatch.setattr(os, 'open', open_then_release)
+    # Locking the removed file does not acquire the lock
+    assert not second.acquire(timeout=0)
+    assert second.acquire(timeout=1)
+    assert fs.exists(path)
+    second.release()
+
+
+def test_ttl_lock_expires(tmp_path):
+    fs, path = fsspec.filesystem('memory'), f'/{tmp_path.name}/foo.lock'
+    # A lock file left behind by a crashed holder
+    fs.pipe_file(path, json.dumps({'owner': 'crashed', 'expires_at': time.time() + 0.2}).encode())
+    lock = TTLLock(fs, path, ttl=0.2, settle_time=0.01, poll_interval=0.05)
+    assert not lock.acquire(timeout=0)
+    assert lock.acquire(timeout=1)
+    # The lease is renewed while the lock is held
+    time.sleep(0.5)
+    assert not TTLLock(fs, path, settle_time=0.01).acquire(timeout=0)
+    lock.release()
+    assert not fs.exists(path)
+
+
+def test_file_lock_requires_local_store():
+    with pytest.raises(ValueError):
+        FileLock(fsspec.filesystem('memory'), '/foo.lock')
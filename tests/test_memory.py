@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+
+from xpersist.memory import MemoryCache, sizeof
+
+
+@pytest.mark.parametrize(
+    'obj, expected',
+    [
+        (np.zeros(100), 800),
+        (xr.DataArray(np.zeros(100)).to_dataset(name='foo'), 800),
+        (
+            pd.DataFrame({'foo': np.zeros(100)}),
+            pd.DataFrame({'foo': np.zeros(100)}).memory_usage(deep=True).sum(),
+        ),
+    ],
+)
+def test_sizeof(obj, expected):
+    assert sizeof(obj) == expected
+
+
+def test_sizeof_containers():
+    assert sizeof([np.zeros(100), np.zeros(100)]) > 1600
+    assert sizeof({'foo': np.zeros(100)}) > 800
+
+
+def test_lru_eviction():
+    cache = MemoryCache(max_bytes=2000)
+    cache.put('a', np.zeros(100))
+    cache.put('b', np.zeros(100))
+    cache.get('a')
+    cache.put('c', np.zeros(100))
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+    assert cache.nbytes == 1600
+
+
+def test_lfu_eviction():
+    cache = MemoryCache(max_bytes=2000, policy='lfu')
+    cache.put('a', np.zeros(100))
+    cache.put('b', np.zeros(100))
+    cache.get('b')
+    cache.get('a')
+    cache.get('a')
+    cache.put('c', np.zeros(100))
+    assert 'a' in cache and 'c' in cache and 'b' not in cache
+
+
+def test_oversized_values_are_not_cached():
+    cache = MemoryCache(max_bytes=100)
+    cache.put('a', np.zeros(100))
+    assert len(cache) == 0
+    with pytest.raises(KeyError):
+        cache.get('a')
@@ -0,0 +1,158 @@
+import pickle
+
+import fsspec
+import pytest
+
+from xpersist.metadata import LogMetadataStore, SQLiteMetadataStore
+from xpersist.registry import registry
+
+
+@pytest.fixture(params=['sidecar', 'sqlite', 'log'])
+def metadata_store(request, tmp_path):
+    return registry.metadata_store.get(request.param)(
+        fs=fsspec.filesystem('file'), path=str(tmp_path / 'xpersist_metadata_store')
+    )
+
+
+def test_put_get_delete(metadata_store):
+    record = {'key': 'foo', 'serializer': 'joblib'}
+    assert 'foo' not in metadata_store
+    metadata_store.put('foo', record)
+    assert 'foo' in metadata_store
+    assert metadata_store.keys() == ['foo']
+    assert metadata_store.get('foo') == record
+    metadata_store.delete('foo')
+    assert 'foo' not in metadata_store
+    with pytest.raises(KeyError):
+        metadata_store.get('foo')
+    with pytest.raises(KeyError):
+        metadata_store.delete('foo')
+
+
+def test_pickle(metadata_store):
+    metadata_store.put('foo', {'key': 'foo'})
+    new = pickle.loads(pickle.dumps(metadata_store))
+    assert new.get('foo') == {'key': 'foo'}
+
+
+def test_log_sees_other_writers(tmp_path):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'meta')
+    first, second = LogMetadataStore(fs, path), LogMetadataStore(fs, path)
+    assert first.keys() == []
+    second.put('foo', {'key': 'foo'})
+    assert 'foo' in first
+    second.delete('foo')
+    assert first.keys() == []
+
+
+def test_log_compact(tmp_path):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'meta')
+    store = LogMetadataStore(fs, path)
+    for index in range(5):
+        store.put(f'key-{index}', {'key': f'key-{index}'})
+    store.delete('key-0')
+    store.compact()
+    assert len(fs.ls(f'{path}/log')) == 6
+    store.put('key-5', {'key': 'key-5'})
+    store.compact()
+    assert len(fs.ls(f'{path}/log')) == 1
+    assert sorted(LogMetadataStore(fs, path).keys()) == [f'key-{index}' for index in range(1, 6)]
+
+
+def test_sqlite_requires_local_path():
+    with pytest.raises(ValueError):
+        SQLiteMetadataStore(fsspec.filesystem('memory'), '/xpersist_metadata_store')
+
+
+def test_search(metadata_store):
+    records = {
+        'a': {
+            'serializer': 'joblib',
+            'created_at': '2021-01-01T00:00:00',
+            'additional_metadata': {'task_name': 'foo', 'map_index': 1},
+        },
+        'b': {
+            'serializer': 'joblib',
+            'created_at': '2021-06-01T00:00:00',
+            'additional_metadata': {'task_name': 'bar', 'map_index': 2},
+        },
+        'c': {
+            'serializer': 'xarray.netcdf',
+            'created_at': '2022-01-01T00:00:00',
+            'additional_metadata': {'task_name': 'foo'},
+        },
+    }
+    for key, record in records.items():
+        metadata_store.put(key, record)
+
+    def search(**kwargs):
+        return sorted(metadata_store.search(**kwargs))
+
+    assert search() == ['a', 'b', 'c']
+    assert search(filters={'serializer': 'joblib'}) == ['a', 'b']
+    assert search(filters={'additional_metadata.task_name': 'foo'}) == ['a', 'c']
+    assert search(filters={'additional_metadata.map_index': [2, 3]}) == ['b']
+    assert search(filters={'serializer': 'joblib', 'additional_metadata.task_name': 'foo'}) == ['a']
+    assert search(created_after='2021-06-01T00:00:00') == ['b', 'c']
+    assert search(created_before='2021-06-01T00:00:00') == ['a']
+    assert search(filters={'additional_metadata.missing': 'foo'}) == []
+
+    metadata_store.put('c', dict(records['c'], serializer='joblib'))
+    metadata_store.delete('a')
+    assert search(filters={'serializer': 'joblib'}) == ['b', 'c']
+
+
+def test_expired(metadata_store):
+    metadata_store.put_many(
+        {
+            'a': {'key': 'a', 'expires_at': '2000-01-01T00:00:00'},
+            'b': {'key': 'b', 'expires_at': '2000-01-02T00:00:00.500000'},
+            'c': {'key': 'c', 'expires_at': None},
+        }
+    )
+    assert metadata_store.expired('1999-12-31T00:00:00') == []
+    assert metadata_store.expired('2000-01-01T00:00:00') == ['a']
+    assert sorted(metadata_store.expired('2000-01-02T00:00:00.500000')) == ['a', 'b']
+    metadata_store.delete('a')
+    assert metadata_store.expired('2001-01-01T00:00:00') == ['b']
+
+
+def test_batch_operations(metadata_store):
+    records = {f'key-{index}': {'key': f'key-{index}'} for index in range(5)}
+    metadata_store.put_many(records)
+    assert sorted(metadata_store.keys()) == sorted(records)
+    assert metadata_store.get_many(['key-0', 'key-4', 'missing']) == {
+        'key-0': records['key-0'],
+        'key-4': records['key-4'],
+    }
+    assert metadata_store.get_many(['missing']) == {}
+    metadata_store.delete_many(['key-0', 'key-1'])
+    assert sorted(metadata_store.keys()) == ['key-2', 'key-3', 'key-4']
+
+
+def test_log_latest_write_wins(tmp_path):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'meta')
+    first, second = LogMetadataStore(fs, path), LogMetadataStore(fs, path)
+    first.keys()
+    second.put('foo', {'value': 'old'})
+    first.put('foo', {'value': 'new'})
+    # The older entry of the other writer is discovered last
+    assert first.keys() == ['foo']
+    assert first.get('foo') == {'value': 'new'}
+    first.compact()
+    assert LogMetadataStore(fs, path).get('foo') == {'value': 'new'}
+    second.delete('foo')
+    first.put('bar', {'value': 'bar'})
+    assert sorted(first.keys()) == ['bar']
+
+
+def test_log_max_staleness(tmp_path):
+    fs, path = fsspec.filesystem('file'), str(tmp_path / 'meta')
+    first = LogMetadataStore(fs, path, max_staleness=0)
+    second = LogMetadataStore(fs, path, max_staleness=0)
+    first.put('foo', {'value': 1})
+    assert second.get('foo') == {'value': 1}
+    first.delete('foo')
+    assert 'foo' not in second
+    first.put('foo', {'value': 2})
+    assert second.get('foo') == {'value': 2}
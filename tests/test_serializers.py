@@ -1,3 +1,5 @@
+import dask
+import numpy as np
 import pandas as pd
 import pytest
 import xarray as xr
@@ -22,8 +24,127 @@ import xpersist
             ),
             'xcollection',
         ),
-        (pd.DataFrame({'foo': [1, 2]}), 'pandas.csv'),
+        (pd.DataFrame({'foo': [1, 2]}), 'pandas.parquet'),
     ],
 )
 def test_default_serializer(value, expected_serializer):
     assert xpersist.pick_serializer(value) == expected_serializer
+
+
+@pytest.mark.parametrize(
+    'value, expected_serializer',
+    [
+        (pd.DataFrame({0: [1, 2]}), 'joblib'),
+        (pd.DataFrame({'foo': ['bar', 1]}), 'joblib'),
+        (pd.DataFrame({'foo': ['bar', None]}), 'pandas.parquet'),
+        (xr.DataArray([1, 2]).to_dataset(name='test').chunk(), 'xarray.zarr'),
+        (xr.DataArray(np.zeros(2**10)).to_dataset(name='test'), 'xarray.zarr'),
+        (xr.DataArray(np.zeros(2**10)), 'xarray.netcdf'),
+    ],
+)
+def test_serializer_policy(value, expected_serializer):
+    policy = xpersist.serializers.SerializerPolicy(large_dataset_min_bytes=2**13)
+    assert xpersist.pick_serializer(value, policy) == expected_serializer
+
+
+def test_serializer_policy_cache_store(tmp_path):
+    store = xpersist.CacheStore(
+        str(tmp_path), serializer_policy={'dataframe': 'pandas.csv', 'dataset': 'xarray.zarr'}
+    )
+    store.put('df', pd.DataFrame({'foo': [1, 2]}))
+    store.put('ds', xr.DataArray([1, 2]).to_dataset(name='test'))
+    assert store.get_artifact('df').serializer == 'pandas.csv'
+    assert store.get_artifact('ds').serializer == 'xarray.zarr'
+
+
+@pytest.mark.parametrize(
+    'value, expected_serializer',
+    [
+        ({'foo': [1, 2.5, None, True], 'bar': b'baz'}, 'msgpack'),
+        ([{1: 'foo'}], 'msgpack'),
+        (list(range(100)), 'joblib'),
+        (('foo', 'bar'), 'joblib'),
+        ([np.float64(1.0)], 'joblib'),
+        (2**64, 'joblib'),
+    ],
+)
+def test_small_object_policy(value, expected_serializer):
+    policy = xpersist.serializers.SerializerPolicy(small_object_max_bytes=64)
+    assert xpersist.pick_serializer(value, policy) == expected_serializer
+    assert xpersist.pick_serializer(value) == 'joblib'
+
+
+@pytest.mark.parametrize(
+    'value',
+    [
+        np.arange(12.0).reshape(3, 4),
+        np.arange(12).reshape(3, 4)[:, ::2],
+        np.array(5),
+        np.empty((0, 3)),
+        np.array(['2021-01-01', '2021-01-02'], dtype='datetime64[ns]'),
+    ],
+)
+def test_numpy_mmap(tmp_path, value):
+    serializer = xpersist.registry.serializers.get('numpy.mmap')()
+    serializer.dump(value, str(tmp_path / 'data'))
+    loaded = serializer.load(str(tmp_path / 'data'))
+    np.testing.assert_array_equal(loaded, value)
+    assert loaded.dtype == value.dtype
+
+
+def test_xarray_mmap(tmp_path):
+    ds = xr.Dataset(
+        {'sst': (('time', 'x'), np.random.rand(4, 3), {'units': 'K'})},
+        coords={'time': pd.date_range('2021-01-01', periods=4), 'x': ['a', 'b', 'c']},
+        attrs={'title': 'test'},
+    )
+    serializer = xpersist.registry.serializers.get('xarray.mmap')()
+    serializer.dump(ds, str(tmp_path / 'ds'))
+    loaded = serializer.load(str(tmp_path / 'ds'))
+    xr.testing.assert_identical(loaded, ds)
+    data = loaded.sst.variable._data
+    for _ in range(5):
+        if isinstance(data, np.memmap):
+            break
+        data = getattr(data, 'base', None)
+    assert isinstance(data, np.memmap)
+    # copy-on-write: in-memory modifications are not written back
+    loaded['sst'][0, 0] = -1.0
+    xr.testing.assert_identical(serializer.load(str(tmp_path / 'ds')), ds)
+
+    serializer.dump(ds.sst, str(tmp_path / 'da'))
+    xr.testing.assert_identical(serializer.load(str(tmp_path / 'da')), ds.sst)
+    serializer.dump(xr.DataArray([1, 2]), str(tmp_path / 'unnamed'))
+    xr.testing.assert_identical(serializer.load(str(tmp_path / 'unnamed')), xr.DataArray([1, 2]))
+
+
+def test_xarray_mmap_dask(tmp_path):
+    ds = xr.Dataset({'sst': (('time', 'x'), np.random.rand(10, 3))}).chunk({'time': 4, 'x': 1})
+    computed = []
+
+    def get(dsk, keys, **kwargs):
+        computed.append(keys)
+        return dask.get(dsk, keys, **kwargs)
+
+    serializer = xpersist.registry.serializers.get('xarray.mmap')()
+    with dask.config.set(scheduler=get):
+        serializer.dump(ds, str(tmp_path / 'ds'))
+    # Written one chunk of rows at a time
+    assert len(computed) == 3
+    xr.testing.assert_identical(serializer.load(str(tmp_path / 'ds')), ds.compute())
+
+
+def test_get_serializer():
+    serializer = xpersist.serializers.get_serializer('joblib')
+    assert serializer.name == 'joblib'
+    assert xpersist.serializers.get_serializer('joblib') is serializer
+    with pytest.raises(ValueError):
+        xpersist.serializers.get_serializer('unknown')
+
+
+def test_mmap_errors(tmp_path):
+    serializer = xpersist.registry.serializers.get('numpy.mmap')()
+    with pytest.raises(ValueError):
+        serializer.dump(np.array([{}, []], dtype=object), str(tmp_path / 'data'))
+    with pytest.raises(ValueError):
+        serializer.load('memory://data')
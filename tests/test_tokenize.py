@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+import xarray as xr
+import xcollection as xc
+
+from xpersist.tokenize import tokenize, tokenize_function
+
+
+def _dataset(values):
+    return xr.Dataset(
+        {'sst': ('x', np.asarray(values, dtype='float64'))},
+        coords={'x': np.arange(len(values))},
+        attrs={'units': 'K'},
+    )
+
+
+@pytest.mark.parametrize(
+    'first, second',
+    [
+        ([1, 2, 3], [1, 2, 4]),
+        ((1, 2), [1, 2]),
+        (1, 1.0),
+        ({'foo': 1}, {'foo': 2}),
+        ({1, 2}, {1, 3}),
+        (np.arange(10), np.arange(10.0)),
+        (np.arange(10), np.arange(10).reshape(2, 5)),
+        (pd.DataFrame({'foo': [1, 2]}), pd.DataFrame({'foo': [1, 3]})),
+        (pd.DataFrame({'foo': [1, 2]}), pd.DataFrame({'bar': [1, 2]})),
+        (_dataset([1, 2]), _dataset([1, 3])),
+        (_dataset([1, 2]), _dataset([1, 2]).assign_attrs(units='C')),
+        (_dataset([1, 2]).sst, _dataset([1, 2]).sst.rename('foo')),
+        (_dataset([1, 2]), _dataset([1, 2]).set_coords('sst')),
+    ],
+)
+def test_tokenize(first, second):
+    assert tokenize(first) == tokenize(first)
+    assert tokenize(first) != tokenize(second)
+
+
+@pytest.mark.parametrize(
+    'factory',
+    [
+        lambda: {'foo': [1, 2], 'bar': {3, 4}},
+        lambda: np.arange(10),
+        lambda: pd.DataFrame({'foo': [1, 2]}),
+        lambda: _dataset([1, 2]),
+    ],
+)
+def test_tokenize_is_deterministic(factory):
+    assert tokenize(factory()) == tokenize(factory())
+
+
+def test_tokenize_kwargs():
+    assert tokenize(1, foo=2) == tokenize(1, foo=2)
+    assert tokenize(1, foo=2) != tokenize(1, foo=3)
+
+
+def test_tokenize_function():
+    def func(a):
+        return a + 1
+
+    def other(a):
+        return a + 2
+
+    assert tokenize_function(func) == tokenize_function(func)
+    assert tokenize_function(func) != tokenize_function(other)
+
+
+def test_tokenize_dask_is_lazy():
+    dask = pytest.importorskip('dask.array')
+    array = dask.ones(10**12, chunks=10**8)
+    ds = xr.Dataset({'foo': ('x', array)})
+    assert tokenize(ds) == tokenize(xr.Dataset({'foo': ('x', dask.ones(10**12, chunks=10**8))}))
+    assert tokenize(ds) != tokenize(ds + 1)
+
+
+def test_tokenize_non_contiguous():
+    array = np.arange(100.0).reshape(10, 10)
+    assert tokenize(array[:, ::2]) == tokenize(np.ascontiguousarray(array[:, ::2]))
+    assert tokenize(array.T) != tokenize(array)
+
+
+def test_tokenize_sampling(monkeypatch):
+    import xpersist.tokenize
+
+    array = np.arange(10_000.0)
+    full = tokenize(array)
+    monkeypatch.setattr(xpersist.tokenize, 'SAMPLE_THRESHOLD_BYTES', 1_000)
+    monkeypatch.setattr(xpersist.tokenize, 'SAMPLE_SIZE', 100)
+    sampled = tokenize(array)
+    assert sampled != full
+    assert sampled == tokenize(np.arange(10_000.0))
+
+
+def test_tokenize_identity_cache(monkeypatch):
+    import xpersist.tokenize
+
+    monkeypatch.setattr(xpersist.tokenize, 'IDENTITY_CACHE_MIN_BYTES', 0)
+    # Writeable arrays are hashed again, so in-place changes are detected
+    array = np.arange(10.0)
+    token = tokenize(array)
+    array[0] = 1
+    assert tokenize(array) != token
+
+    array.setflags(write=False)
+    token = tokenize(array)
+    view = array[2:]
+    tokenize(view)
+    assert {id(array), id(view)} <= set(xpersist.tokenize._identity_cache)
+    array.setflags(write=True)
+    array[0] = 2
+    array.setflags(write=False)
+    assert tokenize(array) == token
+    xpersist.tokenize.clear_identity_cache()
+    assert tokenize(array) != token
+
+    # Read-only views of writeable arrays are not memoized
+    base = np.arange(10.0)
+    view = base[:]
+    view.setflags(write=False)
+    token = tokenize(view)
+    base[0] = 1
+    assert tokenize(view) != token
+
+
+def test_tokenize_collection():
+    collection = xc.Collection({'foo': _dataset([1, 2]), 'bar': _dataset([3, 4])})
+    other = xc.Collection({'foo': _dataset([1, 2]), 'bar': _dataset([3, 5])})
+    assert tokenize(collection) != tokenize(other)
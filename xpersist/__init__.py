@@ -1,14 +1,30 @@
 #!/usr/bin/env python3
 # flake8: noqa
 """ Top-level module for xpersist. """
-from pkg_resources import DistributionNotFound, get_distribution
-
-from .cache import CacheStore
-from .prefect import XpersistResult
+from . import _lazy
 from .registry import registry
-from .serializers import pick_serializer
+
+# Submodules are imported on first access, so that `import xpersist` does not import
+# xarray, pandas or prefect
+__getattr__ = _lazy.module_getattr(
+    __name__,
+    {
+        'CacheStore': 'xpersist.cache',
+        'XpersistResult': 'xpersist.prefect',
+        'pick_serializer': 'xpersist.serializers',
+    },
+)
+
+try:
+    from importlib.metadata import PackageNotFoundError, version
+except ImportError:  # pragma: no cover
+    from pkg_resources import DistributionNotFound as PackageNotFoundError, get_distribution
+
+    def version(name: str) -> str:
+        return get_distribution(name).version
+
 
 try:
-    __version__ = get_distribution('xpersist').version
-except DistributionNotFound:  # pragma: no cover
+    __version__ = version('xpersist')
+except PackageNotFoundError:  # pragma: no cover
     __version__ = 'unknown'  # pragma: no cover
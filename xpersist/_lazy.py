@@ -0,0 +1,75 @@
+"""Helpers deferring the import of heavy libraries (xarray, pandas, ...) until they are needed."""
+import functools
+import importlib
+import sys
+import threading
+import typing
+
+
+def singledispatch(func: typing.Callable) -> typing.Callable:
+    """Like :py:func:`functools.singledispatch`, with lazily registered implementations.
+
+    ``@func.register_lazy('xarray')`` decorates a function registering the implementations
+    for the types of a library. It is called on the first dispatch after the library was
+    imported (by anyone), so the library is never imported just to register them: an
+    object of one of its types cannot exist before.
+    """
+    dispatcher = functools.singledispatch(func)
+    pending: typing.Dict[str, typing.Callable[[], None]] = {}
+    lock = threading.Lock()
+
+    def register_lazy(module: str) -> typing.Callable:
+        def decorator(register: typing.Callable[[], None]) -> typing.Callable[[], None]:
+            pending[module] = register
+            return register
+
+        return decorator
+
+    def dispatch(cls: type) -> typing.Callable:
+        if pending and any(module in sys.modules for module in tuple(pending)):
+            with lock:
+                for module in [module for module in pending if module in sys.modules]:
+                    pending.pop(module)()
+        return dispatcher.dispatch(cls)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        return dispatch(args[0].__class__)(*args, **kwargs)
+
+    wrapper.register = dispatcher.register
+    wrapper.register_lazy = register_lazy
+    wrapper.dispatch = dispatch
+    wrapper.registry = dispatcher.registry
+    return wrapper
+
+
+def isinstance_of(obj: typing.Any, module: str, *names: str) -> bool:
+    """Returns True if `obj` is an instance of one of the classes `names` of `module`.
+
+    The module is not imported: if it was not imported yet, no object can be an instance.
+    """
+    if module not in sys.modules:
+        return False
+    classes = tuple(getattr(sys.modules[module], name) for name in names)
+    return isinstance(obj, classes)
+
+
+def module_getattr(module_name: str, attributes: typing.Dict[str, str]) -> typing.Callable:
+    """Returns a module-level ``__getattr__`` importing `attributes` from submodules on access.
+
+    Parameters
+    ----------
+    module_name : str
+        The ``__name__`` of the module defining ``__getattr__``.
+    attributes : dict
+        Mapping of each attribute to the (absolute) name of the module it is imported from.
+    """
+
+    def __getattr__(name: str) -> typing.Any:
+        if name not in attributes:
+            raise AttributeError(f'module {module_name!r} has no attribute {name!r}')
+        value = getattr(importlib.import_module(attributes[name]), name)
+        setattr(sys.modules[module_name], name, value)
+        return value
+
+    return __getattr__
@@ -0,0 +1,238 @@
+import asyncio
+import concurrent.futures
+import datetime
+import functools
+import json
+import typing
+
+from fsspec.asyn import AsyncFileSystem
+
+from .cache import (
+    Artifact,
+    CacheStore,
+    DuplicateKeyEnum,
+    _expired,
+    _expired_record,
+    _in_file,
+    _live,
+)
+from .metadata import SidecarMetadataStore
+from .serializers import Compression, Selection
+
+
+class AsyncCacheStore:
+    """An asyncio interface to a :py:class:`xpersist.cache.CacheStore`.
+
+    When the cache store lives on an asynchronous fsspec file-system (s3fs, gcsfs,
+    http, ...) and uses the `sidecar` metadata store, metadata lookups and writes are
+    awaited directly on the file-system, so thousands of lookups can run concurrently on
+    a single event loop. Everything else, including all serializer work (which is
+    blocking and often CPU-bound), runs in an executor. When `locking` is enabled on the
+    cache store, puts run in the executor as a whole, under the lock of their key.
+
+    Parameters
+    ----------
+    store : CacheStore
+        The cache store to wrap.
+    executor : concurrent.futures.Executor
+        The executor used for blocking work. If None, the event loop's default
+        executor is used.
+
+    Examples
+    --------
+    >>> from xpersist import CacheStore
+    >>> from xpersist.aio import AsyncCacheStore
+    >>> store = AsyncCacheStore(CacheStore("/tmp/my-cache"))
+    >>> await store.aput("foo", [1, 2, 3])
+    >>> await store.aget("foo")
+    [1, 2, 3]
+    """
+
+    def __init__(self, store: CacheStore, executor: concurrent.futures.Executor = None):
+        self.store = store
+        self.executor = executor
+        self._fs = None
+        self._loop = None
+
+    def _async_fs(self) -> typing.Optional[AsyncFileSystem]:
+        """Returns an asynchronous instance of the store's file-system bound to the running loop."""
+        if not isinstance(self.store.metadata, SidecarMetadataStore):
+            return None
+        if not getattr(self.store.mapper.fs, 'async_impl', False):
+            return None
+        loop = asyncio.get_running_loop()
+        if self._fs is None or self._loop is not loop:
+            self._fs = type(self.store.mapper.fs)(
+                asynchronous=True, loop=loop, **self.store.storage_options
+            )
+            self._loop = loop
+        return self._fs
+
+    def _record_path(self, key: str) -> str:
+        return self.store.mapper.fs._strip_protocol(self.store.metadata._record_path(key))
+
+    async def _run(self, func: typing.Callable, *args, **kwargs) -> typing.Any:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def acontains(self, key: str) -> bool:
+        """Returns True if the key is in the cache store."""
+        try:
+            await self.aget_artifact(key)
+        except KeyError:
+            return False
+        return True
+
+    async def akeys(self) -> typing.List[str]:
+        """Returns a list of keys in the cache store."""
+        fs = self._async_fs()
+        if fs is None:
+            return await self._run(self.store.keys)
+        metadata = self.store.metadata
+        paths = [
+            path
+            for path in await fs._find(fs._strip_protocol(metadata.path))
+            if path.endswith(metadata.suffix)
+        ]
+        if self.store.ttl is None:
+            # As in `CacheStore.keys`, sidecars are only read for expiry if the store has a ttl
+            return [metadata._key_from_path(path) for path in paths]
+        contents = await fs._cat(paths, on_error='omit') if paths else {}
+        now = datetime.datetime.utcnow()
+        return [
+            metadata._key_from_path(path)
+            for path in paths
+            if path in contents and not _expired_record(json.loads(contents[path]), now)
+        ]
+
+    async def _aget_record(self, key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Returns the metadata record of the key, or None if the key is missing."""
+        fs = self._async_fs()
+        if fs is None:
+            return await self._run(self.store._get_record, key)
+        try:
+            return json.loads(await fs._cat_file(self._record_path(key)))
+        except FileNotFoundError:
+            return None
+
+    async def aget_artifact(self, key: str) -> Artifact:
+        """Returns the artifact corresponding to the key.
+
+        Raises
+        ------
+        KeyError
+            If the key is not in the cache store.
+        """
+        fs = self._async_fs()
+        if fs is None:
+            return await self._run(self.store.get_artifact, key)
+        record = await self._aget_record(key)
+        if record is None:
+            raise KeyError(f'{key} not found in cache store: {self.store._metadata_store_path}')
+        artifact = Artifact(**record)
+        if _expired(artifact):
+            raise KeyError(f'{key} expired at {artifact.expires_at} in cache store')
+        return artifact
+
+    async def aget(
+        self,
+        key: str,
+        serializer: str = None,
+        load_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        variables: typing.List[str] = None,
+        sel: typing.Dict[str, typing.Any] = None,
+        columns: typing.List[str] = None,
+        filters: typing.List[typing.Any] = None,
+    ) -> typing.Any:
+        """Returns the value for the key if the key is in the cache store.
+
+        See :py:meth:`xpersist.cache.CacheStore.get` for a description of the parameters.
+        """
+        selection = Selection(variables=variables, sel=sel, columns=columns, filters=filters)
+        selection = selection if any(value is not None for _, value in selection) else None
+        memory_cache = self.store.memory_cache
+        use_memory_cache = (
+            memory_cache is not None and not serializer and not load_kwargs and not selection
+        )
+        if use_memory_cache:
+            try:
+                return memory_cache.get(key)
+            except KeyError:
+                pass
+        artifact = await self.aget_artifact(key)
+        try:
+            value = await self._run(self.store._load, artifact, serializer, load_kwargs, selection)
+        except ValueError:
+            # The record may be stale, see :py:meth:`xpersist.cache.CacheStore.get`
+            await self._run(self.store.metadata.refresh)
+            fresh = await self.aget_artifact(key)
+            if fresh == artifact:
+                raise
+            artifact = fresh
+            value = await self._run(self.store._load, artifact, serializer, load_kwargs, selection)
+        if self.store._tracks_access():
+            await self._run(self.store._record_access, [artifact])
+        if use_memory_cache and artifact.expires_at is None:
+            memory_cache.put(key, value)
+        return value
+
+    async def aget_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+        """Returns the values for several keys, fetched concurrently."""
+        keys = list(dict.fromkeys(keys))
+        values = await asyncio.gather(*(self.aget(key) for key in keys))
+        return dict(zip(keys, values))
+
+    async def aput(
+        self,
+        key: str,
+        value: typing.Any,
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+    ) -> typing.Any:
+        """Records and serializes key with its corresponding value in the cache store.
+
+        See :py:meth:`xpersist.cache.CacheStore.put` for a description of the parameters.
+        """
+        store = self.store
+        if store.readonly:
+            return None
+        artifact = store._build_artifact(
+            key, value, serializer, dump_kwargs, additional_metadata, compression, ttl
+        )
+        if store.locking:
+            # The record is read and replaced under the lock of the key, like in `put`
+            await self._run(getattr(store, f'_put_{store.on_duplicate_key.value}'), artifact)
+            return value
+        previous = await self._aget_record(key)
+        if store.on_duplicate_key != DuplicateKeyEnum.overwrite and _live(previous):
+            if store.on_duplicate_key == DuplicateKeyEnum.raise_error:
+                raise ValueError(f'Key {key} already in cache store')
+            return value
+        try:
+            await self._run(store._dump, artifact, replaces=previous is not None)
+            record = json.loads(artifact.json())
+            fs = self._async_fs()
+            if fs is None:
+                await self._run(store.metadata.put, key, record)
+            else:
+                await fs._pipe_file(self._record_path(key), json.dumps(record, indent=2).encode())
+        finally:
+            store._invalidate(key)
+        if previous is not None and not _in_file(artifact.dict()):
+            await self._run(store._remove_replaced_files, [artifact], {key: previous})
+        if artifact._reused_blob:
+            await self._run(store._restore_blobs, [artifact])
+        if previous is not None and previous.get('blob') not in (None, artifact.blob):
+            await self._run(store._collect_blobs, [previous['blob']])
+        if store.max_bytes is not None or store.max_items is not None:
+            await self._run(
+                store._ensure_capacity, artifact.nbytes_on_disk or 0, 1, keep=[artifact.key]
+            )
+        return value
+
+    async def adelete(self, key: str) -> None:
+        """Deletes the key and corresponding artifact from the cache store."""
+        await self._run(self.store.delete, key, dry_run=False)
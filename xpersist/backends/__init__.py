@@ -0,0 +1,8 @@
+"""Implementations of the built-in serializers.
+
+Each module imports the libraries of its serializers, and is only imported once one of
+these serializers is resolved from :py:data:`xpersist.registry.registry.serializers`.
+
+Serializers write with autocommit=True since the file-system instance they get may be the
+one of a cache store, whose transactions would otherwise defer their writes.
+"""
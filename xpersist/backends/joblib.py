@@ -0,0 +1,96 @@
+"""Helpers of the joblib serializers (`joblib`, `joblib.frames`)."""
+import io
+import typing
+
+import fsspec
+import joblib as _joblib
+
+from ..serializers import Compression, _unsupported_codec
+
+
+def joblib_compression(compression: Compression, value: typing.Any) -> typing.Dict:
+    codecs = {'gzip', 'lz4'}
+    if compression.codec.value not in codecs:
+        raise _unsupported_codec('joblib', compression, codecs)
+    level = 3 if compression.level is None else compression.level
+    return {'compress': (compression.codec.value, level)}
+
+
+def dumps(value: typing.Any, **kwargs) -> bytes:
+    buffer = io.BytesIO()
+    _joblib.dump(value, buffer, **kwargs)
+    return buffer.getvalue()
+
+
+def loads(data: bytes, **kwargs) -> typing.Any:
+    return _joblib.load(io.BytesIO(data), **kwargs)
+
+
+FRAME_SIZE = 1024
+
+
+def frame_path(path: str, index: int) -> str:
+    return f'{path}/frame-{index:08d}.joblib'
+
+
+def dump_joblib_frames_iter(
+    records: typing.Iterable,
+    path: str,
+    dim: str = None,
+    batch_size: int = None,
+    compression: Compression = None,
+    **kwargs,
+) -> None:
+    """Writes a sequence of records as joblib frames of `batch_size` records each."""
+    if compression is not None:
+        kwargs = {**joblib_compression(compression, None), **kwargs}
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    if fs.exists(raw_path):
+        fs.rm(raw_path, recursive=True)
+    fs.makedirs(raw_path, exist_ok=True)
+
+    def write(index: int, frame: typing.List) -> None:
+        with fs.open(frame_path(raw_path, index), 'wb', autocommit=True) as fobj:
+            _joblib.dump(frame, fobj, **kwargs)
+
+    frame, index = [], 0
+    for record in records:
+        frame.append(record)
+        if len(frame) == (batch_size or FRAME_SIZE):
+            write(index, frame)
+            frame, index = [], index + 1
+    if frame or index == 0:
+        write(index, frame)
+
+
+def load_joblib_frames_iter(
+    path: str, dim: str = None, batch_size: int = None, **kwargs
+) -> typing.Iterator[typing.List]:
+    """Loads joblib frames one at a time, yielding lists of at most `batch_size` records.
+
+    By default, the lists are the frames as they were written.
+    """
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    pending = []
+    for frame_path in sorted(fs.glob(f'{raw_path}/frame-*.joblib')):
+        with fs.open(frame_path, 'rb') as fobj:
+            frame = _joblib.load(fobj, **kwargs)
+        if batch_size is None:
+            yield frame
+            continue
+        pending.extend(frame)
+        while len(pending) >= batch_size:
+            yield pending[:batch_size]
+            pending = pending[batch_size:]
+    if pending:
+        yield pending
+
+
+def dump_joblib_frames(records: typing.Iterable, path: str, **kwargs) -> None:
+    """Writes a sequence of records into the directory `path` as joblib frames of 1024 records."""
+    dump_joblib_frames_iter(records, path, **kwargs)
+
+
+def load_joblib_frames(path: str, **kwargs) -> typing.List:
+    """Loads all the records written by :py:func:`dump_joblib_frames` as a list."""
+    return [record for frame in load_joblib_frames_iter(path, **kwargs) for record in frame]
@@ -0,0 +1,174 @@
+"""Memory-mapped serializers (`numpy.mmap`, `xarray.mmap`)."""
+import json
+import typing
+
+import fsspec
+import numpy as np
+from fsspec.implementations.local import LocalFileSystem
+
+from .. import _lazy
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import xarray as xr
+
+
+MMAP_FORMAT = 'xpersist.mmap'
+MMAP_HEADER = 'header.json'
+MMAP_CHUNK_BYTES = 1 << 26
+
+
+def local_fs(path: str) -> typing.Tuple[fsspec.AbstractFileSystem, str]:
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    if not isinstance(fs, LocalFileSystem):
+        raise ValueError(
+            f'Memory-mapped artifacts can only be loaded from a local path, not {path}. '
+            'Use the `local_cache_dir` option of CacheStore to load them from a remote cache store.'
+        )
+    return fs, raw_path
+
+
+def jsonable(value: typing.Any) -> typing.Any:
+    if isinstance(value, dict):
+        return {str(key): jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [jsonable(item) for item in value]
+    if isinstance(value, (np.ndarray, np.generic)):
+        return value.tolist()
+    return value
+
+
+def row_slices(arr: typing.Any) -> typing.Iterator[slice]:
+    """Yields slices along the first axis covering the array, so that a dask array is
+    computed one chunk of rows at a time."""
+    if _lazy.isinstance_of(arr, 'dask.array', 'Array'):
+        start = 0
+        for size in arr.chunks[0]:
+            yield slice(start, start + size)
+            start += size
+        return
+    step = max(1, MMAP_CHUNK_BYTES // max(1, arr[:1].nbytes))
+    for start in range(0, arr.shape[0], step):
+        yield slice(start, start + step)
+
+
+def write_raw_array(fs: fsspec.AbstractFileSystem, path: str, arr: typing.Any) -> None:
+    if arr.dtype.hasobject:
+        raise ValueError(
+            f'Memory-mapped artifacts only support fixed-size dtypes, got {arr.dtype} instead.'
+        )
+    with fs.open(path, 'wb', autocommit=True) as fobj:
+        if arr.ndim == 0:
+            fobj.write(np.asarray(arr).tobytes())
+            return
+        for rows in row_slices(arr):
+            fobj.write(np.ascontiguousarray(arr[rows]).tobytes())
+
+
+def read_raw_array(path: str, dtype: str, shape: typing.List[int], mode: str) -> np.ndarray:
+    if 0 in shape:
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=np.dtype(dtype), mode=mode, shape=tuple(shape))
+
+
+def dump_header(fs: fsspec.AbstractFileSystem, path: str, header: typing.Dict) -> None:
+    with fs.open(f'{path}/{MMAP_HEADER}', 'w', autocommit=True) as fobj:
+        json.dump(dict(header, format=MMAP_FORMAT, version=1), fobj)
+
+
+def load_header(path: str) -> typing.Tuple[str, typing.Dict]:
+    fs, raw_path = local_fs(path)
+    with fs.open(f'{raw_path}/{MMAP_HEADER}') as fobj:
+        header = json.load(fobj)
+    if header.get('format') != MMAP_FORMAT:
+        raise ValueError(f'{path} is not a memory-mapped xpersist artifact.')
+    return raw_path, header
+
+
+def dump_numpy_mmap(arr: np.ndarray, path: str) -> None:
+    """Writes an array as a raw binary file plus a JSON header into the directory `path`."""
+    arr = np.asarray(arr)
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    fs.makedirs(raw_path, exist_ok=True)
+    write_raw_array(fs, f'{raw_path}/data.bin', arr)
+    dump_header(fs, raw_path, {'dtype': arr.dtype.str, 'shape': list(arr.shape)})
+
+
+def load_numpy_mmap(path: str, mode: str = 'c') -> np.ndarray:
+    """Opens an array written by :py:func:`dump_numpy_mmap` as a :py:class:`numpy.memmap`.
+
+    Parameters
+    ----------
+    path : str
+        Local path of the artifact.
+    mode : str
+        The :py:class:`numpy.memmap` mode. The default, 'c' (copy-on-write), allows
+        in-memory modifications that are never written back to the artifact.
+    """
+    raw_path, header = load_header(path)
+    return read_raw_array(f'{raw_path}/data.bin', header['dtype'], header['shape'], mode)
+
+
+def dump_xarray_mmap(obj: typing.Union['xr.Dataset', 'xr.DataArray'], path: str) -> None:
+    """Writes every variable of a Dataset or DataArray as a raw binary file plus a JSON header
+    describing dimensions, coordinates and attributes into the directory `path`."""
+    import xarray as xr
+
+    is_dataarray, name = isinstance(obj, xr.DataArray), None
+    if is_dataarray:
+        name = obj.name
+        obj = obj.to_dataset(name='__xpersist_dataarray__')
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    fs.makedirs(raw_path, exist_ok=True)
+    variables = {}
+    for index, (var_name, variable) in enumerate(obj.variables.items()):
+        # Dask-backed variables are written one chunk at a time rather than loaded at once
+        values = variable.data if variable.chunks is not None else np.asarray(variable.values)
+        filename = f'{index}.bin'
+        write_raw_array(fs, f'{raw_path}/{filename}', values)
+        variables[str(var_name)] = {
+            'file': filename,
+            'dims': list(variable.dims),
+            'dtype': values.dtype.str,
+            'shape': list(values.shape),
+            'attrs': jsonable(variable.attrs),
+        }
+    header = {
+        'variables': variables,
+        'coords': [str(coord) for coord in obj.coords],
+        'attrs': jsonable(obj.attrs),
+        'dataarray': is_dataarray,
+        'dataarray_name': name,
+    }
+    dump_header(fs, raw_path, header)
+
+
+def load_xarray_mmap(path: str, mode: str = 'c') -> typing.Union['xr.Dataset', 'xr.DataArray']:
+    """Opens a Dataset or DataArray written by :py:func:`dump_xarray_mmap`.
+
+    Every variable wraps a :py:class:`numpy.memmap`, so opening is instant regardless of
+    the size of the artifact and only the pages that are accessed are read from disk.
+
+    Parameters
+    ----------
+    path : str
+        Local path of the artifact.
+    mode : str
+        The :py:class:`numpy.memmap` mode. The default, 'c' (copy-on-write), allows
+        in-memory modifications that are never written back to the artifact.
+    """
+    import xarray as xr
+
+    raw_path, header = load_header(path)
+    variables = {
+        name: xr.Variable(
+            spec['dims'],
+            read_raw_array(f"{raw_path}/{spec['file']}", spec['dtype'], spec['shape'], mode),
+            attrs=spec['attrs'],
+        )
+        for name, spec in header['variables'].items()
+    }
+    coords = {name: variables.pop(name) for name in header['coords']}
+    ds = xr.Dataset(variables, coords=coords, attrs=header['attrs'])
+    if header['dataarray']:
+        return ds['__xpersist_dataarray__'].rename(header['dataarray_name'])
+    return ds
@@ -0,0 +1,61 @@
+"""Helpers of the `msgpack` serializer, which stores small values inline in their metadata record."""
+import typing
+
+import fsspec
+import msgpack
+
+# Types that msgpack round-trips exactly (tuples, for instance, come back as lists)
+SMALL_OBJECT_TYPES = (type(None), bool, int, float, str, bytes)
+
+
+def packb(value: typing.Any, **kwargs) -> bytes:
+    return msgpack.packb(value, use_bin_type=True, **kwargs)
+
+
+def unpackb(data: bytes, **kwargs) -> typing.Any:
+    return msgpack.unpackb(data, raw=False, strict_map_key=False, **kwargs)
+
+
+def dump_msgpack(value: typing.Any, path: str, **kwargs) -> None:
+    with fsspec.open(path, 'wb', autocommit=True) as fobj:
+        fobj.write(packb(value, **kwargs))
+
+
+def load_msgpack(path: str, **kwargs) -> typing.Any:
+    with fsspec.open(path, 'rb') as fobj:
+        return unpackb(fobj.read(), **kwargs)
+
+
+def _walk(value: typing.Any, budget: int) -> int:
+    """Returns the budget left after visiting the value, or -1 if it is not a small object."""
+    budget -= 1
+    if budget < 0:
+        return -1
+    if type(value) in SMALL_OBJECT_TYPES:
+        return budget
+    if type(value) is list:
+        items = value
+    elif type(value) is dict:
+        items = [item for pair in value.items() for item in pair]
+    else:
+        return -1
+    for item in items:
+        budget = _walk(item, budget)
+        if budget < 0:
+            return -1
+    return budget
+
+
+def is_small_object(value: typing.Any, max_bytes: int) -> bool:
+    """Returns True if the value round-trips through msgpack and packs to at most `max_bytes`.
+
+    Every item packs to at least one byte, so values with more than `max_bytes` items are
+    rejected without being packed.
+    """
+    if _walk(value, max_bytes) < 0:
+        return False
+    try:
+        return len(packb(value)) <= max_bytes
+    except (OverflowError, TypeError, ValueError):
+        # e.g. integers beyond 64 bits
+        return False
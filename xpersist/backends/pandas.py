@@ -0,0 +1,161 @@
+"""Helpers of the pandas serializers (`pandas.csv`, `pandas.parquet`)."""
+import functools
+import importlib.util
+import time
+import typing
+import uuid
+
+import fsspec
+import pandas as pd
+
+from ..serializers import Compression, CompressionCodecEnum, Selection, _unsupported_codec
+
+
+def csv_compression_load(compression: Compression) -> typing.Dict:
+    codecs = {'gzip', 'zstd'}
+    if compression.codec.value not in codecs:
+        raise _unsupported_codec('pandas.csv', compression, codecs)
+    return {'compression': {'method': compression.codec.value}}
+
+
+def csv_compression(compression: Compression, value: typing.Any) -> typing.Dict:
+    kwargs = csv_compression_load(compression)
+    if compression.level is not None:
+        level = 'compresslevel' if compression.codec == CompressionCodecEnum.gzip else 'level'
+        kwargs['compression'][level] = compression.level
+    return kwargs
+
+
+def load_csv_subset(path: str, selection: Selection, **kwargs) -> pd.DataFrame:
+    return pd.read_csv(path, usecols=selection.columns, **kwargs)
+
+
+@functools.lru_cache(maxsize=None)
+def has_pyarrow() -> bool:
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def require_pyarrow(feature: str) -> None:
+    """Raises an ImportError if pyarrow, which `feature` needs, is not installed.
+
+    fastparquet can read and write whole parquet artifacts, but only pyarrow writes and
+    reads them incrementally, sets compression levels and filters rows.
+    """
+    if not has_pyarrow():
+        raise ImportError(
+            f'{feature} of pandas.parquet artifacts require pyarrow, which is not installed'
+        )
+
+
+def parquet_compression(compression: Compression, value: typing.Any) -> typing.Dict:
+    codecs = {'gzip', 'lz4', 'zstd'}
+    if compression.codec.value not in codecs:
+        raise _unsupported_codec('pandas.parquet', compression, codecs)
+    kwargs = {'compression': compression.codec.value}
+    if compression.level is not None:
+        require_pyarrow('Compression levels')
+        kwargs['compression_level'] = compression.level
+    return kwargs
+
+
+def load_parquet_subset(path: str, selection: Selection, **kwargs) -> pd.DataFrame:
+    """Reads a parquet artifact with column projection and row-group predicate filters."""
+    if selection.filters is not None:
+        require_pyarrow('Row filters')
+    return pd.read_parquet(path, columns=selection.columns, filters=selection.filters, **kwargs)
+
+
+def parquet_part() -> str:
+    # Parts sort in the order they were written
+    return f'part-{time.time_ns():020d}-{uuid.uuid4().hex[:8]}.parquet'
+
+
+def append_parquet(
+    value: pd.DataFrame, path: str, dim: str = None, compression: Compression = None, **kwargs
+) -> None:
+    """Writes the rows of a DataFrame as a new part of a parquet artifact.
+
+    A single-file artifact is moved into a directory of parts on its first append.
+    """
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    if fs.isfile(raw_path):
+        staging_path = f'{raw_path}.xpersist-append'
+        fs.mv(raw_path, staging_path)
+        fs.makedirs(raw_path, exist_ok=True)
+        fs.mv(staging_path, f'{raw_path}/{parquet_part()}')
+    if compression is not None:
+        kwargs = {**parquet_compression(compression, value), **kwargs}
+    with fs.open(f'{raw_path}/{parquet_part()}', 'wb', autocommit=True) as fobj:
+        value.to_parquet(fobj, **kwargs)
+
+
+def dump_parquet_iter(
+    batches: typing.Iterable[pd.DataFrame],
+    path: str,
+    dim: str = None,
+    batch_size: int = None,
+    compression: Compression = None,
+    **kwargs,
+) -> None:
+    """Writes a sequence of DataFrames as the row groups of a single parquet file."""
+    require_pyarrow('Streaming writes')
+    import pyarrow
+    import pyarrow.parquet
+
+    if compression is not None:
+        kwargs = {**parquet_compression(compression, None), **kwargs}
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    writer, preserve_index = None, None
+    with fs.open(raw_path, 'wb', autocommit=True) as fobj:
+        try:
+            for batch in batches:
+                if writer is None:
+                    # Default RangeIndexes of the batches are not meaningful once concatenated
+                    preserve_index = not isinstance(batch.index, pd.RangeIndex)
+                table = pyarrow.Table.from_pandas(batch, preserve_index=preserve_index)
+                if writer is None:
+                    writer = pyarrow.parquet.ParquetWriter(fobj, table.schema, **kwargs)
+                writer.write_table(table, row_group_size=batch_size)
+        finally:
+            if writer is not None:
+                writer.close()
+    if writer is None:
+        raise ValueError('Unable to write an empty sequence of DataFrames to parquet')
+
+
+def load_parquet_iter(
+    path: str, dim: str = None, batch_size: int = None, **kwargs
+) -> typing.Iterator[pd.DataFrame]:
+    """Reads a parquet artifact (a file or a directory of parts) one record batch at a time."""
+    require_pyarrow('Streaming reads')
+    import pyarrow.dataset
+
+    fs, raw_path = fsspec.core.url_to_fs(path)
+    dataset = pyarrow.dataset.dataset(raw_path, filesystem=fs, format='parquet')
+    if batch_size is not None:
+        kwargs['batch_size'] = batch_size
+    for batch in dataset.to_batches(**kwargs):
+        yield batch.to_pandas()
+
+
+PARQUET_OBJECT_TYPES = {'empty', 'string', 'bytes', 'boolean', 'date', 'decimal'}
+
+
+@functools.lru_cache(maxsize=None)
+def has_parquet_engine() -> bool:
+    try:
+        pd.io.parquet.get_engine('auto')
+    except ImportError:
+        return False
+    return True
+
+
+def supports_parquet(obj: pd.DataFrame) -> bool:
+    if not has_parquet_engine() or isinstance(obj.columns, pd.MultiIndex):
+        return False
+    if not all(isinstance(name, str) for name in obj.columns):
+        return False
+    return all(
+        pd.api.types.infer_dtype(column, skipna=True) in PARQUET_OBJECT_TYPES
+        for _, column in obj.select_dtypes(include='object').items()
+    )
@@ -0,0 +1,100 @@
+"""Helpers of the xarray serializers (`xarray.zarr`, `xarray.netcdf`)."""
+import typing
+
+import xarray as xr
+
+from ..serializers import Compression, CompressionCodecEnum, Selection, _unsupported_codec
+
+
+def load_subset(
+    load: typing.Callable, path: str, selection: Selection, **kwargs
+) -> typing.Union[xr.Dataset, xr.DataArray]:
+    """Opens an xarray artifact lazily and selects variables and labels before any data is read."""
+    obj = load(path, **kwargs)
+    if selection.variables is not None:
+        obj = obj[selection.variables]
+    if selection.sel:
+        obj = obj.sel(selection.sel)
+    return obj
+
+
+def compressible_variables(value: typing.Any) -> typing.List[typing.Hashable]:
+    if not isinstance(value, xr.Dataset):
+        raise ValueError(f'Unable to compress value of type {type(value)!r}')
+    return [name for name, variable in value.variables.items() if variable.dtype.kind in 'biufcmM']
+
+
+def zarr_compression(compression: Compression, value: typing.Any) -> typing.Dict:
+    import numcodecs
+
+    level = {} if compression.level is None else {'clevel': compression.level}
+    if compression.codec == CompressionCodecEnum.gzip:
+        compressor = numcodecs.GZip(
+            **({} if compression.level is None else {'level': compression.level})
+        )
+    elif compression.codec == CompressionCodecEnum.blosc:
+        compressor = numcodecs.Blosc(**level)
+    else:
+        compressor = numcodecs.Blosc(cname=compression.codec.value, **level)
+    return {
+        'encoding': {name: {'compressor': compressor} for name in compressible_variables(value)}
+    }
+
+
+def netcdf_compression(compression: Compression, value: typing.Any) -> typing.Dict:
+    if compression.codec != CompressionCodecEnum.gzip:
+        raise _unsupported_codec('xarray.netcdf', compression, {'gzip'})
+    encoding = {'zlib': True}
+    if compression.level is not None:
+        encoding['complevel'] = compression.level
+    return {'encoding': {name: dict(encoding) for name in compressible_variables(value)}}
+
+
+def append_zarr(
+    value: xr.Dataset, path: str, dim: str = None, compression: Compression = None, **kwargs
+) -> None:
+    # Existing arrays keep the compressor they were created with
+    if dim is None:
+        raise ValueError('Appending to a zarr artifact requires the dimension to append along')
+    xr.backends.api.to_zarr(value, path, append_dim=dim, **kwargs)
+
+
+def dump_zarr_iter(
+    datasets: typing.Iterable[xr.Dataset],
+    path: str,
+    dim: str = None,
+    batch_size: int = None,
+    compression: Compression = None,
+    **kwargs,
+) -> None:
+    """Writes a sequence of Datasets as a single zarr artifact, concatenated along `dim`."""
+    if dim is None:
+        raise ValueError('Streaming Datasets requires the dimension to concatenate them along')
+    for index, ds in enumerate(datasets):
+        if index == 0:
+            first_kwargs = kwargs
+            if compression is not None:
+                first_kwargs = {**zarr_compression(compression, ds), **kwargs}
+            xr.backends.api.to_zarr(ds, path, mode='w', **first_kwargs)
+        else:
+            append_zarr(ds, path, dim, **kwargs)
+
+
+def load_zarr_iter(
+    path: str, dim: str = None, batch_size: int = None, **kwargs
+) -> typing.Iterator[xr.Dataset]:
+    """Loads a zarr artifact one batch of `batch_size` steps along `dim` at a time.
+
+    By default, batches follow the chunks stored along `dim`.
+    """
+    if dim is None:
+        raise ValueError('Iterating over a Dataset requires the dimension to iterate along')
+    ds = xr.open_zarr(path, **kwargs)
+    if batch_size is None:
+        sizes = ds.chunks.get(dim) or (ds.sizes[dim],)
+    else:
+        sizes = [batch_size] * -(-ds.sizes[dim] // batch_size)
+    start = 0
+    for size in sizes:
+        yield ds.isel({dim: slice(start, start + size)}).load()
+        start += size
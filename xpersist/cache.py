@@ -1,39 +1,260 @@
+import base64
+import collections
+import concurrent.futures
+import contextlib
 import datetime
 import enum
+import functools
+import hashlib
+import inspect
+import itertools
 import json
+import os
+import posixpath
+import re
 import tempfile
+import time
 import typing
+import uuid
 
 import fsspec
 import pydantic
 
+from . import _lazy
+from .disk import LocalDiskCache
+from .locks import Lock
+from .memory import MemoryCache, MemoryCachePolicyEnum, sizeof
+from .metadata import MetadataStore, _is_local
 from .registry import registry
-from .serializers import pick_serializer
+from .segments import SEGMENT_MIN_BYTES, SegmentStore
+from .serializers import (
+    Compression,
+    CompressionCodecEnum,
+    Selection,
+    Serializer,
+    SerializerPolicy,
+    get_serializer,
+    pick_serializer,
+)
+from .tokenize import tokenize, tokenize_function
 
 
 class Artifact(pydantic.BaseModel):
-    """A pydantic model for representing an artifact in the cache."""
+    """A pydantic model for representing an artifact in the cache.
+
+    Besides the serialization settings, artifacts record the size of the value in memory
+    (`nbytes_in_memory`, estimated with :py:func:`xpersist.memory.sizeof`) and on disk
+    (`nbytes_on_disk`), the SHA-256 `checksum` of the serialized data, the time taken to
+    serialize it (`dump_seconds`) and, if access tracking is enabled, when and how often it
+    was loaded (`last_accessed`, `access_count`).
+
+    Artifacts of serializers that support it (e.g. `msgpack`) hold their serialized data,
+    base64-encoded, in `inline_data` rather than in a separate file. Artifacts packed into a
+    segment file (see :py:class:`xpersist.segments.SegmentStore`) record the name of the
+    `segment` and the `offset` of their data, which is `nbytes_on_disk` long.
+    """
 
     key: str
     serializer: str
     load_kwargs: typing.Optional[typing.Dict] = pydantic.Field(default_factory=dict)
     dump_kwargs: typing.Optional[typing.Dict] = pydantic.Field(default_factory=dict)
     additional_metadata: typing.Optional[typing.Dict] = pydantic.Field(default_factory=dict)
+    blob: typing.Optional[str] = None
+    inline_data: typing.Optional[str] = None
+    segment: typing.Optional[str] = None
+    offset: typing.Optional[int] = None
+    compression: typing.Optional[Compression] = None
+    chunks: typing.Optional[typing.Dict[str, typing.Tuple[int, ...]]] = None
     created_at: typing.Optional[datetime.datetime] = pydantic.Field(
         default_factory=datetime.datetime.utcnow
     )
+    updated_at: typing.Optional[datetime.datetime] = None
+    expires_at: typing.Optional[datetime.datetime] = None
+    nbytes_on_disk: typing.Optional[int] = None
+    nbytes_in_memory: typing.Optional[int] = None
+    checksum: typing.Optional[str] = None
+    dump_seconds: typing.Optional[float] = None
+    last_accessed: typing.Optional[datetime.datetime] = None
+    access_count: int = 0
     _value: typing.Any = pydantic.PrivateAttr(default=None)
+    # Serialized data waiting to be packed into a segment
+    _data: typing.Optional[bytes] = pydantic.PrivateAttr(default=None)
+    # Whether the value was found already stored in a blob when the artifact was staged
+    _reused_blob: bool = pydantic.PrivateAttr(default=False)
 
     class Config:
         validate_assignment = True
 
 
+def _digest(path: str, fs: fsspec.AbstractFileSystem = None) -> str:
+    """Returns the SHA-256 digest of a file or directory tree (local unless `fs` is given)."""
+    fs = fs or fsspec.filesystem('file')
+    root = fs._strip_protocol(path)
+    if fs.isfile(root):
+        files = [(root, '')]
+    else:
+        files = sorted((name, posixpath.relpath(name, root)) for name in fs.find(root))
+    sha = hashlib.sha256()
+    for filename, relative_path in files:
+        sha.update(relative_path.encode())
+        with fs.open(filename, 'rb') as fobj:
+            for block in iter(lambda: fobj.read(1 << 20), b''):
+                sha.update(block)
+    return sha.hexdigest()
+
+
+def _dask_chunks(value: typing.Any) -> typing.Optional[typing.Dict[str, typing.Tuple[int, ...]]]:
+    """Returns the dask chunk sizes along each dimension of an xarray object, if it is dask-backed."""
+    if not _lazy.isinstance_of(value, 'xarray', 'Dataset', 'DataArray'):
+        return None
+    try:
+        chunks = value.chunksizes
+    except ValueError:
+        # Variables are chunked inconsistently along some dimension
+        return None
+    return {str(dim): tuple(int(size) for size in sizes) for dim, sizes in chunks.items()} or None
+
+
+def _merge_kwargs(base: typing.Dict, override: typing.Dict) -> typing.Dict:
+    """Merges two dicts of keyword arguments, recursively for nested dicts such as `encoding`."""
+    merged = dict(base)
+    for name, value in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(name), dict):
+            value = _merge_kwargs(merged[name], value)
+        merged[name] = value
+    return merged
+
+
+def _isoformat_utc(value: typing.Optional[datetime.datetime]) -> typing.Optional[str]:
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return value.isoformat()
+
+
+def _exact_type_check(annotation: typing.Any) -> typing.Optional[typing.Callable]:
+    """Returns a cheap check that a value needs no validation against the annotation, if any."""
+    if annotation in (inspect.Parameter.empty, typing.Any):
+        return lambda value: True
+    if getattr(annotation, '__origin__', None) is dict and all(
+        arg is typing.Any for arg in getattr(annotation, '__args__', ())
+    ):
+        return lambda value: type(value) is dict
+    if isinstance(annotation, type):
+        return lambda value: type(value) is annotation
+    return None
+
+
+def _validate_arguments(func: typing.Callable) -> typing.Callable:
+    """Like :py:func:`pydantic.validate_arguments`, with a fast path skipping validation.
+
+    Arguments are only validated (and coerced) by pydantic when one of them is neither its
+    default nor an instance of exactly its annotated class, e.g. a str key and a dict of
+    keyword arguments pass through as-is. Validation costs more than getting or putting a
+    small value, and most calls need none.
+    """
+    validated = pydantic.validate_arguments(func)
+    parameters = inspect.signature(func).parameters
+    positional = [
+        name
+        for name, parameter in parameters.items()
+        if parameter.kind in (parameter.POSITIONAL_ONLY, parameter.POSITIONAL_OR_KEYWORD)
+    ]
+    defaults = {name: parameter.default for name, parameter in parameters.items()}
+    checks = {
+        name: _exact_type_check(parameter.annotation) for name, parameter in parameters.items()
+    }
+    var_keyword = next(
+        (
+            checks[name]
+            for name, parameter in parameters.items()
+            if parameter.kind == parameter.VAR_KEYWORD
+        ),
+        None,
+    )
+
+    def needs_validation(name: str, value: typing.Any) -> bool:
+        if name not in checks:
+            return var_keyword is None or not var_keyword(value)
+        if value is defaults[name]:
+            return False
+        return checks[name] is None or not checks[name](value)
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if len(args) > len(positional) or any(
+            needs_validation(name, value)
+            for name, value in itertools.chain(zip(positional, args), kwargs.items())
+        ):
+            return validated(*args, **kwargs)
+        return func(*args, **kwargs)
+
+    wrapper.raw_function = func
+    return wrapper
+
+
 class DuplicateKeyEnum(str, enum.Enum):
     skip = 'skip'
     overwrite = 'overwrite'
     raise_error = 'raise_error'
 
 
+class EvictionPolicyEnum(str, enum.Enum):
+    lru = 'lru'
+    lfu = 'lfu'
+    fifo = 'fifo'
+
+
+def _expired(artifact: Artifact, now: datetime.datetime = None) -> bool:
+    if artifact.expires_at is None:
+        return False
+    return artifact.expires_at <= (now or datetime.datetime.utcnow())
+
+
+# Fields that change when an artifact is replaced or its data moved
+_VERSION_FIELDS = ('created_at', 'updated_at', 'blob', 'segment', 'offset')
+
+
+def _expired_record(record: typing.Dict[str, typing.Any], now: datetime.datetime) -> bool:
+    return record.get('expires_at') is not None and _expired(Artifact(**record), now)
+
+
+def _in_file(record: typing.Union[Artifact, typing.Dict[str, typing.Any]]) -> bool:
+    """Returns True if the artifact (or metadata record) is stored in its own file."""
+    if isinstance(record, Artifact):
+        record = record.dict(include={'blob', 'inline_data', 'segment'})
+    return not (record.get('blob') or record.get('inline_data') or record.get('segment'))
+
+
+def _dump_kwargs(artifact: Artifact, serializer: Serializer) -> typing.Dict[str, typing.Any]:
+    """Returns the dump kwargs of the artifact, including those of its compression."""
+    if artifact.compression is None:
+        return artifact.dump_kwargs
+    return _merge_kwargs(
+        serializer.compression_dump_kwargs(artifact.compression, artifact._value),
+        artifact.dump_kwargs,
+    )
+
+
+def _touch(fs: fsspec.AbstractFileSystem, path: str) -> None:
+    """Updates the modification time of the path, where the file-system supports it."""
+    try:
+        fs.touch(path, truncate=False)
+    except (NotImplementedError, OSError, ValueError):
+        pass
+
+
+def _live(record: typing.Optional[typing.Dict[str, typing.Any]]) -> bool:
+    """Returns True if the metadata record is a valid artifact that has not expired."""
+    if record is None:
+        return False
+    try:
+        return not _expired(Artifact(**record))
+    except (pydantic.ValidationError, TypeError):
+        return False
+
+
 @pydantic.dataclasses.dataclass
 class CacheStore:
     """Implements caching functionality using fsspec backends (local, s3fs, gcsfs, etc...).
@@ -57,47 +278,668 @@ class CacheStore:
         - 'skip' (default): do nothing
         - 'overwrite': overwrite the existing artifact
         - 'raise_error': raise an error if the key is already in the cache store
+    metadata_store : str
+        The name of the backend used to record artifact metadata. The built-in
+        metadata stores are:
+
+        - 'sidecar' (default): one JSON file per artifact
+        - 'sqlite': a single indexed SQLite database (local cache stores only)
+        - 'log': an append-only log plus a compacted snapshot, suited for object stores
+
+        You can also register your own metadata store via the @xpersist.registry.metadata_store.register decorator.
+    metadata_store_options : dict
+        Additional keyword arguments to pass to the metadata store.
+    memory_cache_bytes : int
+        Size budget (in bytes) of an in-process memory tier in front of :py:meth:`get`.
+        Loaded values are kept in memory and returned as-is by subsequent calls to
+        :py:meth:`get` for the same key. The tier is invalidated when this cache store
+        overwrites or deletes the key, but not when another process does. Defaults to
+        0, which disables the memory tier.
+    memory_cache_policy : MemoryCachePolicyEnum
+        The eviction policy of the memory tier. Valid options are:
+
+        - 'lru' (default): evict the least recently used value
+        - 'lfu': evict the least frequently used value
+    local_cache_dir : str
+        Local directory used as a read-through disk tier for remote cache stores
+        (e.g. on `s3://` or `gs://`). Artifacts are downloaded once into this directory
+        and loaded from the local copy until the remote artifact is overwritten. Several
+        processes on the same node can share the directory. Defaults to None, which
+        disables the disk tier.
+    local_cache_max_bytes : int
+        Upper bound on the size of `local_cache_dir`. Least recently used copies are
+        evicted once the bound is exceeded. If None, the directory is unbounded.
+    max_workers : int
+        Maximum number of threads used for serializer I/O by the batch methods
+        (:py:meth:`get_many`, :py:meth:`put_many`). If None, the default of
+        :py:class:`concurrent.futures.ThreadPoolExecutor` is used.
+    content_addressed : bool
+        If True, serialized artifacts are stored once under the SHA-256 digest of their
+        content in `xpersist_blobs/`, and keys point to these blobs through their metadata.
+        Writing a value whose serialized bytes are already stored skips the upload, and a
+        blob is deleted once no key refers to it anymore. Defaults to False.
+    serializer_policy : SerializerPolicy
+        The policy used to choose a serializer when putting values with ``serializer='auto'``
+        (e.g. parquet for DataFrames, zarr for large or dask-backed Datasets). Can be given
+        as a dict of :py:class:`xpersist.serializers.SerializerPolicy` fields to tune its
+        thresholds. If None, the default policy is used.
+    compression : Compression
+        Default compression of the artifacts, e.g. 'zstd', 'gzip:6' or
+        ``{'codec': 'lz4', 'level': 1}``. It is applied with each serializer's native
+        mechanism (joblib `compress`, netCDF and zarr variable `encoding`, parquet and CSV
+        `compression`) and recorded in the artifact, so loading needs no hints. Artifacts
+        whose serializer does not support the codec are written uncompressed. If None
+        (default), artifacts are not compressed.
+    locking : str
+        The name of the lock used to coordinate concurrent writers of the same key, so that
+        only one of them serializes the value. The built-in locks are:
+
+        - 'file': an advisory lock on a local lock file (local cache stores only)
+        - 'ttl': a lock file with a lease that expires, suited for object stores
+        - 'auto': 'file' for local cache stores, 'ttl' otherwise
+
+        You can also register your own lock via the @xpersist.registry.locks.register decorator.
+        Writes through :py:meth:`put` and :py:meth:`put_stream` hold the lock of their key.
+        If None (default), writes are not coordinated, while :py:meth:`get_or_compute`
+        still uses the 'auto' lock.
+    locking_options : dict
+        Additional keyword arguments to pass to the lock, e.g. ``{'ttl': 300}``.
+    max_bytes : int
+        Upper bound on the size of the artifacts in the cache store (content-addressed blobs
+        shared by several keys are counted once). Once a write exceeds it, expired artifacts
+        and then artifacts chosen by `eviction_policy` are deleted (see :py:meth:`evict`).
+        If None (default), the size is unbounded.
+    max_items : int
+        Upper bound on the number of keys in the cache store, enforced like `max_bytes`.
+        If None (default), the number of keys is unbounded.
+    eviction_policy : EvictionPolicyEnum
+        The artifacts deleted first when the cache store exceeds its bounds. Valid options are:
+
+        - 'lru' (default): the least recently accessed artifacts
+        - 'lfu': the least frequently accessed artifacts
+        - 'fifo': the oldest artifacts
+
+        With 'lru' and 'lfu' and a bound set, loading an artifact from the cache store
+        updates its `last_accessed` and `access_count` metadata (see `track_access`).
+    ttl : datetime.timedelta
+        Default time to live of the artifacts (or a number of seconds). Expired artifacts
+        are treated as missing and deleted by :py:meth:`prune`. If None (default),
+        artifacts do not expire.
+    track_access : bool
+        If True, loading an artifact from the cache store (memory-tier hits excluded)
+        updates its `last_accessed` and `access_count` metadata, at the cost of a metadata
+        write per load. If None (default), access is tracked only when the eviction
+        policy needs it.
+    packed_max_bytes : int
+        Size (in memory, estimated with :py:func:`xpersist.memory.sizeof`) up to which
+        values are packed into large segment files (in `xpersist_segments/`) rather than
+        written to a file each, if their serializer supports it (e.g. `joblib`). This
+        keeps the number of objects in object stores down when caching many small values,
+        which are then read with ranged reads. Packing takes precedence over
+        `content_addressed`. The space of deleted or overwritten artifacts is reclaimed by
+        :py:meth:`compact_segments`. If None (default), values are not packed.
+    checksum_max_bytes : int
+        Size on disk up to which artifacts written to their own file are checksummed, which
+        reads them back once written (64 MiB by default). Larger artifacts and directory
+        artifacts (e.g. Zarr stores) have no checksum, unless this is None. Content-addressed
+        artifacts, named after their checksum, and inline and packed artifacts, checksummed
+        in memory, are always checksummed.
     """
 
     path: str = tempfile.gettempdir()
     readonly: bool = False
     on_duplicate_key: DuplicateKeyEnum = 'skip'
     storage_options: typing.Dict[typing.Any, typing.Any] = None
+    metadata_store: str = 'sidecar'
+    metadata_store_options: typing.Dict[str, typing.Any] = None
+    memory_cache_bytes: int = 0
+    memory_cache_policy: MemoryCachePolicyEnum = 'lru'
+    local_cache_dir: str = None
+    local_cache_max_bytes: int = None
+    max_workers: int = None
+    content_addressed: bool = False
+    serializer_policy: SerializerPolicy = None
+    compression: Compression = None
+    locking: str = None
+    locking_options: typing.Dict[str, typing.Any] = None
+    max_bytes: int = None
+    max_items: int = None
+    eviction_policy: EvictionPolicyEnum = 'lru'
+    ttl: datetime.timedelta = None
+    track_access: bool = None
+    packed_max_bytes: int = None
+    checksum_max_bytes: typing.Optional[int] = 64 * 2**20
 
     def __post_init_post_parse__(self):
         self.storage_options = {} if self.storage_options is None else self.storage_options
+        self.metadata_store_options = self.metadata_store_options or {}
+        self.locking_options = self.locking_options or {}
+        self.serializer_policy = self.serializer_policy or SerializerPolicy()
         self.mapper = fsspec.get_mapper(self.path, **self.storage_options)
         self.raw_path = self.mapper.fs._strip_protocol(self.path)
         self.protocol = self.mapper.fs.protocol
-        self._ensure_dir(self.raw_path)
-        self._suffix = '.artifact.json'
         self._metadata_store_prefix = 'xpersist_metadata_store'
         self._metadata_store_path = self._construct_item_path(self._metadata_store_prefix)
-        self._ensure_dir(self._metadata_store_path)
+        self._blob_store_path = self._construct_item_path('xpersist_blobs')
+        self._staging_store_path = self._construct_item_path('xpersist_staging')
+        self._lock_store_path = self._construct_item_path('xpersist_locks')
+        self.segments = SegmentStore(self.mapper.fs, self._construct_item_path('xpersist_segments'))
+        if self.content_addressed:
+            self._ensure_dir(self._blob_store_path)
+        self.metadata: MetadataStore = registry.metadata_store.get(self.metadata_store)(
+            fs=self.mapper.fs, path=self._metadata_store_path, **self.metadata_store_options
+        )
+        # Estimated (bytes, items) in the cache store, refreshed whenever artifacts are evicted
+        self._usage = None
+        self.memory_cache = (
+            MemoryCache(self.memory_cache_bytes, policy=self.memory_cache_policy)
+            if self.memory_cache_bytes
+            else None
+        )
+        self.local_cache = (
+            LocalDiskCache(self.local_cache_dir, max_bytes=self.local_cache_max_bytes)
+            if self.local_cache_dir
+            else None
+        )
+
+    def _invalidate(self, key: str) -> None:
+        if self.memory_cache is not None:
+            self.memory_cache.invalidate(key)
+        if self.local_cache is not None:
+            self.local_cache.invalidate(key)
 
     def _ensure_dir(self, key: str) -> None:
-        if not self.mapper.fs.exists(key):
-            self.mapper.fs.makedirs(key, exist_ok=True)
+        # A single request: makedirs is a no-op for existing directories (and on object stores)
+        self.mapper.fs.makedirs(key, exist_ok=True)
+
+    def lock(self, key: str, timeout: float = None) -> Lock:
+        """Returns the lock coordinating the writers of the key.
+
+        The lock is acquired and released by using it as a context manager, which raises a
+        TimeoutError if it cannot be acquired within `timeout` seconds. Locks are not
+        reentrant: when `locking` is enabled, the writes of the cache store already hold the
+        lock of their key and must not be called while holding it.
+
+        Parameters
+        ----------
+        key : str
+            The key to lock. The key does not need to be in the cache store.
+        timeout : float
+            Number of seconds to wait for the lock. If None, wait forever.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache", on_duplicate_key="overwrite")
+        >>> with store.lock("counter"):
+        ...     store.put("counter", store.get("counter") + 1)
+        """
+        name = self.locking or 'auto'
+        if name == 'auto':
+            name = 'file' if _is_local(self.mapper.fs) else 'ttl'
+        digest = hashlib.sha256(key.encode()).hexdigest()
+        return registry.locks.get(name)(
+            fs=self.mapper.fs,
+            path=f'{self._lock_store_path}/{digest}.lock',
+            timeout=timeout,
+            **self.locking_options,
+        )
+
+    def _key_lock(self, key: str) -> typing.ContextManager:
+        return self.lock(key) if self.locking else contextlib.nullcontext()
 
     def _construct_item_path(self, key) -> str:
         return f'{self.path}/{key}'
 
-    def _artifact_meta_relative_path(self, key: str) -> str:
-        return f'{self._metadata_store_prefix}/{key}{self._suffix}'
+    def _item_path(self, artifact: Artifact) -> str:
+        """Returns the path of the serialized artifact, which is a blob for content-addressed artifacts."""
+        if artifact.blob is not None:
+            return f'{self._blob_store_path}/{artifact.blob}'
+        return self._construct_item_path(artifact.key)
 
-    def _artifact_meta_full_path(self, key: str) -> str:
-        return f'{self._metadata_store_path}/{key}{self._suffix}'
+    def _load_path(self, artifact: Artifact) -> str:
+        """Returns the path serializers load the artifact from, going through the disk tier if enabled."""
+        path = self._item_path(artifact)
+        if self.local_cache is None:
+            return path
+        token = artifact.blob or (artifact.updated_at or artifact.created_at).isoformat()
+        return self.local_cache.fetch(self.mapper.fs, path, artifact.key, token=token)
 
     def __contains__(self, key: str) -> bool:
-        """Returns True if the key is in the cache store."""
-        return self._artifact_meta_relative_path(key) in self.mapper
+        """Returns True if the key is in the cache store and has not expired."""
+        try:
+            self.get_artifact(key)
+        except KeyError:
+            return False
+        return True
 
     def keys(self) -> typing.List[str]:
-        """Returns a list of keys in the cache store."""
-        keys = self.mapper.fs.ls(self._metadata_store_path)
-        return [
-            key.split(f'{self._metadata_store_prefix}/')[-1].split(self._suffix)[0] for key in keys
-        ]
+        """Returns a list of keys in the cache store, excluding expired artifacts.
+
+        The `sqlite` and `log` metadata stores look expired artifacts up in their index. The
+        `sidecar` metadata store would have to read every sidecar file, so it only does when
+        the cache store has a `ttl`; otherwise, the keys of artifacts put with their own `ttl`
+        are listed until they are pruned, although :py:meth:`get` treats them as missing.
+        """
+        keys = self.metadata.keys()
+        if not (self.metadata.indexed or self.ttl is not None):
+            return keys
+        expired = set(self.metadata.expired(datetime.datetime.utcnow().isoformat()))
+        return [key for key in keys if key not in expired]
+
+    @_validate_arguments
+    def search(
+        self,
+        serializer: typing.Union[str, typing.List[str]] = None,
+        created_after: datetime.datetime = None,
+        created_before: datetime.datetime = None,
+        **additional_metadata: typing.Any,
+    ) -> typing.List[str]:
+        """Returns the keys of the artifacts matching all given filters.
+
+        Filters are answered by the metadata store. The `sqlite` and `log` metadata stores
+        maintain a secondary index of the searchable fields, while the `sidecar` metadata
+        store has to read every sidecar file.
+
+        Parameters
+        ----------
+        serializer : str or list of str
+            Only return artifacts recorded with this serializer (or any of these serializers).
+        created_after : datetime.datetime
+            Only return artifacts created at or after this time (UTC).
+        created_before : datetime.datetime
+            Only return artifacts created before this time (UTC).
+        **additional_metadata :
+            Fields of the artifacts' `additional_metadata` to match. A list, tuple or set
+            matches any of its values.
+
+        Returns
+        -------
+        keys : list of str
+            The keys of the matching artifacts.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache")
+        >>> store.put("foo", [1, 2, 3], additional_metadata={"task_name": "bar"})
+        >>> store.search(task_name="bar")
+        ['foo']
+        """
+
+        filters = {
+            f'additional_metadata.{name}': value for name, value in additional_metadata.items()
+        }
+        if serializer is not None:
+            filters['serializer'] = serializer
+        keys = self.metadata.search(
+            filters,
+            created_after=_isoformat_utc(created_after),
+            created_before=_isoformat_utc(created_before),
+        )
+        records = self.metadata.get_many(keys)
+        now = datetime.datetime.utcnow()
+        return [key for key in keys if key in records and not _expired_record(records[key], now)]
+
+    def compact(self) -> None:
+        """Consolidates the metadata store (e.g. folds the `log` metadata store into a snapshot).
+
+        If `packed_max_bytes` is set, segment files are compacted first (see
+        :py:meth:`compact_segments`).
+        """
+        if self.packed_max_bytes is not None:
+            self.compact_segments(dry_run=False)
+        self.metadata.compact()
+
+    def compact_segments(
+        self,
+        min_live_ratio: float = 0.5,
+        dry_run: bool = True,
+        grace_period: datetime.timedelta = datetime.timedelta(hours=1),
+        min_bytes: int = SEGMENT_MIN_BYTES,
+    ) -> typing.List[str]:
+        """Reclaims the space of deleted or overwritten artifacts packed into segment files.
+
+        The live entries of the segments in which they take less than `min_live_ratio` of the
+        size are copied into a new segment, their records updated, and the old segments
+        deleted. Segments smaller than `min_bytes`, such as the one-batch segments written to
+        object stores, are merged into the new segment as well. Records that changed while the
+        entries were copied are left alone, but a reader that read a record before it was
+        updated fails to load the artifact once the old segment is gone.
+
+        Parameters
+        ----------
+        min_live_ratio : float
+            Segments whose live entries take less than this fraction of their size are
+            compacted. Segments without live entries are always deleted.
+        dry_run : bool
+            If True, nothing is rewritten or deleted and the segments are only reported.
+        grace_period : datetime.timedelta
+            Segments modified more recently than this are left alone, as they may hold
+            entries of writes that are still in progress.
+        min_bytes : int
+            Segments smaller than this are merged together, even if all their entries are
+            live.
+
+        Returns
+        -------
+        paths : list of str
+            The paths of the compacted segments.
+        """
+        cutoff = time.time() - grace_period.total_seconds()
+        live = collections.defaultdict(list)
+        for _, record in self.metadata.records():
+            if record.get('segment'):
+                live[record['segment']].append(Artifact(**record))
+
+        compacted, small = [], []
+        for segment, info in self.segments.segments().items():
+            live_bytes = sum(artifact.nbytes_on_disk for artifact in live[segment])
+            sparse = live_bytes < min_live_ratio * info['size']
+            if segment == self.segments.active or not (sparse or info['size'] < min_bytes):
+                continue
+            try:
+                modified = self.mapper.fs.modified(self.segments.segment_path(segment))
+            except (NotImplementedError, OSError, ValueError):
+                continue
+            if modified.timestamp() < cutoff:
+                (compacted if sparse else small).append(segment)
+        # Rewriting a single small segment on its own would not merge anything
+        if compacted or len(small) > 1:
+            compacted.extend(small)
+
+        paths = [self.segments.segment_path(segment) for segment in compacted]
+        if dry_run:
+            print('DRY RUN: would compact the following segments:\n')
+            for segment, path in zip(compacted, paths):
+                nbytes = sum(artifact.nbytes_on_disk for artifact in live[segment])
+                print(f'* {path} ({len(live[segment])} live entries, {nbytes} bytes)')
+            print('\nTo compact these segments, pass `dry_run=False`')
+            return paths
+
+        relocated, entries = [], []
+        for segment in compacted:
+            if live[segment]:
+                data = self.mapper.fs.cat_file(self.segments.segment_path(segment))
+                for artifact in live[segment]:
+                    relocated.append(artifact)
+                    entries.append(
+                        data[artifact.offset : artifact.offset + artifact.nbytes_on_disk]
+                    )
+        if relocated:
+            segment, offsets = self.segments.write(entries, append=False)
+            records = self.metadata.get_many(artifact.key for artifact in relocated)
+            updated = {}
+            for artifact, offset in zip(relocated, offsets):
+                record = records.get(artifact.key)
+                if record is None or (record.get('segment'), record.get('offset')) != (
+                    artifact.segment,
+                    artifact.offset,
+                ):
+                    continue
+                updated[artifact.key] = {**record, 'segment': segment, 'offset': offset}
+            self.metadata.put_many(updated)
+        if paths:
+            self.mapper.fs.rm(paths)
+        return paths
+
+    def fsck(
+        self,
+        dry_run: bool = True,
+        grace_period: datetime.timedelta = datetime.timedelta(hours=1),
+    ) -> typing.Dict[str, typing.List[str]]:
+        """Checks the cache store and garbage-collects what interrupted writes left behind.
+
+        Artifacts are written to a staging prefix and moved into place before their metadata
+        record is written, so a crashed writer can leave staged data, unreferenced blobs or
+        (for a crash while an artifact is replaced or deleted) records without data, but
+        never a record pointing to partial data. Blobs left unreferenced by interrupted deletes
+        and overwrites are collected here as well.
+
+        Parameters
+        ----------
+        dry_run : bool
+            If True, nothing is deleted and the orphans are only reported.
+        grace_period : datetime.timedelta
+            Staged data and blobs younger than this are left alone, as they may belong to
+            writes that are still in progress.
+
+        Returns
+        -------
+        orphans : dict
+            The paths of the orphaned staging prefixes (`staging`) and blobs (`blobs`),
+            and the keys of the records whose artifact is missing (`records`).
+        """
+
+        fs = self.mapper.fs
+        cutoff = time.time() - grace_period.total_seconds()
+        orphans = {'staging': [], 'blobs': [], 'records': []}
+
+        if fs.exists(self._staging_store_path):
+            for path in fs.ls(self._staging_store_path, detail=False):
+                try:
+                    started = int(posixpath.basename(path).split('-', 1)[0]) / 1e9
+                except ValueError:
+                    continue
+                if started < cutoff:
+                    orphans['staging'].append(path)
+
+        referenced, segments = {}, None
+        for key, record in self.metadata.records():
+            if record.get('blob'):
+                referenced[key] = record['blob']
+            elif record.get('segment'):
+                segments = self.segments.segments() if segments is None else segments
+                if record['segment'] not in segments:
+                    orphans['records'].append(key)
+            elif _in_file(record) and not fs.exists(self._construct_item_path(key)):
+                orphans['records'].append(key)
+
+        # Blobs are listed after the records are read: the blob of a record is written before
+        # it, and only removed here, so a record whose blob is not listed lost its data
+        blobs = {}
+        if fs.exists(self._blob_store_path):
+            blobs = {
+                posixpath.basename(path): path
+                for path in fs.ls(self._blob_store_path, detail=False)
+            }
+        orphans['records'].extend(key for key, blob in referenced.items() if blob not in blobs)
+
+        live = set(referenced.values())
+        for blob, path in blobs.items():
+            if blob not in live:
+                try:
+                    modified = fs.modified(path).timestamp()
+                except (NotImplementedError, OSError, ValueError):
+                    continue
+                if modified < cutoff:
+                    orphans['blobs'].append(path)
+
+        if dry_run:
+            print('DRY RUN: would delete the following orphans:\n')
+            for kind, items in orphans.items():
+                for item in items:
+                    print(f'* {kind}: {item}')
+            print('\nTo delete these items, call `fsck(dry_run=False)`')
+            return orphans
+
+        for key in orphans['records']:
+            self._invalidate(key)
+        self.metadata.delete_many(orphans['records'])
+        paths = orphans['staging'] + orphans['blobs']
+        if paths:
+            fs.rm(paths, recursive=True)
+        return orphans
+
+    def verify(self, key: str) -> bool:
+        """Returns True if the serialized data of the key still matches its recorded checksum.
+
+        Raises a ValueError if no checksum was recorded, e.g. for artifacts written to a
+        remote cache store without `content_addressed`, larger than `checksum_max_bytes`,
+        or appended to.
+        """
+        artifact = self.get_artifact(key)
+        if artifact.checksum is None:
+            raise ValueError(f'No checksum recorded for key {key}')
+        data = self._read_data(artifact)
+        if data is not None:
+            return hashlib.sha256(data).hexdigest() == artifact.checksum
+        return _digest(self._item_path(artifact), self.mapper.fs) == artifact.checksum
+
+    def prune(self, dry_run: bool = True) -> typing.List[str]:
+        """Deletes the expired artifacts from the cache store.
+
+        Parameters
+        ----------
+        dry_run : bool
+            If True, nothing is deleted and the expired keys are only reported.
+
+        Returns
+        -------
+        keys : list of str
+            The keys of the expired artifacts.
+        """
+        return self._evict(None, None, dry_run=dry_run)
+
+    def evict(
+        self, max_bytes: int = None, max_items: int = None, dry_run: bool = True
+    ) -> typing.List[str]:
+        """Deletes the expired artifacts, then artifacts chosen by `eviction_policy` until the
+        cache store fits within the bounds.
+
+        This runs automatically after writes that exceed `max_bytes` or `max_items`. It reads
+        every metadata record, so large cache stores benefit from the `sqlite` or `log`
+        metadata stores. The space of evicted packed artifacts is only reclaimed once their
+        segment is compacted (see :py:meth:`compact_segments`), which eviction does for
+        segments past the grace period.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Upper bound on the size of the artifacts. Defaults to the cache store's `max_bytes`.
+        max_items : int
+            Upper bound on the number of keys. Defaults to the cache store's `max_items`.
+        dry_run : bool
+            If True, nothing is deleted and the keys to evict are only reported.
+
+        Returns
+        -------
+        keys : list of str
+            The keys of the evicted artifacts.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/scratch/my-cache", eviction_policy="lfu")
+        >>> store.evict(max_bytes=500 * 2**30, dry_run=False)
+        """
+        return self._evict(
+            self.max_bytes if max_bytes is None else max_bytes,
+            self.max_items if max_items is None else max_items,
+            dry_run=dry_run,
+        )
+
+    def _eviction_order(self, artifact: Artifact) -> typing.Tuple:
+        if self.eviction_policy == EvictionPolicyEnum.fifo:
+            return (artifact.created_at,)
+        last_accessed = artifact.last_accessed or artifact.updated_at or artifact.created_at
+        if self.eviction_policy == EvictionPolicyEnum.lfu:
+            return artifact.access_count, last_accessed
+        return (last_accessed,)
+
+    def _evict(
+        self,
+        max_bytes: typing.Optional[int],
+        max_items: typing.Optional[int],
+        dry_run: bool = True,
+        keep: typing.Iterable[str] = (),
+    ) -> typing.List[str]:
+        now = datetime.datetime.utcnow()
+        artifacts = [Artifact(**record) for _, record in self.metadata.records()]
+        expired = [artifact for artifact in artifacts if _expired(artifact, now)]
+        live = [artifact for artifact in artifacts if not _expired(artifact, now)]
+
+        for artifact in live:
+            if artifact.nbytes_on_disk is None and max_bytes is not None:
+                # Artifacts written before sizes were recorded
+                path = self._item_path(artifact)
+                fs = self.mapper.fs
+                artifact.nbytes_on_disk = fs.du(path, total=True) if fs.exists(path) else 0
+        # Blobs shared by several keys are counted (and freed) once
+        references = collections.Counter(artifact.blob for artifact in live if artifact.blob)
+        nbytes = sum(
+            artifact.nbytes_on_disk or 0
+            for artifact in {artifact.blob or artifact.key: artifact for artifact in live}.values()
+            if not artifact.segment
+        )
+        # Packed entries are only freed when their segment is compacted, so segments are
+        # counted by their size on disk, dead entries included
+        segments = self.segments.segments()
+        nbytes += sum(info['size'] for info in segments.values())
+        nitems = len(live)
+
+        evicted = []
+        keep = set(keep)
+        for artifact in sorted(live, key=self._eviction_order):
+            if (max_bytes is None or nbytes <= max_bytes) and (
+                max_items is None or nitems <= max_items
+            ):
+                break
+            if artifact.key in keep:
+                continue
+            if artifact.segment and (max_items is None or nitems <= max_items):
+                # Evicting a packed artifact frees no space until its segment is compacted
+                continue
+            evicted.append(artifact)
+            nitems -= 1
+            if artifact.segment:
+                continue
+            if artifact.blob:
+                references[artifact.blob] -= 1
+                if references[artifact.blob]:
+                    continue
+            nbytes -= artifact.nbytes_on_disk or 0
+
+        victims = expired + evicted
+        if dry_run:
+            print('DRY RUN: would delete the following keys:\n')
+            for artifact in expired:
+                print(f'* {artifact.key} (expired)')
+            for artifact in evicted:
+                print(f'* {artifact.key} ({self.eviction_policy.value})')
+            print('\nTo delete these keys, pass `dry_run=False`')
+        else:
+            if victims:
+                self._delete_artifacts(victims)
+            if any(artifact.segment for artifact in victims):
+                self.compact_segments(dry_run=False)
+                nbytes -= sum(info['size'] for info in segments.values())
+                nbytes += sum(info['size'] for info in self.segments.segments().values())
+            self._usage = (nbytes, nitems)
+        return [artifact.key for artifact in victims]
+
+    def _ensure_capacity(self, nbytes: int, nitems: int, keep: typing.Iterable[str]) -> None:
+        """Evicts artifacts if a write of `nbytes` and `nitems` exceeds the cache store's bounds.
+
+        The usage of the cache store is estimated from the writes of this process between
+        evictions, and only recomputed from the metadata store when it exceeds the bounds.
+        """
+        if self.max_bytes is None and self.max_items is None:
+            return
+        if self._usage is not None:
+            self._usage = (self._usage[0] + nbytes, self._usage[1] + nitems)
+            if (self.max_bytes is None or self._usage[0] <= self.max_bytes) and (
+                self.max_items is None or self._usage[1] <= self.max_items
+            ):
+                return
+        lock = self.lock('xpersist_eviction')
+        # Another process or thread is already evicting
+        if not lock.acquire(timeout=0):
+            return
+        try:
+            self._evict(self.max_bytes, self.max_items, dry_run=False, keep=keep)
+        finally:
+            lock.release()
 
     def delete(self, key: str, dry_run: bool = True) -> None:
         """Deletes the key and corresponding artifact from the cache store.
@@ -110,16 +952,18 @@ class CacheStore:
             If True, the key is not deleted from the cache store. This is useful for debugging.
         """
 
-        if key not in self:
-            raise KeyError(f'Key `{key}` not found in cache store.')
-        paths = [self._artifact_meta_full_path(key), self._construct_item_path(key)]
+        try:
+            artifact = self.get_artifact(key)
+        except KeyError as exc:
+            raise KeyError(f'Key `{key}` not found in cache store.') from exc
         if not dry_run:
-            for path in paths:
-                self.mapper.fs.delete(path, recursive=True)
+            self._delete_artifacts([artifact])
         else:
             print('DRY RUN: would delete items with the following paths:\n')
-            for path in paths:
-                print(f'* {path}')
+            print(f'* {self._item_path(artifact)}')
+            print(
+                f'\nand the metadata record for `{key}` in the {self.metadata_store} metadata store.'
+            )
             print('\nTo delete these items, call `delete(key, dry_run=False)`')
 
     def __getitem__(self, key: str) -> typing.Any:
@@ -134,7 +978,18 @@ class CacheStore:
         """Deletes the key and corresponding artifact from the cache store."""
         self.delete(key, dry_run=False)
 
-    @pydantic.validate_arguments
+    def _get_record(self, key: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        """Returns the metadata record of the key, or None if the key is missing.
+
+        The record is read optimistically, a missing record being a miss, rather than checked
+        for beforehand: on object stores, each request costs tens of milliseconds.
+        """
+        try:
+            return self.metadata.get(key)
+        except KeyError:
+            return None
+
+    @_validate_arguments
     def get_artifact(self, key: str) -> Artifact:
         """Returns the artifact corresponding to the key.
 
@@ -151,29 +1006,39 @@ class CacheStore:
         Raises
         ------
         KeyError
-            If the key is not in the cache store.
+            If the key is not in the cache store or its artifact expired.
 
         """
-        metadata_file = self._artifact_meta_relative_path(key)
-        message = f'{key} not found in cache store: {self._metadata_store_path}'
-        if key not in self:
-            raise KeyError(message)
+        record = self._get_record(key)
+        if record is None:
+            raise KeyError(f'{key} not found in cache store: {self._metadata_store_path}')
         try:
-            return Artifact(**json.loads(self.mapper[metadata_file]))
+            artifact = Artifact(**record)
         except Exception as exc:
-            raise KeyError(
-                f'Unable to load artifact sidecar file {metadata_file} for key: {key}'
-            ) from exc
+            raise KeyError(f'Unable to load artifact metadata for key: {key}') from exc
+        if _expired(artifact):
+            raise KeyError(f'{key} expired at {artifact.expires_at} in cache store')
+        return artifact
 
-    @pydantic.validate_arguments
+    @_validate_arguments
     def get(
         self,
         key: str,
         serializer: str = None,
         load_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        variables: typing.List[str] = None,
+        sel: typing.Dict[str, typing.Any] = None,
+        columns: typing.List[str] = None,
+        filters: typing.List[typing.Any] = None,
     ) -> typing.Any:
         """Returns the value for the key if the key is in the cache store.
 
+        The `variables`, `sel`, `columns` and `filters` arguments read a subset of the
+        artifact and are pushed down to the serializer, so that only the data actually needed
+        is read: Datasets are opened lazily and subset before any data is loaded, and parquet
+        artifacts are read with column projection and row-group predicate filters. A
+        ValueError is raised if the serializer does not support the selection.
+
         Parameters
         ----------
         key : str
@@ -191,6 +1056,19 @@ class CacheStore:
             You can also register your own serializer via the @xpersist.registry.serializers.register decorator.
         load_kwargs : dict
             Additional keyword arguments to pass to the serializer when loading artifact from the cache store.
+            Dask-backed Datasets put in the cache store are reopened with the chunks recorded
+            in their artifact, unless `chunks` is given here.
+        variables : list of str
+            Variables to select from a Dataset (xarray serializers).
+        sel : dict
+            Labels or slices to select along the dimensions of a Dataset, as in
+            :py:meth:`xarray.Dataset.sel` (xarray serializers).
+        columns : list of str
+            Columns to read from a DataFrame (`pandas.parquet` and `pandas.csv`).
+        filters : list
+            Row filters of a DataFrame in the disjunctive normal form of
+            :py:func:`pyarrow.parquet.read_table`, e.g. ``[('year', '>=', 2000)]``
+            (`pandas.parquet`).
 
         Returns
         -------
@@ -205,18 +1083,162 @@ class CacheStore:
         ['foo']
         >>> store.get("foo")
         [1, 2, 3]
+        >>> store.get("bar", variables=["tas"], sel={"time": slice("2000", "2009")})
         """
 
+        selection = Selection(variables=variables, sel=sel, columns=columns, filters=filters)
+        selection = selection if any(value is not None for _, value in selection) else None
+        use_memory_cache = (
+            self.memory_cache is not None and not serializer and not load_kwargs and not selection
+        )
+        if use_memory_cache:
+            try:
+                return self.memory_cache.get(key)
+            except KeyError:
+                pass
+
         artifact = self.get_artifact(key)
         try:
-            serializer_name = serializer or artifact.serializer
+            value = self._load(artifact, serializer, load_kwargs, selection)
+        except ValueError:
+            # The record may be stale, e.g. cached by the `log` metadata store while
+            # another process deleted or replaced the artifact
+            self.metadata.refresh()
+            fresh = self.get_artifact(key)
+            if fresh == artifact:
+                raise
+            artifact = fresh
+            value = self._load(artifact, serializer, load_kwargs, selection)
+        self._record_access([artifact])
+        # Values that expire are not kept in the memory tier, which does not know their expiry
+        if use_memory_cache and artifact.expires_at is None:
+            self.memory_cache.put(key, value)
+        return value
+
+    def _tracks_access(self) -> bool:
+        if self.readonly:
+            return False
+        if self.track_access is not None:
+            return self.track_access
+        return (
+            self.max_bytes is not None or self.max_items is not None
+        ) and self.eviction_policy != EvictionPolicyEnum.fifo
+
+    def _record_access(self, artifacts: typing.List[Artifact]) -> None:
+        """Records the access time and count of loaded artifacts, used by the eviction policy."""
+        if not artifacts or not self._tracks_access():
+            return
+        now = datetime.datetime.utcnow()
+        # The records are read again, as the artifacts may have been deleted or replaced
+        # while they were loaded, in which case their records must not be restored
+        records = self.metadata.get_many(artifact.key for artifact in artifacts)
+        updated = {}
+        for artifact in artifacts:
+            if artifact.key not in records:
+                continue
+            current = Artifact(**records[artifact.key])
+            if any(getattr(current, name) != getattr(artifact, name) for name in _VERSION_FIELDS):
+                continue
+            current.last_accessed = now
+            current.access_count += 1
+            updated[artifact.key] = json.loads(current.json())
+        self.metadata.put_many(updated)
+
+    def _load(
+        self,
+        artifact: Artifact,
+        serializer: str = None,
+        load_kwargs: typing.Dict = None,
+        selection: Selection = None,
+    ) -> typing.Any:
+        serializer_name = serializer or artifact.serializer
+        serializer = get_serializer(serializer_name)
+        if selection is not None:
+            serializer.check_selection(selection)
+        try:
             load_kwargs = load_kwargs or artifact.load_kwargs
-            serializer = registry.serializers.get(serializer_name)()
-            return serializer.load(self._construct_item_path(artifact.key), **load_kwargs)
+            if artifact.compression is not None and serializer.compression_load_kwargs:
+                load_kwargs = _merge_kwargs(
+                    serializer.compression_load_kwargs(artifact.compression), load_kwargs
+                )
+            if artifact.chunks and serializer.lazy:
+                load_kwargs = {'chunks': artifact.chunks, **load_kwargs}
+            data = self._read_data(artifact)
+            if data is not None:
+                return serializer.loads(data, **load_kwargs)
+            if selection is not None:
+                return serializer.load_subset(self._load_path(artifact), selection, **load_kwargs)
+            return serializer.load(self._load_path(artifact), **load_kwargs)
+        except ImportError:
+            # A missing optional dependency is not a problem of the artifact
+            raise
         except Exception as exc:
             raise ValueError(f'Unable to load artifact {artifact.key} from cache store') from exc
 
-    @pydantic.validate_arguments
+    def _read_data(self, artifact: Artifact) -> typing.Optional[bytes]:
+        """Returns the serialized data of inline and packed artifacts, None for the others."""
+        if artifact.inline_data is not None:
+            return base64.b64decode(artifact.inline_data)
+        if artifact.segment is not None:
+            return self.segments.read(artifact.segment, artifact.offset, artifact.nbytes_on_disk)
+        return None
+
+    def contains_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, bool]:
+        """Returns a mapping of each key to whether it is in the cache store.
+
+        The lookups are sent to the metadata store in bulk.
+        """
+        keys = list(keys)
+        records = self.metadata.get_many(keys)
+        now = datetime.datetime.utcnow()
+        return {key: key in records and not _expired(Artifact(**records[key]), now) for key in keys}
+
+    def get_many(self, keys: typing.Iterable[str]) -> typing.Dict[str, typing.Any]:
+        """Returns the values for several keys.
+
+        The metadata of all keys is fetched in bulk and the artifacts are loaded concurrently
+        on a thread pool of at most `max_workers` threads.
+
+        Parameters
+        ----------
+        keys : iterable of str
+            Keys to get from the cache store.
+
+        Returns
+        -------
+        values : dict
+            Mapping of each key to its value.
+
+        Raises
+        ------
+        KeyError
+            If any of the keys is not in the cache store.
+        """
+        keys = list(dict.fromkeys(keys))
+        values = {}
+        if self.memory_cache is not None:
+            for key in keys:
+                try:
+                    values[key] = self.memory_cache.get(key)
+                except KeyError:
+                    pass
+        pending = [key for key in keys if key not in values]
+        records = self.metadata.get_many(pending)
+        artifacts = {key: Artifact(**record) for key, record in records.items()}
+        now = datetime.datetime.utcnow()
+        missing = [key for key in pending if key not in artifacts or _expired(artifacts[key], now)]
+        if missing:
+            raise KeyError(f'{missing} not found in cache store: {self._metadata_store_path}')
+        artifacts = [artifacts[key] for key in pending]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for artifact, value in zip(artifacts, executor.map(self._load, artifacts)):
+                values[artifact.key] = value
+                if self.memory_cache is not None and artifact.expires_at is None:
+                    self.memory_cache.put(artifact.key, value)
+        self._record_access(artifacts)
+        return {key: values[key] for key in keys}
+
+    @_validate_arguments
     def put(
         self,
         key: str,
@@ -224,6 +1246,8 @@ class CacheStore:
         serializer: str = 'auto',
         dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
         additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
     ) -> Artifact:
         """Records and serializes key with its corresponding value in the cache store.
 
@@ -237,17 +1261,28 @@ class CacheStore:
             The name of the serializer you want to use. The built-in
             serializers are:
 
-            - 'auto' (default): automatically choose the serializer based on the type of the value
+            - 'auto' (default): automatically choose the serializer based on the type and size
+              of the value, following `serializer_policy`
             - 'xarray.netcdf': requires xarray and netCDF4
             - 'xarray.zarr': requires xarray and zarr
             - 'pandas.csv' : requires pandas
             - 'pandas.parquet': requires pandas and pyarrow or fastparquet
+            - 'msgpack': small values of built-in types, stored inline in their metadata
+              record; requires msgpack
 
             You can also register your own serializer via the @xpersist.registry.serializers.register decorator.
         dump_kwargs : dict
             Additional keyword arguments to pass to the serializer when dumping artifact to the cache store.
         additional_metadata : dict
-            A dict with types that serialize to json. These fields can be used for searching artifacts in the metadata store.
+            A dict with types that serialize to json. These fields can be used for searching artifacts in the metadata store via :py:meth:`search`.
+        compression : Compression
+            Compression of the artifact, e.g. 'zstd', 'gzip:6' or ``{'codec': 'lz4', 'level': 1}``.
+            Overrides the cache store's `compression`, and 'none' disables it. Raises a
+            ValueError if the serializer does not support the codec. Keyword arguments
+            given in `dump_kwargs` take precedence over the ones derived from it.
+        ttl : datetime.timedelta
+            Time to live of the artifact (or a number of seconds), after which it is treated
+            as missing. Overrides the cache store's `ttl`.
 
         Returns
         -------
@@ -265,39 +1300,812 @@ class CacheStore:
         ['foo']
 
         """
-        dump_kwargs = dump_kwargs or {}
-        additional_metadata = additional_metadata or {}
         if not self.readonly:
             method = getattr(self, f'_put_{self.on_duplicate_key.value}')
-            serializer_name = pick_serializer(value) if serializer == 'auto' else serializer
-            artifact = Artifact(
-                key=key,
-                serializer=serializer_name,
-                dump_kwargs=dump_kwargs,
-                additional_metadata=additional_metadata,
+            artifact = self._build_artifact(
+                key, value, serializer, dump_kwargs, additional_metadata, compression, ttl
             )
-            artifact._value = value
             method(artifact)
             return artifact._value
 
-    def _put_raise_error(self, artifact: Artifact) -> None:
-        """Raises an error if the key is already in the cache store."""
-        if artifact.key in self:
-            raise ValueError(f'Key {artifact.key} already in cache store')
+    def get_or_compute(
+        self,
+        key: str,
+        func: typing.Callable[[], typing.Any],
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        load_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+        timeout: float = None,
+    ) -> typing.Any:
+        """Returns the value for the key, computing and putting it first if the key is missing.
+
+        Concurrent callers for the same missing key (threads, processes or dask and Prefect
+        workers sharing the cache store) are coordinated with the lock of the key (see
+        :py:meth:`lock`): the first one calls `func` and puts its result, while the others
+        wait and then load the result instead of computing it again.
+
+        Parameters
+        ----------
+        key : str
+            Key to get from the cache store.
+        func : callable
+            Function called without arguments to compute the value if the key is missing.
+        serializer : str
+            The name of the serializer used for the computed value. See :py:meth:`put`.
+        dump_kwargs : dict
+            Additional keyword arguments to pass to the serializer when dumping the value.
+        load_kwargs : dict
+            Additional keyword arguments to pass to the serializer when loading the value.
+        additional_metadata : dict
+            A dict with types that serialize to json, recorded with the computed value.
+        compression : Compression
+            Compression of the computed value. See :py:meth:`put`.
+        ttl : datetime.timedelta
+            Time to live of the computed value. See :py:meth:`put`.
+        timeout : float
+            Number of seconds to wait for another caller computing the value, after which a
+            TimeoutError is raised. If None, wait forever.
+
+        Returns
+        -------
+        value : typing.Any
+            The cached or computed value.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache")
+        >>> store.get_or_compute("foo", lambda: [1, 2, 3])
+        [1, 2, 3]
+        """
+        try:
+            return self.get(key, load_kwargs=load_kwargs)
+        except KeyError:
+            pass
+        if self.readonly:
+            return func()
+        with self.lock(key, timeout=timeout):
+            # Another caller may have put the value while we were waiting for the lock
+            record = self._get_record(key)
+            if _live(record):
+                try:
+                    return self.get(key, load_kwargs=load_kwargs)
+                except KeyError:
+                    record = self._get_record(key)
+            artifact = self._build_artifact(
+                key, func(), serializer, dump_kwargs, additional_metadata, compression, ttl
+            )
+            self._write(artifact, record=record)
+            return artifact._value
+
+    def _build_artifact(
+        self,
+        key: str,
+        value: typing.Any,
+        serializer: str,
+        dump_kwargs: typing.Dict = None,
+        additional_metadata: typing.Dict = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+    ) -> Artifact:
+        serializer_name = (
+            pick_serializer(value, self.serializer_policy) if serializer == 'auto' else serializer
+        )
+        artifact = Artifact(
+            key=key,
+            serializer=serializer_name,
+            dump_kwargs=dump_kwargs or {},
+            additional_metadata=additional_metadata or {},
+            compression=self._resolve_compression(serializer_name, value, compression),
+            chunks=_dask_chunks(value),
+            nbytes_in_memory=None if value is None else sizeof(value),
+        )
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None:
+            if not isinstance(ttl, datetime.timedelta):
+                ttl = datetime.timedelta(seconds=ttl)
+            artifact.expires_at = artifact.created_at + ttl
+        artifact._value = value
+        return artifact
+
+    def _resolve_compression(
+        self, serializer_name: str, value: typing.Any, compression: Compression = None
+    ) -> typing.Optional[Compression]:
+        """Returns the compression of an artifact, checking that its serializer supports it."""
+        explicit = compression is not None
+        compression = Compression.validate(compression) if explicit else self.compression
+        if compression is None or compression.codec == CompressionCodecEnum.none:
+            return None
+        serializer = get_serializer(serializer_name)
+        try:
+            if serializer.compression_dump_kwargs is None:
+                raise ValueError(f'The {serializer_name} serializer does not support compression')
+            serializer.compression_dump_kwargs(compression, value)
+        except ValueError:
+            if explicit:
+                raise
+            return None
+        return compression
+
+    @_validate_arguments
+    def put_many(
+        self,
+        mapping: typing.Dict[str, typing.Any],
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+    ) -> None:
+        """Records and serializes several keys with their corresponding values in the cache store.
+
+        Duplicate keys are detected with a single bulk lookup and handled according to
+        `on_duplicate_key`. The values are serialized concurrently on a thread pool of at most
+        `max_workers` threads and their metadata is recorded in bulk once all values are
+        written.
+
+        Parameters
+        ----------
+        mapping : dict
+            Mapping of keys to the values to put in the cache store.
+        serializer : str
+            The name of the serializer used for all values. See :py:meth:`put`.
+        dump_kwargs : dict
+            Additional keyword arguments to pass to the serializer when dumping the artifacts.
+        additional_metadata : dict
+            A dict with types that serialize to json, recorded for every artifact.
+        compression : Compression
+            Compression of all artifacts. See :py:meth:`put`.
+        ttl : datetime.timedelta
+            Time to live of all artifacts. See :py:meth:`put`.
+        """
+        if self.readonly:
+            return
+        artifacts = [
+            self._build_artifact(
+                key, value, serializer, dump_kwargs, additional_metadata, compression, ttl
+            )
+            for key, value in mapping.items()
+        ]
+        if self.on_duplicate_key != DuplicateKeyEnum.overwrite:
+            existing = [key for key, found in self.contains_many(mapping).items() if found]
+            if existing and self.on_duplicate_key == DuplicateKeyEnum.raise_error:
+                raise ValueError(f'Keys {existing} already in cache store')
+            artifacts = [artifact for artifact in artifacts if artifact.key not in existing]
+
+        replaced = self._replaced_blobs(artifact.key for artifact in artifacts)
+        written, staged, errors = [], {}, []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._stage, artifact): artifact for artifact in artifacts}
+            for future in concurrent.futures.as_completed(futures):
+                if future.exception() is None:
+                    written.append(futures[future])
+                    if future.result() is not None:
+                        staged[futures[future].key] = future.result()
+                else:
+                    errors.append(future.exception())
+        self._pack([artifact for artifact in written if artifact._data is not None])
+        inline = [artifact for artifact in written if not _in_file(artifact)]
+        try:
+            self.metadata.delete_many(self.metadata.get_many(staged))
+            for key, staged_path in staged.items():
+                self._commit(key, staged_path)
+            previous = self.metadata.get_many(artifact.key for artifact in inline)
+            self.metadata.put_many(
+                {artifact.key: json.loads(artifact.json()) for artifact in written}
+            )
+        finally:
+            for artifact in artifacts:
+                self._invalidate(artifact.key)
+        self._remove_replaced_files(inline, previous)
+        self._restore_blobs(written)
+        self._collect_blobs(replaced - {artifact.blob for artifact in written})
+        self._ensure_capacity(
+            sum(artifact.nbytes_on_disk or 0 for artifact in written),
+            len(written),
+            keep=[artifact.key for artifact in written],
+        )
+        if errors:
+            raise errors[0]
+
+    def delete_many(self, keys: typing.Iterable[str], dry_run: bool = True) -> None:
+        """Deletes several keys and their corresponding artifacts from the cache store.
+
+        Parameters
+        ----------
+        keys : iterable of str
+            Keys to delete from the cache store.
+        dry_run : bool
+            If True, the keys are not deleted from the cache store. This is useful for debugging.
+
+        Raises
+        ------
+        KeyError
+            If any of the keys is not in the cache store.
+        """
+        keys = list(dict.fromkeys(keys))
+        records = self.metadata.get_many(keys)
+        missing = [key for key in keys if key not in records]
+        if missing:
+            raise KeyError(f'Keys {missing} not found in cache store.')
+        artifacts = [Artifact(**records[key]) for key in keys]
+        if not dry_run:
+            self._delete_artifacts(artifacts)
         else:
-            self._put_overwrite(artifact)
+            print('DRY RUN: would delete items with the following paths:\n')
+            for artifact in artifacts:
+                print(f'* {self._item_path(artifact)}')
+            print(f'\nand their metadata records in the {self.metadata_store} metadata store.')
+            print('\nTo delete these items, call `delete_many(keys, dry_run=False)`')
 
-    def _put_skip(self, artifact: Artifact) -> None:
-        """Does nothing if the key is already in the cache store."""
-        if artifact.key not in self:
-            self._put_overwrite(artifact)
-
-    def _put_overwrite(self, artifact: Artifact) -> None:
-        serializer = registry.serializers.get(artifact.serializer)()
-        with self.mapper.fs.transaction:
-            serializer.dump(
-                artifact._value, self._construct_item_path(artifact.key), **artifact.dump_kwargs
+    def _delete_artifacts(self, artifacts: typing.List[Artifact]) -> None:
+        for artifact in artifacts:
+            self._invalidate(artifact.key)
+        # The records go first so that an interrupted delete never leaves a dangling record
+        self.metadata.delete_many([artifact.key for artifact in artifacts])
+        paths = [self._item_path(artifact) for artifact in artifacts if _in_file(artifact)]
+        existing = [path for path in paths if self.mapper.fs.exists(path)]
+        if existing:
+            self.mapper.fs.rm(existing, recursive=True)
+        self._collect_blobs(artifact.blob for artifact in artifacts if artifact.blob)
+
+    @_validate_arguments
+    def put_stream(
+        self,
+        key: str,
+        iterable: typing.Any,
+        serializer: str = 'auto',
+        dim: str = None,
+        batch_size: int = None,
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+    ) -> None:
+        """Records and serializes a sequence of values one part at a time.
+
+        Only one part of the sequence is held in memory at a time, so artifacts larger than
+        memory can be written. Duplicate keys are handled according to `on_duplicate_key`.
+
+        Parameters
+        ----------
+        key : str
+            Key to put in the cache store.
+        iterable : iterable
+            The values to write, e.g. a generator. Its items are either DataFrames (written
+            as the row groups of a parquet file), Datasets (written to a zarr store and
+            concatenated along `dim`), or any other records (written as joblib frames of
+            `batch_size` records).
+        serializer : str
+            A serializer supporting streaming writes. 'auto' (default) chooses
+            'pandas.parquet', 'xarray.zarr' or 'joblib.frames' from the type of the first item.
+        dim : str
+            The dimension to concatenate Datasets along. Required for Datasets.
+        batch_size : int
+            The number of rows of each parquet row group or of records of each joblib
+            frame. By default, each DataFrame is one row group and frames hold 1024 records.
+        dump_kwargs : dict
+            Additional keyword arguments to pass to the serializer when writing each part.
+        additional_metadata : dict
+            A dict with types that serialize to json, recorded for the artifact.
+        compression : Compression
+            Compression of the artifact. See :py:meth:`put`.
+        ttl : datetime.timedelta
+            Time to live of the artifact. See :py:meth:`put`.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache")
+        >>> store.put_stream("rows", pd.read_csv("large.csv", chunksize=100_000))
+        >>> for df in store.iter("rows"):
+        ...     process(df)
+        """
+        if self.readonly:
+            return
+        iterator = iter(iterable)
+        try:
+            first = next(iterator)
+        except StopIteration:
+            raise ValueError(f'Unable to put an empty iterable for key {key}') from None
+        if serializer == 'auto':
+            if _lazy.isinstance_of(first, 'pandas', 'DataFrame'):
+                serializer = 'pandas.parquet'
+            elif _lazy.isinstance_of(first, 'xarray', 'Dataset'):
+                serializer = 'xarray.zarr'
+            else:
+                serializer = 'joblib.frames'
+        stream_serializer = get_serializer(serializer)
+        if stream_serializer.dump_iter is None:
+            raise ValueError(f'The {serializer} serializer does not support streaming writes')
+        artifact = self._build_artifact(
+            key, first, serializer, dump_kwargs, additional_metadata, compression, ttl
+        )
+        # Only the first item has been seen: the size and chunks of the stream are unknown
+        artifact._value, artifact.chunks, artifact.nbytes_in_memory = None, None, None
+        items = itertools.chain([first], iterator)
+        del first
+
+        def write(path: str) -> None:
+            stream_serializer.dump_iter(
+                items, path, dim, batch_size, artifact.compression, **artifact.dump_kwargs
             )
 
-            with self.mapper.fs.open(self._artifact_meta_full_path(artifact.key), 'w') as fobj:
-                fobj.write(artifact.json(indent=2))
+        getattr(self, f'_put_{self.on_duplicate_key.value}')(artifact, write)
+
+    @_validate_arguments
+    def iter(
+        self,
+        key: str,
+        batch_size: int = None,
+        dim: str = None,
+        load_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+    ) -> typing.Iterator[typing.Any]:
+        """Returns an iterator loading the artifact of a key one part at a time.
+
+        Parameters
+        ----------
+        key : str
+            Key to get from the cache store.
+        batch_size : int
+            The maximum number of rows of each DataFrame, of steps along `dim` of each Dataset,
+            or of records of each list yielded. By default, the parts follow the parquet
+            record batches, the zarr chunks or the joblib frames.
+        dim : str
+            The dimension to iterate Datasets along. Required for Datasets.
+        load_kwargs : dict
+            Additional keyword arguments to pass to the serializer when loading the parts.
+
+        Returns
+        -------
+        iterator :
+            An iterator of DataFrames, Datasets or lists of records.
+        """
+        artifact = self.get_artifact(key)
+        serializer = get_serializer(artifact.serializer)
+        if serializer.load_iter is None:
+            raise ValueError(f'The {artifact.serializer} serializer does not support iteration')
+        return serializer.load_iter(
+            self._load_path(artifact), dim, batch_size, **(load_kwargs or artifact.load_kwargs)
+        )
+
+    @_validate_arguments
+    def append(
+        self,
+        key: str,
+        value: typing.Any,
+        dim: str = None,
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+    ) -> typing.Any:
+        """Appends a value to the artifact of a key, writing only the new data.
+
+        Datasets are appended along `dim` with zarr's ``append_dim``, and the rows of
+        DataFrames are written as a new part of a parquet artifact. The artifact metadata is
+        updated in a single write once the data is appended. If the key is not in the cache
+        store yet, the value is put with a serializer that supports appends. Content-addressed
+        artifacts are copied out of their shared blob on their first append.
+
+        Parameters
+        ----------
+        key : str
+            Key of the artifact to append to.
+        value : typing.Any
+            Value to append, e.g. the next time steps of a Dataset or rows of a DataFrame.
+        dim : str
+            The dimension to append along. Required for xarray artifacts.
+        serializer : str
+            The serializer used if the key is not in the cache store yet. 'auto' (default)
+            uses 'xarray.zarr' for Datasets and 'pandas.parquet' for DataFrames.
+        dump_kwargs : dict
+            Additional keyword arguments to pass to the serializer when writing the value.
+
+        Returns
+        -------
+        value : typing.Any
+            Reference to the value that was appended.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache")
+        >>> for ds in stream_of_datasets():
+        ...     store.append("timeseries", ds, dim="time")
+        """
+        if self.readonly:
+            return None
+        with self._key_lock(key):
+            return self._append(key, value, dim, serializer, dump_kwargs)
+
+    def _append(
+        self,
+        key: str,
+        value: typing.Any,
+        dim: str = None,
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+    ) -> typing.Any:
+        try:
+            artifact = self.get_artifact(key)
+        except KeyError:
+            if serializer == 'auto':
+                if _lazy.isinstance_of(value, 'xarray', 'Dataset'):
+                    serializer = 'xarray.zarr'
+                elif _lazy.isinstance_of(value, 'pandas', 'DataFrame'):
+                    serializer = 'pandas.parquet'
+            artifact = self._build_artifact(key, value, serializer, dump_kwargs)
+            self._write(artifact)
+            return value
+
+        serializer = get_serializer(artifact.serializer)
+        if serializer.append is None:
+            raise ValueError(f'The {artifact.serializer} serializer does not support appends')
+        replaced = artifact.blob
+        try:
+            if replaced is not None:
+                # Blobs may be shared with other keys: the artifact gets its own copy first
+                self.mapper.fs.copy(
+                    self._item_path(artifact), self._construct_item_path(key), recursive=True
+                )
+                artifact.blob = None
+            serializer.append(
+                value,
+                self._item_path(artifact),
+                dim,
+                artifact.compression,
+                **(dump_kwargs or {}),
+            )
+            if artifact.chunks and dim in artifact.chunks:
+                appended = _dask_chunks(value) or {}
+                artifact.chunks = {
+                    **artifact.chunks,
+                    dim: artifact.chunks[dim] + appended.get(dim, (value.sizes[dim],)),
+                }
+            previous_nbytes = artifact.nbytes_on_disk or 0
+            artifact.nbytes_on_disk = self.mapper.fs.du(self._item_path(artifact), total=True)
+            # Checksumming the whole artifact would defeat incremental writes
+            artifact.checksum = None
+            artifact.updated_at = datetime.datetime.utcnow()
+            self.metadata.put(key, json.loads(artifact.json()))
+        finally:
+            self._invalidate(key)
+        if replaced is not None:
+            self._collect_blobs([replaced])
+        self._ensure_capacity(artifact.nbytes_on_disk - previous_nbytes, 0, keep=[key])
+        return value
+
+    def memoize(
+        self,
+        func: typing.Callable = None,
+        *,
+        name: str = None,
+        serializer: str = 'auto',
+        dump_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        load_kwargs: typing.Dict[typing.Any, typing.Any] = None,
+        additional_metadata: typing.Dict[typing.Any, typing.Any] = None,
+        compression: Compression = None,
+        ttl: datetime.timedelta = None,
+    ) -> typing.Callable:
+        """Decorator caching the results of a function in the cache store.
+
+        The key of each call is derived from the function's name, a token of its source
+        code and a token of its arguments (see :py:func:`xpersist.tokenize.tokenize`), so
+        editing the function or calling it with different arguments computes and caches a
+        new result, while repeated calls load the cached result. Concurrent calls with the
+        same arguments compute the result once (see :py:meth:`get_or_compute`).
+
+        Parameters
+        ----------
+        func : callable
+            The function to memoize.
+        name : str
+            Prefix of the keys of the cached results. Defaults to the qualified name of the function.
+        serializer : str
+            The name of the serializer used for the results. See :py:meth:`put`.
+        dump_kwargs : dict
+            Additional keyword arguments to pass to the serializer when dumping results.
+        load_kwargs : dict
+            Additional keyword arguments to pass to the serializer when loading results.
+        additional_metadata : dict
+            A dict with types that serialize to json, recorded for every result.
+        compression : Compression
+            Compression of the results. See :py:meth:`put`.
+        ttl : datetime.timedelta
+            Time to live of the results. See :py:meth:`put`.
+
+        Returns
+        -------
+        wrapper : callable
+            The memoized function. Its ``key(*args, **kwargs)`` attribute returns the key
+            a call would use.
+
+        Examples
+        --------
+        >>> from xpersist import CacheStore
+        >>> store = CacheStore("/tmp/my-cache")
+        >>> @store.memoize
+        ... def climatology(ds):
+        ...     return ds.groupby('time.month').mean()
+        """
+
+        def decorator(func: typing.Callable) -> typing.Callable:
+            signature = inspect.signature(func)
+            function_token = tokenize_function(func)
+            prefix = re.sub(r'[^\w.-]+', '_', name or f'{func.__module__}.{func.__qualname__}')
+
+            def key(*args, **kwargs) -> str:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                return f'{prefix}-{tokenize(function_token, dict(bound.arguments))}'
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                return self.get_or_compute(
+                    key(*args, **kwargs),
+                    functools.partial(func, *args, **kwargs),
+                    serializer=serializer,
+                    dump_kwargs=dump_kwargs,
+                    load_kwargs=load_kwargs,
+                    additional_metadata=additional_metadata,
+                    compression=compression,
+                    ttl=ttl,
+                )
+
+            wrapper.key = key
+            return wrapper
+
+        return decorator(func) if func is not None else decorator
+
+    def _put_raise_error(self, artifact: Artifact, write: typing.Callable = None) -> None:
+        """Raises an error if the key is already in the cache store."""
+        with self._key_lock(artifact.key):
+            record = self._get_record(artifact.key)
+            if _live(record):
+                raise ValueError(f'Key {artifact.key} already in cache store')
+            self._write(artifact, write, record)
+
+    def _put_skip(self, artifact: Artifact, write: typing.Callable = None) -> None:
+        """Does nothing if the key is already in the cache store."""
+        with self._key_lock(artifact.key):
+            record = self._get_record(artifact.key)
+            if not _live(record):
+                self._write(artifact, write, record)
+
+    def _writer(self, artifact: Artifact) -> typing.Callable[[str], None]:
+        """Returns a function serializing the value of the artifact to a given path."""
+        serializer = get_serializer(artifact.serializer)
+        dump_kwargs = _dump_kwargs(artifact, serializer)
+        if artifact.chunks and serializer.lazy and 'compute' not in dump_kwargs:
+            # Build the write as a dask graph and compute it on the active scheduler, so the
+            # chunks are written by the dask workers rather than gathered on the client
+            dump_kwargs = {**dump_kwargs, 'compute': False}
+
+            def dump(value, path, **kwargs):
+                serializer.dump(value, path, **kwargs).compute()
+
+        else:
+            dump = serializer.dump
+
+        def write(path: str) -> None:
+            dump(artifact._value, path, **dump_kwargs)
+
+        return write
+
+    def _stage(
+        self, artifact: Artifact, write: typing.Callable[[str], None] = None
+    ) -> typing.Optional[str]:
+        """Writes the artifact under a new staging prefix and returns the staged path.
+
+        Content-addressed artifacts are moved into their (immutable) blob right away, and
+        the data of inline and packed artifacts is kept in the artifact, in which cases None
+        is returned. Staging prefixes left behind by crashed writers are collected
+        by :py:meth:`fsck`.
+        """
+        serializer = get_serializer(artifact.serializer)
+        packed = (
+            self.packed_max_bytes is not None
+            and artifact.nbytes_in_memory is not None
+            and artifact.nbytes_in_memory <= self.packed_max_bytes
+        )
+        if write is None and serializer.dumps is not None and (serializer.inline or packed):
+            start = time.perf_counter()
+            data = serializer.dumps(artifact._value, **_dump_kwargs(artifact, serializer))
+            artifact.dump_seconds = time.perf_counter() - start
+            artifact.nbytes_on_disk = len(data)
+            artifact.checksum = hashlib.sha256(data).hexdigest()
+            if serializer.inline:
+                artifact.inline_data = base64.b64encode(data).decode()
+            else:
+                # Packed by the caller, possibly in a batch with other artifacts
+                artifact._data = data
+            return None
+        # Only values still in memory can be uploaded again if their reused blob is collected
+        restorable = write is None
+        write = write or self._writer(artifact)
+        fs = self.mapper.fs
+        staging_path = f'{self._staging_store_path}/{time.time_ns():020d}-{uuid.uuid4().hex}'
+        staged_path = f'{staging_path}/{posixpath.basename(artifact.key.rstrip("/")) or "data"}'
+        fs.makedirs(staging_path, exist_ok=True)
+        try:
+            if not self.content_addressed:
+                start = time.perf_counter()
+                write(staged_path)
+                artifact.dump_seconds = time.perf_counter() - start
+                artifact.nbytes_on_disk = fs.du(staged_path, total=True)
+                # Checksumming reads the artifact back, and remote artifacts would be downloaded
+                checksum = _is_local(fs) and (
+                    self.checksum_max_bytes is None
+                    or (
+                        artifact.nbytes_on_disk <= self.checksum_max_bytes
+                        and fs.isfile(staged_path)
+                    )
+                )
+                artifact.checksum = _digest(staged_path, fs) if checksum else None
+                return staged_path
+            with tempfile.TemporaryDirectory() as tmpdir:
+                local_path = os.path.join(tmpdir, f'blob{os.path.splitext(artifact.key)[1]}')
+                start = time.perf_counter()
+                write(local_path)
+                artifact.dump_seconds = time.perf_counter() - start
+                artifact.nbytes_on_disk = LocalDiskCache._disk_usage(local_path)
+                artifact.checksum = _digest(local_path)
+                artifact.blob = f'{artifact.checksum}{os.path.splitext(artifact.key)[1]}'
+                blob_path = self._item_path(artifact)
+                if fs.exists(blob_path):
+                    # A reused blob is made young again, so that `fsck` does not collect it
+                    # before the record referring to it is written
+                    _touch(fs, blob_path)
+                    artifact._reused_blob = restorable
+                else:
+                    fs.put(local_path, staged_path, recursive=True)
+                    fs.mv(staged_path, blob_path, recursive=True)
+            fs.rm(staging_path, recursive=True)
+            return None
+        except BaseException:
+            if fs.exists(staging_path):
+                fs.rm(staging_path, recursive=True)
+            raise
+
+    def _commit(self, key: str, staged_path: str) -> None:
+        """Moves a staged artifact into place, replacing the previous artifact of the key.
+
+        The metadata record of the key must have been removed beforehand, so that a crash
+        while the artifacts are swapped never leaves a record pointing to partial data.
+        """
+        fs = self.mapper.fs
+        path = self._construct_item_path(key)
+        try:
+            fs.rm(path, recursive=True)
+        except FileNotFoundError:
+            pass
+        fs.makedirs(posixpath.dirname(path), exist_ok=True)
+        fs.mv(staged_path, path, recursive=True)
+        fs.rm(posixpath.dirname(staged_path), recursive=True)
+
+    def _dump(
+        self,
+        artifact: Artifact,
+        write: typing.Callable[[str], None] = None,
+        replaces: bool = None,
+    ) -> None:
+        """Writes the artifact to a staging prefix and moves it into place.
+
+        The metadata record of the key is written last by the caller, and acts as the commit
+        marker: the key is only reported as present once its artifact is complete. `replaces`
+        tells whether the key has a record to remove first, if the caller already read it.
+        """
+        staged_path = self._stage(artifact, write)
+        if artifact._data is not None:
+            self._pack([artifact])
+        if staged_path is not None:
+            if artifact.key in self.metadata if replaces is None else replaces:
+                self.metadata.delete(artifact.key)
+            self._commit(artifact.key, staged_path)
+
+    def _pack(self, artifacts: typing.List[Artifact]) -> None:
+        """Writes the serialized data of the artifacts to a segment."""
+        if not artifacts:
+            return
+        segment, offsets = self.segments.write([artifact._data for artifact in artifacts])
+        for artifact, offset in zip(artifacts, offsets):
+            artifact.segment, artifact.offset, artifact._data = segment, offset, None
+
+    def _remove_replaced_files(
+        self,
+        artifacts: typing.Iterable[Artifact],
+        records: typing.Dict[str, typing.Dict[str, typing.Any]],
+    ) -> None:
+        """Removes the files of the artifacts that `records` described before they were
+        replaced by inline or packed artifacts.
+
+        Inline and packed artifacts need no file of their own, so the new record is committed
+        first and the previous artifact removed afterwards.
+        """
+        paths = [
+            self._construct_item_path(artifact.key)
+            for artifact in artifacts
+            if artifact.key in records and _in_file(records[artifact.key])
+        ]
+        for path in paths:
+            try:
+                self.mapper.fs.rm(path, recursive=True)
+            except FileNotFoundError:
+                pass
+
+    def _replaced_blobs(self, keys: typing.Iterable[str]) -> typing.Set[str]:
+        """Returns the blobs referenced by the existing records of the keys."""
+        if not self.content_addressed:
+            return set()
+        records = self.metadata.get_many(keys)
+        return {record['blob'] for record in records.values() if record.get('blob')}
+
+    def _referenced_blobs(self, blobs: typing.Iterable[str]) -> typing.Set[str]:
+        """Returns the blobs some metadata record refers to, looked up in the `blob` index."""
+        keys = self.metadata.search({'blob': sorted(blobs)})
+        return {record.get('blob') for record in self.metadata.get_many(keys).values()}
+
+    def _collect_blobs(self, blobs: typing.Iterable[str]) -> None:
+        """Deletes the blobs that no key refers to anymore.
+
+        A writer may reuse a blob while it is collected. The blob is moved to a staging
+        prefix first and moved back if a record refers to it meanwhile; a writer whose record
+        is written later finds the blob missing and uploads it again (see
+        :py:meth:`_restore_blobs`).
+        """
+        blobs = set(blobs)
+        if not blobs:
+            return
+        fs = self.mapper.fs
+        moved = {}
+        for blob in blobs - self._referenced_blobs(blobs):
+            staging_path = f'{self._staging_store_path}/{time.time_ns():020d}-{uuid.uuid4().hex}'
+            fs.makedirs(staging_path, exist_ok=True)
+            try:
+                fs.mv(f'{self._blob_store_path}/{blob}', f'{staging_path}/{blob}', recursive=True)
+            except FileNotFoundError:
+                pass
+            moved[blob] = staging_path
+        referenced = self._referenced_blobs(moved) if moved else set()
+        for blob, staging_path in moved.items():
+            blob_path = f'{self._blob_store_path}/{blob}'
+            if (
+                blob in referenced
+                and fs.exists(f'{staging_path}/{blob}')
+                and not fs.exists(blob_path)
+            ):
+                fs.mv(f'{staging_path}/{blob}', blob_path, recursive=True)
+            fs.rm(staging_path, recursive=True)
+
+    def _restore_blobs(self, artifacts: typing.Iterable[Artifact]) -> None:
+        """Uploads again the reused blobs collected before the records of the artifacts were
+        written."""
+        for artifact in artifacts:
+            if artifact._reused_blob and not self.mapper.fs.exists(self._item_path(artifact)):
+                self._stage(artifact)
+
+    def _put_overwrite(self, artifact: Artifact, write: typing.Callable = None) -> None:
+        """Replaces the artifact if the key is already in the cache store."""
+        with self._key_lock(artifact.key):
+            self._write(artifact, write, self._get_record(artifact.key))
+
+    def _write(
+        self,
+        artifact: Artifact,
+        write: typing.Callable = None,
+        record: typing.Dict[str, typing.Any] = None,
+    ) -> None:
+        """Writes the artifact, replacing `record`, the current metadata record of the key."""
+        try:
+            self._dump(artifact, write, replaces=record is not None)
+            self.metadata.put(artifact.key, json.loads(artifact.json()))
+        finally:
+            self._invalidate(artifact.key)
+        if record is not None and not _in_file(artifact):
+            self._remove_replaced_files([artifact], {artifact.key: record})
+        self._restore_blobs([artifact])
+        if record is not None and record.get('blob') not in (None, artifact.blob):
+            self._collect_blobs([record['blob']])
+        self._ensure_capacity(artifact.nbytes_on_disk or 0, 1, keep=[artifact.key])
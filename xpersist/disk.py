@@ -0,0 +1,146 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import typing
+import uuid
+
+import fsspec
+
+
+class LocalDiskCache:
+    """A bounded local-disk copy of artifacts stored in a remote cache store.
+
+    Each artifact is downloaded once into ``directory`` and reused for as long as its
+    validation token (the artifact's ``created_at``) matches the one recorded alongside
+    the copy. When the total size of the copies exceeds ``max_bytes``, the least recently
+    used copies are evicted.
+
+    Parameters
+    ----------
+    directory : str
+        Local directory holding the copies. It can be shared by several processes on the
+        same node.
+    max_bytes : int
+        Upper bound on the total size of the copies. If None, the directory is unbounded.
+    """
+
+    _manifest = 'xpersist-local-copy.json'
+
+    def __init__(self, directory: str, max_bytes: int = None):
+        self.directory = os.path.abspath(os.path.expanduser(directory))
+        self.max_bytes = max_bytes
+        self._lock = threading.RLock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self._entry_dir(key), os.path.basename(key.rstrip('/')) or 'data')
+
+    @staticmethod
+    def _read_manifest(entry_dir: str) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        try:
+            with open(os.path.join(entry_dir, LocalDiskCache._manifest)) as fobj:
+                return json.load(fobj)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    @staticmethod
+    def _disk_usage(path: str) -> int:
+        if os.path.isfile(path):
+            return os.path.getsize(path)
+        return sum(
+            os.path.getsize(os.path.join(root, name))
+            for root, _, names in os.walk(path)
+            for name in names
+        )
+
+    def fetch(self, fs: fsspec.AbstractFileSystem, remote_path: str, key: str, token: str) -> str:
+        """Returns the path of a local copy of ``remote_path``, downloading it if needed.
+
+        Parameters
+        ----------
+        fs : fsspec.AbstractFileSystem
+            The file-system of the remote cache store.
+        remote_path : str
+            The path of the artifact in the remote cache store.
+        key : str
+            The key of the artifact.
+        token : str
+            Validation token of the remote artifact. A local copy recorded with a different
+            token is considered stale and downloaded again.
+
+        Returns
+        -------
+        path : str
+            Local path of the copy.
+        """
+        entry_dir, entry_path = self._entry_dir(key), self._entry_path(key)
+        manifest = self._read_manifest(entry_dir)
+        if manifest is not None and manifest['token'] == token and os.path.exists(entry_path):
+            os.utime(os.path.join(entry_dir, self._manifest))
+            return entry_path
+
+        staging_dir = f'{entry_dir}.tmp-{uuid.uuid4().hex}'
+        staging_path = os.path.join(staging_dir, os.path.basename(entry_path))
+        os.makedirs(staging_dir)
+        try:
+            fs.get(remote_path, staging_path, recursive=True)
+            manifest = {'key': key, 'token': token, 'nbytes': self._disk_usage(staging_path)}
+            with open(os.path.join(staging_dir, self._manifest), 'w') as fobj:
+                json.dump(manifest, fobj)
+            with self._lock:
+                shutil.rmtree(entry_dir, ignore_errors=True)
+                os.replace(staging_dir, entry_dir)
+        except OSError:
+            shutil.rmtree(staging_dir, ignore_errors=True)
+            # Another process may have populated the entry concurrently
+            manifest = self._read_manifest(entry_dir)
+            if manifest is None or manifest['token'] != token:
+                raise
+        self.evict(keep=key)
+        return entry_path
+
+    def invalidate(self, key: str) -> None:
+        """Removes the local copy of the artifact, if present."""
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+
+    def evict(self, keep: str = None) -> None:
+        """Evicts least recently used copies until the directory fits within ``max_bytes``.
+
+        Parameters
+        ----------
+        keep : str
+            Key of a copy that must not be evicted.
+        """
+        if self.max_bytes is None:
+            return
+        with self._lock:
+            entries = []
+            for name in os.listdir(self.directory):
+                entry_dir = os.path.join(self.directory, name)
+                manifest = self._read_manifest(entry_dir)
+                if manifest is None:
+                    continue
+                accessed = os.path.getmtime(os.path.join(entry_dir, self._manifest))
+                entries.append((accessed, manifest['nbytes'], manifest['key']))
+            total = sum(nbytes for _, nbytes, _ in entries)
+            for _, nbytes, key in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                if key == keep:
+                    continue
+                self.invalidate(key)
+                total -= nbytes
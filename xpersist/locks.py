@@ -0,0 +1,211 @@
+import json
+import os
+import posixpath
+import random
+import threading
+import time
+import typing
+import uuid
+
+import fsspec
+
+from .metadata import _is_local
+from .registry import registry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+
+class Lock:
+    """Base class of the locks coordinating writers of the same key across processes and hosts.
+
+    Locks are registered via the ``@xpersist.registry.locks.register`` decorator and selected
+    with the ``locking`` parameter of :py:class:`xpersist.cache.CacheStore`. They are used as
+    context managers, which raise a TimeoutError if the lock cannot be acquired in time.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        The file-system of the cache store.
+    path : str
+        The path of the lock file.
+    timeout : float
+        Number of seconds to wait for the lock. If None, wait forever.
+    poll_interval : float
+        Number of seconds between attempts to acquire a busy lock.
+    """
+
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        path: str,
+        timeout: float = None,
+        poll_interval: float = 0.1,
+    ):
+        self.fs = fs
+        self.path = path
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+    def _try_acquire(self) -> bool:
+        raise NotImplementedError
+
+    def _release(self) -> None:
+        raise NotImplementedError
+
+    def acquire(self, timeout: float = None) -> bool:
+        """Waits for the lock and returns True once acquired, or False after `timeout` seconds."""
+        timeout = self.timeout if timeout is None else timeout
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self._try_acquire():
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            # Jitter avoids waiters retrying in lockstep
+            time.sleep(self.poll_interval * random.uniform(0.5, 1.5))
+        return True
+
+    def release(self) -> None:
+        """Releases the lock."""
+        self._release()
+
+    def __enter__(self) -> 'Lock':
+        if not self.acquire():
+            raise TimeoutError(f'Timed out after {self.timeout}s waiting for lock {self.path}')
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.release()
+
+
+@registry.locks.register('file')
+class FileLock(Lock):
+    """Advisory ``flock`` lock on a local lock file.
+
+    The operating system releases the lock if its holder dies, so a crashed writer never
+    blocks the others. The holder removes the lock file on release, and a waiter that locked
+    a lock file removed meanwhile tries again. Only available for local cache stores
+    (including network file-systems that support ``flock``).
+    """
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, path: str, **kwargs):
+        if fcntl is None:  # pragma: no cover
+            raise ValueError('The `file` lock requires fcntl, use the `ttl` lock instead')
+        if not _is_local(fs):
+            raise ValueError(
+                'The `file` lock requires a local cache store, use the `ttl` lock instead'
+            )
+        super().__init__(fs, fs._strip_protocol(path), **kwargs)
+        self._fd = None
+
+    def _try_acquire(self) -> bool:
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        try:
+            current = os.stat(self.path)
+        except FileNotFoundError:
+            current = None
+        if current is None or current.st_ino != os.fstat(fd).st_ino:
+            # The previous holder removed the lock file after we opened it
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+    def _release(self) -> None:
+        if self._fd is not None:
+            # Removed while still locked, so that no waiter holds the lock of a stale file
+            os.unlink(self.path)
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+
+
+@registry.locks.register('ttl')
+class TTLLock(Lock):
+    """Lease recorded in a lock file, for object stores that have no file locks.
+
+    Acquiring the lock writes a lock file holding a random owner token and the expiry time
+    of the lease, then reads it back after `settle_time` seconds to check that no concurrent
+    writer replaced it. A lease that expired is free, so a crashed holder blocks the others
+    for at most `ttl` seconds, and the holder renews its lease in a background thread.
+
+    This relies on the read-after-write consistency of the object store and is best-effort:
+    when two writers race within `settle_time`, both may compute the value. Artifacts are
+    still written atomically, so the last writer wins.
+
+    Parameters
+    ----------
+    ttl : float
+        Duration of the lease, in seconds.
+    settle_time : float
+        Number of seconds to wait before reading back the lock file.
+    """
+
+    def __init__(
+        self,
+        fs: fsspec.AbstractFileSystem,
+        path: str,
+        ttl: float = 60.0,
+        settle_time: float = 0.1,
+        poll_interval: float = 0.5,
+        **kwargs,
+    ):
+        super().__init__(fs, path, poll_interval=poll_interval, **kwargs)
+        self.ttl = ttl
+        self.settle_time = settle_time
+        self._owner = uuid.uuid4().hex
+        self._stop = None
+        self._heartbeat = None
+
+    def _read(self) -> typing.Optional[typing.Dict[str, typing.Any]]:
+        try:
+            return json.loads(self.fs.cat_file(self.path))
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            # A truncated lock file was left by a crashed writer
+            return None
+
+    def _write(self) -> None:
+        record = {'owner': self._owner, 'expires_at': time.time() + self.ttl}
+        with self.fs.open(self.path, 'wb', autocommit=True) as fobj:
+            fobj.write(json.dumps(record).encode())
+
+    def _renew(self) -> None:
+        while not self._stop.wait(self.ttl / 3):
+            record = self._read()
+            if record is None or record['owner'] != self._owner:
+                return
+            self._write()
+
+    def _try_acquire(self) -> bool:
+        record = self._read()
+        if record is not None and record['expires_at'] > time.time():
+            return False
+        self.fs.makedirs(posixpath.dirname(self.path), exist_ok=True)
+        self._write()
+        time.sleep(self.settle_time)
+        record = self._read()
+        if record is None or record['owner'] != self._owner:
+            return False
+        self._stop = threading.Event()
+        self._heartbeat = threading.Thread(target=self._renew, daemon=True)
+        self._heartbeat.start()
+        return True
+
+    def _release(self) -> None:
+        if self._heartbeat is None:
+            return
+        self._stop.set()
+        self._heartbeat.join()
+        self._heartbeat = None
+        record = self._read()
+        if record is not None and record['owner'] == self._owner:
+            self.fs.rm(self.path)
@@ -0,0 +1,148 @@
+import collections
+import enum
+import sys
+import threading
+import typing
+
+from . import _lazy
+
+
+class MemoryCachePolicyEnum(str, enum.Enum):
+    lru = 'lru'
+    lfu = 'lfu'
+
+
+@_lazy.singledispatch
+def sizeof(obj) -> int:
+    """Returns an estimate of the memory footprint of an object in bytes.
+
+    Parameters
+    ----------
+    obj: any Python object
+
+    Returns
+    -------
+    nbytes : int
+       Estimated size of the object in bytes
+    """
+    return sys.getsizeof(obj)
+
+
+@sizeof.register(list)
+@sizeof.register(tuple)
+@sizeof.register(set)
+@sizeof.register(frozenset)
+def _(obj):
+    return sys.getsizeof(obj) + sum(sizeof(item) for item in obj)
+
+
+@sizeof.register(dict)
+def _(obj):
+    return sys.getsizeof(obj) + sum(sizeof(key) + sizeof(value) for key, value in obj.items())
+
+
+def _nbytes(obj) -> int:
+    return int(obj.nbytes)
+
+
+@sizeof.register_lazy('numpy')
+def _register_numpy():
+    import numpy as np
+
+    sizeof.register(np.ndarray, _nbytes)
+
+
+@sizeof.register_lazy('xarray')
+def _register_xarray():
+    import xarray as xr
+
+    sizeof.register(xr.Dataset, _nbytes)
+    sizeof.register(xr.DataArray, _nbytes)
+
+
+@sizeof.register_lazy('pandas')
+def _register_pandas():
+    import pandas as pd
+
+    @sizeof.register(pd.DataFrame)
+    @sizeof.register(pd.Series)
+    def _(obj):
+        return int(obj.memory_usage(deep=True).sum())
+
+
+class MemoryCache:
+    """A thread-safe, size-bounded in-memory cache of loaded values.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Upper bound on the estimated size (see :py:func:`sizeof`) of all cached values.
+        Values larger than this bound are never cached.
+    policy : MemoryCachePolicyEnum
+        The eviction policy. Valid options are:
+
+        - 'lru' (default): evict the least recently used value
+        - 'lfu': evict the least frequently used value
+    """
+
+    def __init__(self, max_bytes: int, policy: MemoryCachePolicyEnum = 'lru'):
+        self.max_bytes = max_bytes
+        self.policy = MemoryCachePolicyEnum(policy)
+        self._lock = threading.RLock()
+        self.clear()
+
+    def __getstate__(self):
+        return {'max_bytes': self.max_bytes, 'policy': self.policy}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def clear(self) -> None:
+        """Removes all values from the cache."""
+        with self._lock:
+            self._values = collections.OrderedDict()
+            self._sizes = {}
+            self._hits = collections.Counter()
+            self.nbytes = 0
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._values
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def get(self, key: str) -> typing.Any:
+        """Returns the cached value for the key. Raises a KeyError if the key is not cached."""
+        with self._lock:
+            value = self._values[key]
+            self._values.move_to_end(key)
+            self._hits[key] += 1
+            return value
+
+    def put(self, key: str, value: typing.Any) -> None:
+        """Caches the value for the key, evicting other values if needed."""
+        nbytes = sizeof(value)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            self.invalidate(key)
+            while self._values and self.nbytes + nbytes > self.max_bytes:
+                self.invalidate(self._victim())
+            self._values[key] = value
+            self._sizes[key] = nbytes
+            self._hits[key] = 1
+            self.nbytes += nbytes
+
+    def invalidate(self, key: str) -> None:
+        """Removes the value for the key from the cache, if present."""
+        with self._lock:
+            if key in self._values:
+                del self._values[key]
+                del self._hits[key]
+                self.nbytes -= self._sizes.pop(key)
+
+    def _victim(self) -> str:
+        if self.policy == MemoryCachePolicyEnum.lfu:
+            # Ties are broken in least recently used order
+            return min(self._values, key=self._hits.__getitem__)
+        return next(iter(self._values))
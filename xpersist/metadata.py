@@ -0,0 +1,668 @@
+import json
+import sqlite3
+import threading
+import time
+import typing
+import uuid
+
+import fsspec
+
+from .registry import registry
+
+
+def _is_local(fs: fsspec.AbstractFileSystem) -> bool:
+    protocols = fs.protocol if isinstance(fs.protocol, tuple) else (fs.protocol,)
+    return bool({'file', 'local'} & set(protocols))
+
+
+def _encode(value: typing.Any) -> str:
+    return json.dumps(value, sort_keys=True)
+
+
+def index_fields(record: typing.Dict[str, typing.Any]) -> typing.Dict[str, str]:
+    """Returns the searchable fields of a record, with JSON-encoded values.
+
+    The ``serializer`` of the artifact is indexed as ``serializer``, the content-addressed
+    ``blob`` it points to (if any) as ``blob``, its expiry time (if any) as ``expires_at``
+    and every entry of its ``additional_metadata`` as ``additional_metadata.<name>``.
+    """
+    fields = {'serializer': _encode(record.get('serializer'))}
+    if record.get('blob') is not None:
+        fields['blob'] = _encode(record['blob'])
+    if record.get('expires_at') is not None:
+        fields['expires_at'] = _encode(record['expires_at'])
+    for name, value in (record.get('additional_metadata') or {}).items():
+        fields[f'additional_metadata.{name}'] = _encode(value)
+    return fields
+
+
+def _encode_filters(filters: typing.Dict[str, typing.Any]) -> typing.Dict[str, typing.Set[str]]:
+    encoded = {}
+    for name, value in filters.items():
+        values = value if isinstance(value, (list, tuple, set, frozenset)) else [value]
+        encoded[name] = {_encode(item) for item in values}
+    return encoded
+
+
+def _matches(
+    record: typing.Dict[str, typing.Any],
+    filters: typing.Dict[str, typing.Set[str]],
+    created_after: typing.Optional[str],
+    created_before: typing.Optional[str],
+) -> bool:
+    created_at = record.get('created_at') or ''
+    if created_after is not None and created_at < created_after:
+        return False
+    if created_before is not None and created_at >= created_before:
+        return False
+    if not filters:
+        return True
+    fields = index_fields(record)
+    return all(fields.get(name) in values for name, values in filters.items())
+
+
+class MetadataStore:
+    """Base class for the backends that record artifact metadata.
+
+    A metadata store maps artifact keys to JSON-serializable records (the output of
+    :py:meth:`xpersist.cache.Artifact.json`). Backends are registered via the
+    ``@xpersist.registry.metadata_store.register`` decorator and selected with the
+    ``metadata_store`` parameter of :py:class:`xpersist.cache.CacheStore`.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        The file-system of the cache store.
+    path : str
+        The location reserved for the metadata store inside the cache store.
+    """
+
+    # Whether searches are answered by an index rather than by reading every record
+    indexed = False
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, path: str):
+        self.fs = fs
+        self.path = path
+
+    def __contains__(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def keys(self) -> typing.List[str]:
+        """Returns a list of keys recorded in the metadata store."""
+        raise NotImplementedError
+
+    def get(self, key: str) -> typing.Dict[str, typing.Any]:
+        """Returns the record for the key. Raises a KeyError if the key is missing."""
+        raise NotImplementedError
+
+    def put(self, key: str, record: typing.Dict[str, typing.Any]) -> None:
+        """Records (or replaces) the record for the key."""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        """Removes the record for the key. Raises a KeyError if the key is missing."""
+        raise NotImplementedError
+
+    def get_many(
+        self, keys: typing.Iterable[str]
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Returns the records of the given keys. Missing keys are omitted from the result."""
+        records = {}
+        for key in keys:
+            try:
+                records[key] = self.get(key)
+            except KeyError:
+                continue
+        return records
+
+    def put_many(self, records: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+        """Records (or replaces) the records of several keys."""
+        for key, record in records.items():
+            self.put(key, record)
+
+    def delete_many(self, keys: typing.Iterable[str]) -> None:
+        """Removes the records of several keys, which must all be present."""
+        for key in keys:
+            self.delete(key)
+
+    def compact(self) -> None:
+        """Consolidates the on-disk representation of the metadata store, if applicable."""
+
+    def refresh(self) -> None:
+        """Picks up records written by other processes, for stores that cache records."""
+
+    def records(self) -> typing.Iterator[typing.Tuple[str, typing.Dict[str, typing.Any]]]:
+        """Iterates over ``(key, record)`` pairs."""
+        for key in self.keys():
+            try:
+                yield key, self.get(key)
+            except KeyError:
+                continue
+
+    def expired(self, now: str) -> typing.List[str]:
+        """Returns the keys of the records expiring at or before `now` (an ISO 8601 timestamp)."""
+        return [
+            key
+            for key, record in self.records()
+            if record.get('expires_at') is not None and record['expires_at'] <= now
+        ]
+
+    def search(
+        self,
+        filters: typing.Dict[str, typing.Any] = None,
+        created_after: str = None,
+        created_before: str = None,
+    ) -> typing.List[str]:
+        """Returns the keys of the records matching all filters.
+
+        Parameters
+        ----------
+        filters : dict
+            Mapping of indexed field names (see :py:func:`index_fields`) to a value, or to a
+            list/tuple/set of accepted values.
+        created_after : str
+            ISO 8601 timestamp. Only records created at or after this time are returned.
+        created_before : str
+            ISO 8601 timestamp. Only records created before this time are returned.
+
+        Returns
+        -------
+        keys : list of str
+            The matching keys.
+        """
+        encoded = _encode_filters(filters or {})
+        return [
+            key
+            for key, record in self.records()
+            if _matches(record, encoded, created_after, created_before)
+        ]
+
+
+@registry.metadata_store.register('sidecar')
+class SidecarMetadataStore(MetadataStore):
+    """Stores one ``<key>.artifact.json`` sidecar file per artifact.
+
+    This is the original layout of xpersist cache stores. Every lookup is a round-trip
+    to the file-system, listing keys lists the whole metadata directory and searching
+    reads every sidecar file.
+    """
+
+    suffix = '.artifact.json'
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, path: str):
+        super().__init__(fs, path)
+        self.fs.makedirs(self.path, exist_ok=True)
+
+    def _record_path(self, key: str) -> str:
+        return f'{self.path}/{key}{self.suffix}'
+
+    def __contains__(self, key: str) -> bool:
+        return self.fs.isfile(self._record_path(key))
+
+    def _key_from_path(self, path: str) -> str:
+        prefix = f'{self.fs._strip_protocol(self.path)}/'
+        return path[len(prefix) : -len(self.suffix)]
+
+    def _record_paths(self) -> typing.List[str]:
+        return [path for path in self.fs.find(self.path) if path.endswith(self.suffix)]
+
+    def keys(self) -> typing.List[str]:
+        return [self._key_from_path(path) for path in self._record_paths()]
+
+    def records(self) -> typing.Iterator[typing.Tuple[str, typing.Dict[str, typing.Any]]]:
+        paths = self._record_paths()
+        if not paths:
+            return
+        contents = self.fs.cat(paths, on_error='omit')
+        for path, content in contents.items():
+            yield self._key_from_path(path), json.loads(content)
+
+    def get(self, key: str) -> typing.Dict[str, typing.Any]:
+        try:
+            return json.loads(self.fs.cat_file(self._record_path(key)))
+        except FileNotFoundError as exc:
+            raise KeyError(key) from exc
+
+    def get_many(
+        self, keys: typing.Iterable[str]
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        paths = {self.fs._strip_protocol(self._record_path(key)): key for key in keys}
+        if not paths:
+            return {}
+        try:
+            contents = self.fs.cat(list(paths), on_error='omit')
+        except FileNotFoundError:
+            return {}
+        return {paths[path]: json.loads(content) for path, content in contents.items()}
+
+    def put(self, key: str, record: typing.Dict[str, typing.Any]) -> None:
+        with self.fs.open(self._record_path(key), 'w') as fobj:
+            fobj.write(json.dumps(record, indent=2))
+
+    def put_many(self, records: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+        if records:
+            self.fs.pipe(
+                {
+                    self._record_path(key): json.dumps(record, indent=2).encode()
+                    for key, record in records.items()
+                }
+            )
+
+    def delete(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self.fs.rm(self._record_path(key))
+
+    def delete_many(self, keys: typing.Iterable[str]) -> None:
+        paths = [self._record_path(key) for key in keys]
+        if paths:
+            self.fs.rm(paths)
+
+
+@registry.metadata_store.register('sqlite')
+class SQLiteMetadataStore(MetadataStore):
+    """Stores all records in a single SQLite database.
+
+    Lookups are primary-key queries against the database. SQLite requires a local
+    file-system, so this backend is meant for cache stores on local or network-attached disks.
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        The file-system of the cache store.
+    path : str
+        The location reserved for the metadata store inside the cache store.
+    database : str
+        Path to the SQLite database file. Defaults to ``<path>/metadata.sqlite``.
+    """
+
+    indexed = True
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, path: str, database: str = None):
+        super().__init__(fs, path)
+        if database is None:
+            if not _is_local(fs):
+                raise ValueError(
+                    'The sqlite metadata store requires a local cache store. '
+                    'Pass `database` explicitly or use the `log` metadata store instead.'
+                )
+            database = f'{fs._strip_protocol(path)}/metadata.sqlite'
+            fs.makedirs(fs._strip_protocol(path), exist_ok=True)
+        self.database = database
+        self._batch_size = 500
+        self._lock = threading.RLock()
+        self._connection = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        state['_connection'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        if self._connection is None:
+            connection = sqlite3.connect(
+                self.database, check_same_thread=False, isolation_level=None, timeout=30
+            )
+            connection.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS artifacts (
+                    key TEXT PRIMARY KEY, created_at TEXT, record TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS artifacts_created_at ON artifacts (created_at);
+                CREATE TABLE IF NOT EXISTS fields (
+                    key TEXT NOT NULL, name TEXT NOT NULL, value TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS fields_name_value ON fields (name, value);
+                CREATE INDEX IF NOT EXISTS fields_key ON fields (key);
+                """
+            )
+            self._connection = connection
+        return self._connection
+
+    def _execute(self, sql: str, parameters: typing.Sequence = ()) -> typing.List[tuple]:
+        with self._lock:
+            return self.connection.execute(sql, parameters).fetchall()
+
+    def __contains__(self, key: str) -> bool:
+        return bool(self._execute('SELECT 1 FROM artifacts WHERE key = ?', (key,)))
+
+    def keys(self) -> typing.List[str]:
+        return [row[0] for row in self._execute('SELECT key FROM artifacts')]
+
+    def get(self, key: str) -> typing.Dict[str, typing.Any]:
+        rows = self._execute('SELECT record FROM artifacts WHERE key = ?', (key,))
+        if not rows:
+            raise KeyError(key)
+        return json.loads(rows[0][0])
+
+    def records(self) -> typing.Iterator[typing.Tuple[str, typing.Dict[str, typing.Any]]]:
+        for key, record in self._execute('SELECT key, record FROM artifacts'):
+            yield key, json.loads(record)
+
+    def get_many(
+        self, keys: typing.Iterable[str]
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        keys, records = list(keys), {}
+        for start in range(0, len(keys), self._batch_size):
+            batch = keys[start : start + self._batch_size]
+            placeholders = ', '.join('?' * len(batch))
+            rows = self._execute(
+                f'SELECT key, record FROM artifacts WHERE key IN ({placeholders})', batch
+            )
+            records.update((key, json.loads(record)) for key, record in rows)
+        return records
+
+    def put(self, key: str, record: typing.Dict[str, typing.Any]) -> None:
+        self.put_many({key: record})
+
+    def put_many(self, records: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+        with self._lock:
+            connection = self.connection
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany(
+                    'INSERT OR REPLACE INTO artifacts (key, created_at, record) VALUES (?, ?, ?)',
+                    [
+                        (key, record.get('created_at'), json.dumps(record))
+                        for key, record in records.items()
+                    ],
+                )
+                connection.executemany(
+                    'DELETE FROM fields WHERE key = ?', [(key,) for key in records]
+                )
+                connection.executemany(
+                    'INSERT INTO fields (key, name, value) VALUES (?, ?, ?)',
+                    [
+                        (key, name, value)
+                        for key, record in records.items()
+                        for name, value in index_fields(record).items()
+                    ],
+                )
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            if key not in self:
+                raise KeyError(key)
+            self.delete_many([key])
+
+    def delete_many(self, keys: typing.Iterable[str]) -> None:
+        parameters = [(key,) for key in keys]
+        with self._lock:
+            connection = self.connection
+            with connection:
+                connection.execute('BEGIN')
+                connection.executemany('DELETE FROM artifacts WHERE key = ?', parameters)
+                connection.executemany('DELETE FROM fields WHERE key = ?', parameters)
+
+    def search(
+        self,
+        filters: typing.Dict[str, typing.Any] = None,
+        created_after: str = None,
+        created_before: str = None,
+    ) -> typing.List[str]:
+        clauses, parameters = [], []
+        if created_after is not None:
+            clauses.append('created_at >= ?')
+            parameters.append(created_after)
+        if created_before is not None:
+            clauses.append('created_at < ?')
+            parameters.append(created_before)
+        for name, values in _encode_filters(filters or {}).items():
+            placeholders = ', '.join('?' * len(values))
+            clauses.append(
+                f'key IN (SELECT key FROM fields WHERE name = ? AND value IN ({placeholders}))'
+            )
+            parameters.extend([name, *sorted(values)])
+        where = f' WHERE {" AND ".join(clauses)}' if clauses else ''
+        return [row[0] for row in self._execute(f'SELECT key FROM artifacts{where}', parameters)]
+
+    def expired(self, now: str) -> typing.List[str]:
+        rows = self._execute(
+            "SELECT key FROM fields WHERE name = 'expires_at' AND value <= ?", (_encode(now),)
+        )
+        return [row[0] for row in rows]
+
+    def compact(self) -> None:
+        self._execute('VACUUM')
+
+
+@registry.metadata_store.register('log')
+class LogMetadataStore(MetadataStore):
+    """Stores records as an append-only log plus a compacted snapshot.
+
+    Every write (or batch of writes) adds one small, immutable log entry under
+    ``<path>/log/`` and never rewrites existing objects, which makes this backend
+    suitable for object stores (S3, GCS, ...). The log is replayed on top of ``<path>/snapshot.json`` into an
+    in-memory index, so lookups of known keys are dictionary lookups and searches use
+    an in-memory secondary index of the indexed fields. Misses, :py:meth:`keys` and
+    :py:meth:`search` pick up entries written by other processes with a single listing
+    of the log, and so do lookups once the index is older than `max_staleness`.
+    :py:meth:`compact` folds the log into a new snapshot.
+
+    Entries are named after the time they were written, and the entry recording the
+    latest write of a key wins, whatever the order in which entries are discovered.
+
+    Parameters
+    ----------
+    max_staleness : float
+        Number of seconds after which lookups of known keys list the log again, bounding
+        how long deletes and overwrites by other processes go unnoticed.
+    """
+
+    indexed = True
+
+    def __init__(self, fs: fsspec.AbstractFileSystem, path: str, max_staleness: float = 1.0):
+        super().__init__(fs, path)
+        self.max_staleness = max_staleness
+        self._log_path = f'{self.path}/log'
+        self._snapshot_path = f'{self.path}/snapshot.json'
+        self.fs.makedirs(self._log_path, exist_ok=True)
+        self._lock = threading.RLock()
+        self._reset()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        state.update(_records=None, _fields=None, _versions=None, _applied=None, _folded=None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def _reset(self) -> None:
+        self._records = None
+        self._fields = None
+        # Name of the latest entry applied to each key, including deleted keys
+        self._versions = None
+        self._applied = None
+        self._folded = None
+        self._refreshed_at = None
+
+    def _list_entries(self) -> typing.List[str]:
+        try:
+            paths = self.fs.ls(self._log_path, detail=False)
+        except FileNotFoundError:
+            return []
+        return sorted(path for path in paths if path.endswith('.json'))
+
+    def _load(self) -> None:
+        try:
+            snapshot = json.loads(self.fs.cat_file(self._snapshot_path))
+        except FileNotFoundError:
+            snapshot = {'records': {}, 'applied': []}
+        self._records = snapshot['records']
+        self._versions = snapshot.get('versions', {})
+        self._fields = {}
+        for key, record in self._records.items():
+            self._update_fields(key, record, add=True)
+        self._folded = set(snapshot['applied'])
+        self._applied = set(self._folded)
+        self._replay()
+
+    def _replay(self) -> None:
+        self._refreshed_at = time.monotonic()
+        pending = [
+            path for path in self._list_entries() if path.rsplit('/', 1)[-1] not in self._applied
+        ]
+        if not pending:
+            return
+        contents = self.fs.cat(pending, on_error='omit')
+        for path in pending:
+            if path not in contents:
+                continue
+            name = path.rsplit('/', 1)[-1]
+            self._apply(json.loads(contents[path]), name)
+            self._applied.add(name)
+
+    def _update_fields(self, key: str, record: typing.Dict[str, typing.Any], add: bool) -> None:
+        for name, value in index_fields(record).items():
+            keys = self._fields.setdefault(name, {}).setdefault(value, set())
+            if add:
+                keys.add(key)
+            else:
+                keys.discard(key)
+
+    def _apply(self, entry: typing.Dict[str, typing.Any], name: str) -> None:
+        if entry['op'] == 'batch':
+            for item in entry['entries']:
+                self._apply(item, name)
+            return
+        key = entry['key']
+        # Entries discovered late must not override later writes
+        if self._versions.get(key, '') > name:
+            return
+        self._versions[key] = name
+        previous = self._records.pop(key, None)
+        if previous is not None:
+            self._update_fields(key, previous, add=False)
+        if entry['op'] == 'put':
+            self._records[key] = entry['record']
+            self._update_fields(key, entry['record'], add=True)
+
+    def _index(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        with self._lock:
+            if self._records is None:
+                self._load()
+            return self._records
+
+    def refresh(self) -> None:
+        """Picks up log entries written by other processes."""
+        with self._lock:
+            if self._records is None:
+                self._load()
+            else:
+                self._replay()
+
+    def _fresh_index(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Returns the index, refreshed if it is older than `max_staleness`."""
+        with self._lock:
+            if self._records is None or time.monotonic() - self._refreshed_at > self.max_staleness:
+                self.refresh()
+            return self._records
+
+    def _append(self, entry: typing.Dict[str, typing.Any]) -> None:
+        name = f'{time.time_ns():020d}-{uuid.uuid4().hex}.json'
+        self.fs.pipe_file(f'{self._log_path}/{name}', json.dumps(entry).encode())
+        with self._lock:
+            self._index()
+            self._apply(entry, name)
+            self._applied.add(name)
+
+    def __contains__(self, key: str) -> bool:
+        if key in self._fresh_index():
+            return True
+        self.refresh()
+        return key in self._index()
+
+    def keys(self) -> typing.List[str]:
+        self.refresh()
+        return list(self._index())
+
+    def get(self, key: str) -> typing.Dict[str, typing.Any]:
+        if key not in self:
+            raise KeyError(key)
+        return self._index()[key]
+
+    def get_many(
+        self, keys: typing.Iterable[str]
+    ) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        keys = list(keys)
+        if any(key not in self._fresh_index() for key in keys):
+            self.refresh()
+        records = self._index()
+        return {key: records[key] for key in keys if key in records}
+
+    def put(self, key: str, record: typing.Dict[str, typing.Any]) -> None:
+        self._append({'op': 'put', 'key': key, 'record': record})
+
+    def put_many(self, records: typing.Dict[str, typing.Dict[str, typing.Any]]) -> None:
+        if records:
+            entries = [
+                {'op': 'put', 'key': key, 'record': record} for key, record in records.items()
+            ]
+            self._append({'op': 'batch', 'entries': entries})
+
+    def delete(self, key: str) -> None:
+        if key not in self:
+            raise KeyError(key)
+        self._append({'op': 'delete', 'key': key})
+
+    def delete_many(self, keys: typing.Iterable[str]) -> None:
+        entries = [{'op': 'delete', 'key': key} for key in keys]
+        if entries:
+            self._append({'op': 'batch', 'entries': entries})
+
+    def records(self) -> typing.Iterator[typing.Tuple[str, typing.Dict[str, typing.Any]]]:
+        self.refresh()
+        yield from list(self._index().items())
+
+    def search(
+        self,
+        filters: typing.Dict[str, typing.Any] = None,
+        created_after: str = None,
+        created_before: str = None,
+    ) -> typing.List[str]:
+        self.refresh()
+        with self._lock:
+            records = self._index()
+            candidates = None
+            for name, values in _encode_filters(filters or {}).items():
+                index = self._fields.get(name, {})
+                matches = set().union(*(index.get(value, set()) for value in values))
+                candidates = matches if candidates is None else candidates & matches
+            keys = records.keys() if candidates is None else candidates
+            return [
+                key for key in keys if _matches(records[key], {}, created_after, created_before)
+            ]
+
+    def expired(self, now: str) -> typing.List[str]:
+        self.refresh()
+        with self._lock:
+            self._index()
+            expiries = self._fields.get('expires_at', {})
+            limit = _encode(now)
+            return [key for value, keys in expiries.items() if value <= limit for key in keys]
+
+    def compact(self) -> None:
+        """Writes the current state to a new snapshot and removes folded log entries.
+
+        Entries are removed one compaction after they were folded into a snapshot, so
+        that readers which loaded the previous snapshot can still replay them.
+        """
+        with self._lock:
+            self.refresh()
+            existing = {path.rsplit('/', 1)[-1]: path for path in self._list_entries()}
+            folded = sorted(name for name in existing if name in self._applied)
+            snapshot = {'records': self._records, 'versions': self._versions, 'applied': folded}
+            self.fs.pipe_file(self._snapshot_path, json.dumps(snapshot).encode())
+            stale = [existing[name] for name in sorted(self._folded) if name in existing]
+            if stale:
+                self.fs.rm(stale)
+            self._folded = set(folded)
@@ -1,3 +1,5 @@
 # flake8: noqa
+from .. import _lazy
 
-from .result import XpersistResult  # pragma: no cover
+# Importing prefect (and enabling its checkpointing) is deferred until the result is used
+__getattr__ = _lazy.module_getattr(__name__, {'XpersistResult': 'xpersist.prefect.result'})
@@ -28,6 +28,7 @@ class registry:
 
     serializers: Decorator = catalogue.create('xpersist', 'serializers', entry_points=True)
     metadata_store: Decorator = catalogue.create('xpersist', 'metadata_store', entry_points=True)
+    locks: Decorator = catalogue.create('xpersist', 'locks', entry_points=True)
 
     @classmethod
     def create(cls, registry_name: str, entry_points: bool = False) -> None:
@@ -0,0 +1,110 @@
+import os
+import posixpath
+import threading
+import time
+import typing
+import uuid
+
+import fsspec
+
+from .metadata import _is_local
+
+SEGMENT_MAX_BYTES = 128 * 2**20
+"""Size from which a segment file is no longer appended to."""
+SEGMENT_MIN_BYTES = 2**20
+"""Size under which segment files are merged together when compacting them."""
+
+
+class SegmentStore:
+    """Packs the serialized data of small artifacts into large segment files.
+
+    Object stores handle millions of tiny objects badly, so the data of small artifacts is
+    written as entries of a few large segment files. Each entry is addressed by the name of
+    its segment, its offset and its length, which the cache store records in the metadata of
+    the artifact, and is read back with a ranged read.
+
+    On local file-systems, entries are appended to the segment this instance is filling,
+    until it reaches `max_bytes`. Each instance fills its own segment, so concurrent writers
+    never interleave their entries. Objects cannot be appended to in object stores, so each
+    batch of entries is written as a new segment there, and small segments are merged when
+    they are compacted.
+
+    Entries of deleted or overwritten artifacts are not reclaimed until their segment is
+    compacted (see :py:meth:`xpersist.cache.CacheStore.compact_segments`).
+
+    Parameters
+    ----------
+    fs : fsspec.AbstractFileSystem
+        The file-system of the cache store.
+    path : str
+        The directory of the segment files.
+    max_bytes : int
+        Size from which a segment file is no longer appended to.
+    """
+
+    def __init__(
+        self, fs: fsspec.AbstractFileSystem, path: str, max_bytes: int = SEGMENT_MAX_BYTES
+    ):
+        self.fs = fs
+        self.path = path
+        self.max_bytes = max_bytes
+        self.active = None
+        self._active_bytes = 0
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_lock')
+        # A copy in another process must not append to the segment this instance fills
+        state['active'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def segment_path(self, segment: str) -> str:
+        return f'{self.path}/{segment}'
+
+    def _new_segment(self) -> str:
+        self.fs.makedirs(self.path, exist_ok=True)
+        return f'{time.time_ns():020d}-{uuid.uuid4().hex}.segment'
+
+    def write(
+        self, entries: typing.List[bytes], append: bool = True
+    ) -> typing.Tuple[str, typing.List[int]]:
+        """Writes the entries to a segment and returns its name and the offset of each entry.
+
+        If `append` is False or the file-system does not support appends, the entries are
+        written to a new segment.
+        """
+        offsets, position = [], 0
+        for data in entries:
+            offsets.append(position)
+            position += len(data)
+        payload = b''.join(entries)
+        if not (append and _is_local(self.fs)):
+            segment = self._new_segment()
+            self.fs.pipe_file(self.segment_path(segment), payload)
+            return segment, offsets
+        with self._lock:
+            if self.active is None or self._active_bytes >= self.max_bytes:
+                self.active, self._active_bytes = self._new_segment(), 0
+            with self.fs.open(self.segment_path(self.active), 'ab') as fobj:
+                # Bytes left behind by an interrupted append are skipped
+                start = fobj.seek(0, os.SEEK_END)
+                fobj.write(payload)
+            self._active_bytes = start + len(payload)
+            return self.active, [start + offset for offset in offsets]
+
+    def read(self, segment: str, offset: int, nbytes: int) -> bytes:
+        """Returns the entry of `nbytes` bytes at `offset` in the segment."""
+        return self.fs.cat_file(self.segment_path(segment), start=offset, end=offset + nbytes)
+
+    def segments(self) -> typing.Dict[str, typing.Dict[str, typing.Any]]:
+        """Returns the file-system info of each segment, by name."""
+        try:
+            infos = self.fs.ls(self.path, detail=True)
+        except FileNotFoundError:
+            return {}
+        return {posixpath.basename(info['name']): info for info in infos}
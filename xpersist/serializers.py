@@ -1,60 +1,377 @@
+"""Serializers and the policy choosing them.
+
+The serializers' libraries (xarray, pandas, joblib, ...) and helpers (in
+:py:mod:`xpersist.backends`) are imported when a serializer is resolved from the registry,
+not when this module is imported.
+"""
+import enum
 import functools
 import typing
 
-import joblib as _joblib
-import pandas as pd
 import pydantic
-import xarray as xr
-import xcollection as xc
 
+from . import _lazy
 from .registry import registry
 
+__getattr__ = _lazy.module_getattr(
+    __name__,
+    {
+        'dump_numpy_mmap': 'xpersist.backends.mmap',
+        'load_numpy_mmap': 'xpersist.backends.mmap',
+        'dump_xarray_mmap': 'xpersist.backends.mmap',
+        'load_xarray_mmap': 'xpersist.backends.mmap',
+        'dump_joblib_frames': 'xpersist.backends.joblib',
+        'load_joblib_frames': 'xpersist.backends.joblib',
+    },
+)
+
+
+class CompressionCodecEnum(str, enum.Enum):
+    zstd = 'zstd'
+    lz4 = 'lz4'
+    blosc = 'blosc'
+    gzip = 'gzip'
+    none = 'none'
+
+
+class Compression(pydantic.BaseModel):
+    """Pydantic model for the compression of an artifact.
+
+    Can also be given as a string, ``'<codec>'`` or ``'<codec>:<level>'`` (e.g. ``'zstd:5'``).
+
+    Parameters
+    ----------
+    codec : CompressionCodecEnum
+        The compression codec. Valid options are 'zstd', 'lz4', 'blosc', 'gzip' and
+        'none', which disables compression.
+    level : int
+        The compression level. If None, the default level of the serializer's
+        compression mechanism is used.
+    """
+
+    codec: CompressionCodecEnum
+    level: typing.Optional[int] = None
+
+    @classmethod
+    def validate(cls, value):
+        if isinstance(value, str):
+            codec, _, level = value.partition(':')
+            value = {'codec': codec, 'level': level or None}
+        return super().validate(value)
+
+
+class Selection(pydantic.BaseModel):
+    """Pydantic model for the subset of an artifact to read.
+
+    Parameters
+    ----------
+    variables : list of str
+        Variables to select from a Dataset.
+    sel : dict
+        Labels or slices to select along the dimensions of a Dataset, as in
+        :py:meth:`xarray.Dataset.sel`.
+    columns : list of str
+        Columns to read from a DataFrame.
+    filters : list
+        Row filters of a DataFrame in the disjunctive normal form of
+        :py:func:`pyarrow.parquet.read_table`, e.g. ``[('year', '>=', 2000)]``.
+    """
+
+    variables: typing.Optional[typing.List[str]] = None
+    sel: typing.Optional[typing.Dict[str, typing.Any]] = None
+    columns: typing.Optional[typing.List[str]] = None
+    filters: typing.Optional[typing.List[typing.Any]] = None
+
 
 class Serializer(pydantic.BaseModel):
-    """Pydantic model for defining a serializer."""
+    """Pydantic model for defining a serializer.
+
+    `compression_dump_kwargs` and `compression_load_kwargs` map a
+    :py:class:`Compression` to the keyword arguments implementing it with the serializer's
+    native compression mechanism. `compression_dump_kwargs` receives the compression and
+    the value being dumped, `compression_load_kwargs` only the compression. They raise a
+    ValueError for codecs the serializer does not support. Serializers without
+    `compression_dump_kwargs` do not support compression.
+
+    `lazy` serializers write dask-backed values with ``dump(..., compute=False)``, which
+    returns a ``dask.delayed`` object, and reopen them with ``load(..., chunks=...)``.
+
+    `load_subset` reads a :py:class:`Selection` of an artifact, pushing the selection down
+    to the storage format, and is called as ``load_subset(path, selection, **load_kwargs)``.
+    `selections` names the :py:class:`Selection` fields it supports. Serializers without
+    `load_subset` do not support partial reads.
+
+    `append` adds a value to an existing artifact without rewriting it, and is called as
+    ``append(value, path, dim, compression, **dump_kwargs)``, where `dim` is the dimension
+    to append along (for xarray objects) and `compression` the artifact's
+    :py:class:`Compression`. Serializers without `append` do not support appends.
+
+    `dump_iter` and `load_iter` write and read an artifact one part at a time, so that
+    memory use stays bounded by the size of a part. They are called as
+    ``dump_iter(iterable, path, dim, batch_size, compression, **dump_kwargs)`` and
+    ``load_iter(path, dim, batch_size, **load_kwargs)``, the latter returning an iterator.
+
+    `dumps` and `loads` convert a value to bytes and back, and are called as
+    ``dumps(value, **dump_kwargs)`` and ``loads(data, **load_kwargs)``. Small artifacts of
+    serializers with `dumps` can be packed into segment files (see the `packed_max_bytes`
+    parameter of :py:class:`xpersist.cache.CacheStore`). The artifacts of `inline`
+    serializers are stored in their metadata record rather than in a separate file, so
+    they are meant for small values.
+    """
 
     name: str
     load: typing.Callable
     dump: typing.Callable
+    compression_dump_kwargs: typing.Optional[typing.Callable] = None
+    compression_load_kwargs: typing.Optional[typing.Callable] = None
+    lazy: bool = False
+    load_subset: typing.Optional[typing.Callable] = None
+    selections: typing.Set[str] = set()
+    append: typing.Optional[typing.Callable] = None
+    dump_iter: typing.Optional[typing.Callable] = None
+    load_iter: typing.Optional[typing.Callable] = None
+    dumps: typing.Optional[typing.Callable] = None
+    loads: typing.Optional[typing.Callable] = None
+    inline: bool = False
+
+    def check_selection(self, selection: Selection) -> None:
+        """Raises a ValueError if the serializer cannot read the selection."""
+        if self.load_subset is None:
+            raise ValueError(f'The {self.name} serializer does not support partial reads')
+        unsupported = sorted(
+            name for name, value in selection if value is not None and name not in self.selections
+        )
+        if unsupported:
+            raise ValueError(f'The {self.name} serializer does not support selecting {unsupported}')
+
+
+def _unsupported_codec(serializer: str, compression: Compression, supported: typing.Iterable[str]):
+    return ValueError(
+        f'The {serializer} serializer does not support {compression.codec.value} compression. '
+        f'Supported codecs are: {sorted(supported)}'
+    )
 
 
 @registry.serializers.register('xarray.zarr')
 def xarray_zarr() -> Serializer:
-    return Serializer(name='xarray.zarr', load=xr.open_zarr, dump=xr.backends.api.to_zarr)
+    import xarray as xr
+
+    from .backends import xarray as backend
+
+    return Serializer(
+        name='xarray.zarr',
+        load=xr.open_zarr,
+        dump=xr.backends.api.to_zarr,
+        compression_dump_kwargs=backend.zarr_compression,
+        lazy=True,
+        load_subset=functools.partial(backend.load_subset, xr.open_zarr),
+        selections={'variables', 'sel'},
+        append=backend.append_zarr,
+        dump_iter=backend.dump_zarr_iter,
+        load_iter=backend.load_zarr_iter,
+    )
 
 
 @registry.serializers.register('xarray.netcdf')
 def xarray_netcdf() -> Serializer:
-    return Serializer(name='xarray.netcdf', load=xr.open_dataset, dump=xr.backends.api.to_netcdf)
+    import xarray as xr
+
+    from .backends import xarray as backend
+
+    return Serializer(
+        name='xarray.netcdf',
+        load=xr.open_dataset,
+        dump=xr.backends.api.to_netcdf,
+        compression_dump_kwargs=backend.netcdf_compression,
+        lazy=True,
+        load_subset=functools.partial(backend.load_subset, xr.open_dataset),
+        selections={'variables', 'sel'},
+    )
 
 
 @registry.serializers.register('xcollection')
 def xcollection() -> Serializer:
+    import xcollection as xc
+
     return Serializer(name='xcollection', load=xc.open_collection, dump=xc.Collection.to_zarr)
 
 
 @registry.serializers.register('joblib')
 def joblib() -> Serializer:
-    return Serializer(name='joblib', load=_joblib.load, dump=_joblib.dump)
+    import joblib as _joblib
+
+    from .backends import joblib as backend
+
+    return Serializer(
+        name='joblib',
+        load=_joblib.load,
+        dump=_joblib.dump,
+        compression_dump_kwargs=backend.joblib_compression,
+        dumps=backend.dumps,
+        loads=backend.loads,
+    )
+
+
+@registry.serializers.register('joblib.frames')
+def joblib_frames() -> Serializer:
+    from .backends import joblib as backend
+
+    return Serializer(
+        name='joblib.frames',
+        load=backend.load_joblib_frames,
+        dump=backend.dump_joblib_frames,
+        compression_dump_kwargs=backend.joblib_compression,
+        dump_iter=backend.dump_joblib_frames_iter,
+        load_iter=backend.load_joblib_frames_iter,
+    )
+
+
+@registry.serializers.register('msgpack')
+def msgpack() -> Serializer:
+    from .backends import msgpack as backend
+
+    return Serializer(
+        name='msgpack',
+        load=backend.load_msgpack,
+        dump=backend.dump_msgpack,
+        dumps=backend.packb,
+        loads=backend.unpackb,
+        inline=True,
+    )
 
 
 @registry.serializers.register('pandas.csv')
 def pandas_csv() -> Serializer:
-    return Serializer(name='pandas.csv', load=pd.read_csv, dump=pd.DataFrame.to_csv)
+    import pandas as pd
+
+    from .backends import pandas as backend
+
+    return Serializer(
+        name='pandas.csv',
+        load=pd.read_csv,
+        dump=pd.DataFrame.to_csv,
+        compression_dump_kwargs=backend.csv_compression,
+        compression_load_kwargs=backend.csv_compression_load,
+        load_subset=backend.load_csv_subset,
+        selections={'columns'},
+    )
 
 
 @registry.serializers.register('pandas.parquet')
 def pandas_parquet() -> Serializer:
-    return Serializer(name='pandas.parquet', load=pd.read_parquet, dump=pd.DataFrame.to_parquet)
+    import pandas as pd
+
+    from .backends import pandas as backend
+
+    return Serializer(
+        name='pandas.parquet',
+        load=pd.read_parquet,
+        dump=pd.DataFrame.to_parquet,
+        compression_dump_kwargs=backend.parquet_compression,
+        load_subset=backend.load_parquet_subset,
+        selections={'columns', 'filters'},
+        append=backend.append_parquet,
+        dump_iter=backend.dump_parquet_iter,
+        load_iter=backend.load_parquet_iter,
+    )
+
+
+@registry.serializers.register('numpy.mmap')
+def numpy_mmap() -> Serializer:
+    from .backends import mmap as backend
+
+    return Serializer(name='numpy.mmap', load=backend.load_numpy_mmap, dump=backend.dump_numpy_mmap)
+
+
+@registry.serializers.register('xarray.mmap')
+def xarray_mmap() -> Serializer:
+    from .backends import mmap as backend, xarray as xarray_backend
+
+    return Serializer(
+        name='xarray.mmap',
+        load=backend.load_xarray_mmap,
+        dump=backend.dump_xarray_mmap,
+        load_subset=functools.partial(xarray_backend.load_subset, backend.load_xarray_mmap),
+        selections={'variables', 'sel'},
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_serializer(name: str) -> Serializer:
+    """Returns the serializer registered under `name`.
+
+    Serializers are looked up in the registry (including its entry points) and built once
+    per name, as both are much slower than serializing a small value. Call
+    ``get_serializer.cache_clear()`` after registering another serializer under a name
+    that was already resolved.
+
+    Parameters
+    ----------
+    name : str
+        The name of the serializer, e.g. 'joblib' or 'xarray.zarr'.
+
+    Returns
+    -------
+    serializer : Serializer
+    """
+    return registry.serializers.get(name)()
+
+
+class SerializerPolicy(pydantic.BaseModel):
+    """Pydantic model for the policy used by :py:func:`pick_serializer` to choose a serializer.
 
+    The defaults are justified by ``benchmarks/serializers.py``: parquet is several times
+    faster and smaller than CSV and preserves dtypes, and zarr artifacts are chunked,
+    compressed and written chunk by chunk, which pays off for large or dask-backed
+    Datasets, while netCDF is faster for small ones.
 
-@functools.singledispatch
-def pick_serializer(obj) -> str:
+    Parameters
+    ----------
+    dataframe : str
+        Serializer for DataFrames. DataFrames that the serializer cannot represent
+        (e.g. parquet with non-string column names or mixed-type object columns, or when
+        no parquet engine is installed) fall back to `dataframe_fallback`.
+    dataframe_fallback : str
+        Serializer for DataFrames that `dataframe` cannot represent.
+    dataset : str
+        Serializer for small, in-memory Datasets and DataArrays.
+    large_dataset : str
+        Serializer for dask-backed Datasets and for Datasets of at least
+        `large_dataset_min_bytes`. DataArrays always use `dataset`.
+    large_dataset_min_bytes : int
+        Size (as reported by ``Dataset.nbytes``) from which in-memory Datasets are
+        written with `large_dataset`.
+    small_object : str
+        Serializer for small values of built-in types (None, bool, int, float, str, bytes,
+        and lists and dicts of them), e.g. 'msgpack', which stores them inline in their
+        metadata record so that getting them takes a single read.
+    small_object_max_bytes : int
+        Size (once packed with msgpack) up to which values of built-in types are written
+        with `small_object`. Defaults to 0, which disables `small_object`. Requires msgpack.
+    """
+
+    dataframe: str = 'pandas.parquet'
+    dataframe_fallback: str = 'joblib'
+    dataset: str = 'xarray.netcdf'
+    large_dataset: str = 'xarray.zarr'
+    large_dataset_min_bytes: int = 256 * 2**20
+    small_object: str = 'msgpack'
+    small_object_max_bytes: int = 0
+
+
+_default_policy = SerializerPolicy()
+
+
+@_lazy.singledispatch
+def pick_serializer(obj, policy: SerializerPolicy = None) -> str:
     """Returns the id of the appropriate serializer
 
     Parameters
     ----------
     obj: any Python object
+    policy: SerializerPolicy
+        The policy used to choose serializers for DataFrames, xarray objects and small
+        values. If None, the default policy is used.
 
     Returns
     -------
@@ -62,24 +379,54 @@ def pick_serializer(obj) -> str:
        Id of the serializer
     """
 
-    return registry.serializers.get('joblib')().name
+    policy = policy or _default_policy
+    if policy.small_object_max_bytes:
+        try:
+            from .backends.msgpack import is_small_object
+        except ImportError:
+            pass
+        else:
+            if is_small_object(obj, policy.small_object_max_bytes):
+                return get_serializer(policy.small_object).name
+    return get_serializer('joblib').name
+
+
+@pick_serializer.register_lazy('xarray')
+def _register_xarray():
+    import xarray as xr
+
+    @pick_serializer.register(xr.Dataset)
+    def _(obj, policy=None):
+        policy = policy or _default_policy
+        chunked = any(variable.chunks is not None for variable in obj.variables.values())
+        if chunked or obj.nbytes >= policy.large_dataset_min_bytes:
+            return get_serializer(policy.large_dataset).name
+        return get_serializer(policy.dataset).name
 
+    @pick_serializer.register(xr.DataArray)
+    def _(obj, policy=None):
+        policy = policy or _default_policy
+        return get_serializer(policy.dataset).name
 
-@pick_serializer.register(xr.Dataset)
-def _(obj):
-    return registry.serializers.get('xarray.netcdf')().name
 
+@pick_serializer.register_lazy('xcollection')
+def _register_xcollection():
+    import xcollection as xc
 
-@pick_serializer.register(xr.DataArray)
-def _(obj):
-    return registry.serializers.get('xarray.netcdf')().name
+    @pick_serializer.register(xc.Collection)
+    def _(obj, policy=None):
+        return get_serializer('xcollection').name
 
 
-@pick_serializer.register(xc.Collection)
-def _(obj):
-    return registry.serializers.get('xcollection')().name
+@pick_serializer.register_lazy('pandas')
+def _register_pandas():
+    import pandas as pd
 
+    from .backends.pandas import supports_parquet
 
-@pick_serializer.register(pd.DataFrame)
-def _(obj):
-    return registry.serializers.get('pandas.csv')().name
+    @pick_serializer.register(pd.DataFrame)
+    def _(obj, policy=None):
+        policy = policy or _default_policy
+        if policy.dataframe == 'pandas.parquet' and not supports_parquet(obj):
+            return get_serializer(policy.dataframe_fallback).name
+        return get_serializer(policy.dataframe).name
@@ -0,0 +1,283 @@
+import functools
+import hashlib
+import inspect
+import pickle
+import typing
+import weakref
+
+from . import _lazy
+
+if typing.TYPE_CHECKING:  # pragma: no cover
+    import numpy as np
+
+#: Arrays larger than this many bytes are fingerprinted from a sample of
+#: :py:data:`SAMPLE_SIZE` evenly spaced elements instead of their full buffer. Sampling
+#: keeps key generation cheap for multi-GB arrays, at the cost of missing changes to
+#: elements outside of the sample. None (the default) always hashes the full buffer.
+SAMPLE_THRESHOLD_BYTES: typing.Optional[int] = None
+
+#: Number of elements hashed for arrays above :py:data:`SAMPLE_THRESHOLD_BYTES`.
+SAMPLE_SIZE: int = 1 << 18
+
+#: Fingerprints of read-only arrays larger than this many bytes are memoized by object
+#: identity for as long as the array is alive (see :py:func:`clear_identity_cache`).
+IDENTITY_CACHE_MIN_BYTES: int = 1 << 20
+
+_CHUNK_BYTES = 1 << 26
+_identity_cache: typing.Dict[int, typing.Tuple[weakref.ref, typing.Any]] = {}
+
+
+def tokenize(*args, **kwargs) -> str:
+    """Returns a deterministic token (a hex digest) for the given arguments.
+
+    Equal arguments produce equal tokens across processes and sessions. Arrays, DataFrames
+    and xarray objects are hashed from their raw buffers rather than pickled, dask-backed
+    xarray variables from the name of their task graph (without computing them), and
+    fingerprints of large read-only arrays are memoized by object identity.
+
+    Parameters
+    ----------
+    *args, **kwargs :
+        Objects to tokenize.
+
+    Returns
+    -------
+    token : str
+        The hex digest of the arguments.
+
+    Examples
+    --------
+    >>> from xpersist.tokenize import tokenize
+    >>> tokenize([1, 2, 3]) == tokenize([1, 2, 3])
+    True
+    """
+    token = (normalize_token(args), normalize_token(kwargs)) if kwargs else normalize_token(args)
+    return hashlib.sha256(repr(token).encode()).hexdigest()
+
+
+def _hash_buffer(buffer: typing.Union[bytes, memoryview]) -> str:
+    return hashlib.sha256(buffer).hexdigest()
+
+
+def _hash_array(arr: 'np.ndarray') -> typing.Any:
+    """Hashes the values of an array, in bounded-size chunks if the array is not contiguous."""
+    import numpy as np
+
+    if arr.dtype.hasobject:
+        return 'pickle', _hash_buffer(pickle.dumps(arr, protocol=4))
+    if SAMPLE_THRESHOLD_BYTES is not None and arr.nbytes > SAMPLE_THRESHOLD_BYTES:
+        indices = np.linspace(0, arr.size - 1, SAMPLE_SIZE, dtype='int64')
+        return 'sampled', SAMPLE_SIZE, _hash_array(arr.flat[indices])
+    if arr.flags.c_contiguous or arr.ndim == 0:
+        return _hash_buffer(np.ascontiguousarray(arr).reshape(-1).view(np.uint8).data)
+    sha = hashlib.sha256()
+    step = max(1, _CHUNK_BYTES // max(1, arr[:1].nbytes))
+    for start in range(0, arr.shape[0], step):
+        chunk = np.ascontiguousarray(arr[start : start + step])
+        sha.update(chunk.reshape(-1).view(np.uint8).data)
+    return sha.hexdigest()
+
+
+def _readonly(arr: 'np.ndarray') -> bool:
+    """Returns True if neither the array nor any array it is a view of can be written to."""
+    import numpy as np
+
+    while isinstance(arr, np.ndarray):
+        if arr.flags.writeable:
+            return False
+        arr = arr.base
+    # Views of other buffers (e.g. memory maps) may change under the array
+    return arr is None or isinstance(arr, bytes)
+
+
+def _memoize_by_identity(
+    nbytes: typing.Callable[[typing.Any], int], immutable: typing.Callable[[typing.Any], bool]
+) -> typing.Callable[[typing.Callable], typing.Callable]:
+    """Memoizes a tokenizer by object identity for immutable objects of at least
+    IDENTITY_CACHE_MIN_BYTES."""
+
+    def decorator(func: typing.Callable) -> typing.Callable:
+        @functools.wraps(func)
+        def wrapper(obj):
+            if nbytes(obj) < IDENTITY_CACHE_MIN_BYTES or not immutable(obj):
+                return func(obj)
+            key = id(obj)
+            entry = _identity_cache.get(key)
+            if entry is not None and entry[0]() is obj:
+                return entry[1]
+            token = func(obj)
+            try:
+                ref = weakref.ref(obj, lambda _: _identity_cache.pop(key, None))
+            except TypeError:
+                return token
+            _identity_cache[key] = (ref, token)
+            return token
+
+        return wrapper
+
+    return decorator
+
+
+def clear_identity_cache() -> None:
+    """Forgets all fingerprints memoized by object identity.
+
+    Fingerprints of large read-only NumPy arrays (whose ``flags.writeable`` is False) are
+    memoized for as long as the array is alive. Writeable arrays are hashed on every call,
+    but values written while an array was temporarily made writeable (with
+    ``arr.setflags(write=True)``) are not detected once it is read-only again. Call this
+    function after such modifications.
+    """
+    _identity_cache.clear()
+
+
+@_lazy.singledispatch
+def normalize_token(obj) -> typing.Any:
+    """Returns a deterministic, repr-able representation of an object used by :py:func:`tokenize`.
+
+    Register support for additional types via ``@normalize_token.register(MyType)``, or via
+    ``@normalize_token.register_lazy('mylib')`` to defer importing a library until it is used.
+    Objects without a registered implementation are pickled.
+
+    Parameters
+    ----------
+    obj: any Python object
+
+    Returns
+    -------
+    token :
+       A representation made of built-in types, whose ``repr`` is deterministic
+    """
+    try:
+        return type(obj).__name__, _hash_buffer(pickle.dumps(obj, protocol=4))
+    except Exception as exc:
+        raise TypeError(f'Unable to tokenize object of type {type(obj)!r}') from exc
+
+
+@normalize_token.register(type(None))
+@normalize_token.register(bool)
+@normalize_token.register(int)
+@normalize_token.register(float)
+@normalize_token.register(complex)
+@normalize_token.register(str)
+@normalize_token.register(bytes)
+def _(obj):
+    return obj
+
+
+@normalize_token.register(list)
+@normalize_token.register(tuple)
+def _(obj):
+    return type(obj).__name__, [normalize_token(item) for item in obj]
+
+
+@normalize_token.register(set)
+@normalize_token.register(frozenset)
+def _(obj):
+    return type(obj).__name__, sorted(repr(normalize_token(item)) for item in obj)
+
+
+@normalize_token.register(dict)
+def _(obj):
+    items = sorted(
+        (repr(normalize_token(key)), normalize_token(value)) for key, value in obj.items()
+    )
+    return 'dict', items
+
+
+def _normalize_dask_array(obj) -> typing.Any:
+    # Dask names are tokens of the task graph that produces the array
+    return 'dask', obj.name, obj.dtype.str, obj.shape
+
+
+@normalize_token.register_lazy('numpy')
+def _register_numpy():
+    import numpy as np
+
+    @normalize_token.register(np.ndarray)
+    @_memoize_by_identity(lambda obj: obj.nbytes, _readonly)
+    def _(obj):
+        return 'ndarray', obj.dtype.str, obj.shape, _hash_array(obj)
+
+    @normalize_token.register(np.generic)
+    def _(obj):
+        return 'numpy', obj.dtype.str, repr(obj.item())
+
+
+@normalize_token.register_lazy('pandas')
+def _register_pandas():
+    import pandas as pd
+
+    @normalize_token.register(pd.DataFrame)
+    @normalize_token.register(pd.Series)
+    @normalize_token.register(pd.Index)
+    def _(obj):
+        hashes = pd.util.hash_pandas_object(obj, index=not isinstance(obj, pd.Index))
+        metadata = (
+            [(str(name), str(dtype)) for name, dtype in obj.dtypes.items()]
+            if isinstance(obj, pd.DataFrame)
+            else (str(obj.name), str(obj.dtype))
+        )
+        return type(obj).__name__, metadata, normalize_token(hashes.to_numpy())
+
+
+@normalize_token.register_lazy('xarray')
+def _register_xarray():
+    import xarray as xr
+
+    @normalize_token.register(xr.Variable)
+    def _(obj):
+        # The values of numpy-backed variables are memoized as arrays, if read-only
+        if obj.chunks is not None:
+            data = _normalize_dask_array(obj.data)
+        else:
+            data = normalize_token(obj.values)
+        return 'Variable', obj.dims, normalize_token(obj.attrs), data
+
+    @normalize_token.register(xr.DataArray)
+    def _(obj):
+        return (
+            'DataArray',
+            obj.name,
+            normalize_token(obj.variable),
+            normalize_token({name: coord.variable for name, coord in obj.coords.items()}),
+        )
+
+    @normalize_token.register(xr.Dataset)
+    def _(obj):
+        return (
+            'Dataset',
+            normalize_token({name: variable for name, variable in obj.variables.items()}),
+            normalize_token(set(obj.coords)),
+            normalize_token(obj.attrs),
+        )
+
+
+@normalize_token.register_lazy('xcollection')
+def _register_xcollection():
+    import xcollection as xc
+
+    @normalize_token.register(xc.Collection)
+    def _(obj):
+        return 'Collection', normalize_token(dict(obj.items()))
+
+
+def tokenize_function(func: typing.Callable) -> str:
+    """Returns a token identifying a function by its qualified name and source code.
+
+    Editing the body of the function changes its token. When the source code is not
+    available (e.g. for built-ins or functions defined interactively), the compiled
+    bytecode and constants are used instead.
+    """
+    func = inspect.unwrap(func)
+    try:
+        source = inspect.getsource(func)
+    except (OSError, TypeError):
+        code = getattr(func, '__code__', None)
+        if code is None:
+            source = repr(func)
+        else:
+            source = (
+                code.co_code,
+                [const for const in code.co_consts if not inspect.iscode(const)],
+            )
+    return tokenize(getattr(func, '__module__', None), getattr(func, '__qualname__', None), source)